@@ -14,7 +14,7 @@ SYSTEM = """You are a Code Reviewer Agent. Your role is to:
 
 Be thorough and provide actionable feedback."""
 
-def review_code(task, code_output, model):
-    """Review and correct code output."""
-    prompt = code_reviewer_prompt(task, code_output)
-    return call_gemini(prompt, SYSTEM, model)
+def review_code(task, code_output, model, cancel=None, diagnostics=""):
+    """Review and correct code output, given any local validation diagnostics."""
+    prompt = code_reviewer_prompt(task, code_output, diagnostics)
+    return call_gemini(prompt, SYSTEM, model, cancel=cancel, agent="code_reviewer")
@@ -3,7 +3,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from gemini_client import stream_gemini
-from prompt_builder import executor_prompt
+from prompt_builder import executor_prompt, continuation_prompt
 
 SYSTEM = """You are an Execution Agent. Your role is to:
 1. Execute tasks precisely and completely
@@ -11,5 +11,9 @@ SYSTEM = """You are an Execution Agent. Your role is to:
 3. Handle errors gracefully
 4. Deliver high-quality results"""
 
-def execute(step, model, previous_results=""):
-    return stream_gemini(executor_prompt(step, previous_results), SYSTEM, model)
+def execute(step, model, previous_results="", cancel=None, partial=None):
+    """Stream the output of a step; with partial (an output cut off at the token cap), stream only the rest."""
+    prompt = executor_prompt(step, previous_results)
+    if partial:
+        prompt = continuation_prompt(prompt, partial)
+    return stream_gemini(prompt, SYSTEM, model, cancel=cancel, agent="executor")
@@ -0,0 +1,32 @@
+import sys
+import os
+import re
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gemini_client import stream_gemini
+from prompt_builder import final_review_prompt
+
+SYSTEM = """You are a Final Review Agent. Your role is to:
+1. Check the output against the original task
+2. Fix errors, bugs and style issues in the code
+3. Return the complete corrected code
+4. Summarize the work and its final status
+
+Always answer in the requested sections."""
+
+SECTIONS = ("verdict", "code", "summary")
+_MARKER = re.compile(r'^===\s*(VERDICT|CODE|SUMMARY)\s*===\s*$', re.MULTILINE | re.IGNORECASE)
+
+def final_review(task, output, model, cancel=None, diagnostics=""):
+    """Review, correct and summarize the output in one streamed call (see parse_final_review)."""
+    prompt = final_review_prompt(task, output, diagnostics)
+    return stream_gemini(prompt, SYSTEM, model, cancel=cancel, agent="final_reviewer")
+
+def parse_final_review(text):
+    """Split a final review into {"verdict", "code", "summary"}; missing sections are empty."""
+    sections = dict.fromkeys(SECTIONS, "")
+    markers = list(_MARKER.finditer(text))
+    for marker, following in zip(markers, markers[1:] + [None]):
+        end = following.start() if following else len(text)
+        sections[marker.group(1).lower()] = text[marker.end():end].strip()
+    return sections
@@ -1,9 +1,11 @@
 import sys
 import os
+import re
+import json
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from gemini_client import stream_gemini
-from prompt_builder import planner_prompt
+from prompt_builder import planner_prompt, structured_planner_prompt
 
 SYSTEM = """You are a Planning Agent. Your role is to:
 1. Analyze tasks and break them into clear steps
@@ -11,5 +13,267 @@ SYSTEM = """You are a Planning Agent. Your role is to:
 3. Consider edge cases and potential issues
 4. Create actionable execution plans"""
 
-def plan(task, model, context=""):
-    return stream_gemini(planner_prompt(task, context), SYSTEM, model)
+# Ask for a JSON plan constrained by PLAN_SCHEMA (0 = free-text plan parsed heuristically)
+STRUCTURED_PLAN = os.getenv("AGENT_STRUCTURED_PLAN", "1") == "1"
+
+PLAN_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "steps": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "id": {"type": "INTEGER"},
+                    "title": {"type": "STRING"},
+                    "description": {"type": "STRING"},
+                    "depends_on": {"type": "ARRAY", "items": {"type": "INTEGER"}},
+                    "complexity": {"type": "STRING", "enum": ["simple", "complex"]},
+                    "expected_files": {"type": "ARRAY", "items": {"type": "STRING"}}
+                },
+                "required": ["id", "title", "description", "depends_on", "complexity", "expected_files"]
+            }
+        }
+    },
+    "required": ["steps"]
+}
+
+# Headings of plan sections that are not steps
+_NON_STEP_SECTION = re.compile(r'(risk|edge case|dependenc|assumption|question|note|consideration|outcome)', re.IGNORECASE)
+_NUMBERED = re.compile(r'^(?:step\s*)?(\d+)\s*[.):\-]\s*(.+)$', re.IGNORECASE)
+
+def plan(task, model, context="", cancel=None, on_retry=None):
+    """Stream a plan; on_retry is passed to stream_gemini (e.g. PlanStream.restart)."""
+    if STRUCTURED_PLAN:
+        return stream_gemini(structured_planner_prompt(task, context), SYSTEM, model, cancel=cancel, agent="planner",
+                             generation_config={"response_mime_type": "application/json",
+                                                "response_schema": PLAN_SCHEMA}, on_retry=on_retry)
+    return stream_gemini(planner_prompt(task, context), SYSTEM, model, cancel=cancel, agent="planner",
+                         on_retry=on_retry)
+
+def _step(step_id, title, description="", depends_on=None, complexity="simple", expected_files=None):
+    return {"id": step_id, "title": title, "description": description, "depends_on": depends_on,
+            "complexity": complexity, "expected_files": expected_files or []}
+
+def _load_json(text):
+    """Parse a JSON plan, tolerating code fences and prose around the object."""
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end <= start:
+        return None
+    try:
+        return json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+
+def _normalize(data):
+    """Validate a decoded plan against PLAN_SCHEMA's shape; returns the steps or None."""
+    items = data.get("steps") if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return None
+    steps, ids = [], _StepIds()
+    for item in items:
+        step = _normalize_step(item, ids)
+        if step is not None:
+            steps.append(step)
+    return steps or None
+
+class _StepIds:
+    """Ids of the steps normalized so far.
+    
+    A step whose id is missing or taken is renumbered; later depends_on
+    entries are rewritten from the plan's ids to the assigned ones (a
+    duplicated id keeps meaning the first step that used it).
+    """
+    
+    def __init__(self):
+        self.assigned = set()
+        self.by_original = {}
+    
+    def resolve(self, depends_on):
+        """The assigned ids of the earlier steps in depends_on (only earlier steps can be dependencies)."""
+        if not isinstance(depends_on, list):
+            return []
+        return [self.by_original[d] for d in depends_on if isinstance(d, int) and d in self.by_original]
+    
+    def assign(self, original):
+        step_id = original
+        if not isinstance(step_id, int) or step_id in self.assigned:
+            step_id = max(self.assigned, default=0) + 1
+        if isinstance(original, int):
+            self.by_original.setdefault(original, step_id)
+        self.assigned.add(step_id)
+        return step_id
+
+def _normalize_step(item, ids):
+    """Normalize one decoded step given the _StepIds of the steps before it (updated in place); None if unusable."""
+    if not isinstance(item, dict):
+        return None
+    title = str(item.get("title") or "").strip()
+    description = str(item.get("description") or "").strip()
+    if not title and not description:
+        return None
+    depends_on = ids.resolve(item.get("depends_on"))
+    complexity = item.get("complexity") if item.get("complexity") in ("simple", "complex") else "simple"
+    files = item.get("expected_files")
+    files = [str(f) for f in files if isinstance(f, str) and f.strip()] if isinstance(files, list) else []
+    step_id = ids.assign(item.get("id"))
+    return _step(step_id, title or description[:80], description, depends_on, complexity, files)
+
+def steps_from_text(plan_text):
+    """Fallback parser for free-text plans.
+    
+    Takes the first top-level numbered list (a list restarting at 1 is a
+    different list) and skips indented sub-items and numbered items under
+    headings such as "Risks" or "Dependencies". Steps parsed this way
+    depend on all earlier steps (depends_on=None).
+    """
+    return _numbered_steps(plan_text) or [_step(1, plan_text.strip() or "Execute the task")]
+
+def _numbered_steps(plan_text):
+    steps = []
+    skipping = False
+    last_number = 0
+    for raw in plan_text.split('\n'):
+        line = raw.strip()
+        if not line:
+            continue
+        match = _NUMBERED.match(line)
+        if match is None or raw[:1].isspace():
+            # A heading-like line switches between step and non-step sections
+            if match is None and (line.endswith(":") or line.startswith(("#", "**"))):
+                skipping = bool(_NON_STEP_SECTION.search(line)) and not re.search(r'\bsteps?\b|plan', line, re.IGNORECASE)
+            continue
+        if skipping:
+            continue
+        number = int(match.group(1))
+        if steps and number <= last_number:
+            break
+        text = match.group(2).strip().strip("*").strip()
+        if len(text) > 5:  # Filter out very short lines
+            steps.append(_step(len(steps) + 1, text))
+            last_number = number
+    return steps
+
+def parse_plan(plan_text):
+    """Return the plan's steps as dicts with id, title, description, depends_on, complexity and expected_files.
+    
+    JSON plans are validated and normalized; anything else goes through
+    steps_from_text.
+    """
+    data = _load_json(plan_text)
+    steps = _normalize(data) if data is not None else None
+    return steps or steps_from_text(plan_text)
+
+class PlanStream:
+    """Incremental parser over plan() chunks.
+    
+    feed() returns the steps that became final with each chunk: in a JSON
+    plan a step is final once its object in "steps" closes, in a free-text
+    plan once its line ends. Steps are normalized exactly as parse_plan
+    would, so for a well-formed plan they are a prefix of
+    parse_plan(full text); callers must still compare against that, since
+    only the full text decides (e.g. a plan that turns out not to be
+    valid JSON falls back to steps_from_text).
+    """
+    
+    def __init__(self):
+        self.text = ""
+        self.mode = None  # "json" or "text" once the first meaningful character arrives
+        self.steps = []
+        self.stopped = False
+        # JSON scanning state
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.start = None
+        self.ids = _StepIds()
+        # Free-text state: length of the text up to the last complete line
+        self.complete = 0
+    
+    def feed(self, chunk):
+        """Add a chunk of plan text; returns the list of newly finalized steps."""
+        if self.stopped:
+            return []
+        self.text += chunk
+        if self.mode is None and not self._detect_mode():
+            return []
+        new = self._scan_json() if self.mode == "json" else self._scan_text()
+        self.steps.extend(new)
+        return new
+    
+    def restart(self, attempt=None, error=None):
+        """The response restarted (stream_gemini's on_retry): stop once text of a failed attempt was seen.
+        
+        That text stays part of the streamed plan, so the full text will not
+        parse the same way as the steps found so far.
+        """
+        if self.text.strip():
+            self.stopped = True
+    
+    def _detect_mode(self):
+        head = self.text.lstrip()
+        if "```".startswith(head):
+            return False  # Possibly the start of a code fence
+        if head.startswith("```"):
+            if "\n" not in head:
+                return False
+            head = head.split("\n", 1)[1].lstrip()
+        if not head:
+            return False
+        self.mode = "json" if head[0] == "{" else "text"
+        if self.mode == "json":
+            self.pos = self.text.index("{")
+        return True
+    
+    def _scan_json(self):
+        new = []
+        text = self.text
+        for index in range(self.pos, len(text)):
+            char = text[index]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+                # Step objects sit at depth 3: plan object, "steps" array, step
+                if char == "{" and self.depth == 3:
+                    self.start = index
+            elif char in "}]":
+                if char == "}" and self.depth == 3 and self.start is not None:
+                    step = self._decode(text[self.start:index + 1])
+                    if step is not None:
+                        new.append(step)
+                    self.start = None
+                self.depth -= 1
+        self.pos = len(text)
+        return new
+    
+    def _decode(self, text):
+        try:
+            item = json.loads(text)
+        except ValueError:
+            return None
+        return _normalize_step(item, self.ids)
+    
+    def _scan_text(self):
+        end = self.text.rfind("\n")
+        if end <= self.complete:
+            return []
+        self.complete = end
+        return _numbered_steps(self.text[:end])[len(self.steps):]
+
+def format_step(step):
+    """The step as executor instructions."""
+    text = step["title"]
+    if step["description"] and step["description"] != step["title"]:
+        text += f"\n{step['description']}"
+    if step["expected_files"]:
+        text += f"\nExpected files: {', '.join(step['expected_files'])}"
+    return text
@@ -11,5 +11,5 @@ SYSTEM = """You are a Review Agent. Your role is to:
 3. Ensure completeness and accuracy
 4. Provide improved versions when needed"""
 
-def review(task, output, model):
-    return stream_gemini(reviewer_prompt(task, output), SYSTEM, model)
+def review(task, output, model, cancel=None):
+    return stream_gemini(reviewer_prompt(task, output), SYSTEM, model, cancel=cancel, agent="reviewer")
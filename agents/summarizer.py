@@ -13,7 +13,7 @@ SYSTEM = """You are a Summarizer Agent. Your role is to:
 
 Be concise but thorough."""
 
-def summarize(task, execution_log, final_output, model):
+def summarize(task, execution_log, final_output, model, cancel=None):
     """Generate a comprehensive summary of the task execution."""
     prompt = summarizer_prompt(task, execution_log, final_output)
-    return call_gemini(prompt, SYSTEM, model)
+    return call_gemini(prompt, SYSTEM, model, cancel=cancel, agent="summarizer")
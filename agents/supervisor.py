@@ -20,7 +20,7 @@ Always proceed with execution. Make reasonable assumptions:
 
 Return your response starting with "EXECUTION PLAN:" followed by numbered steps."""
 
-def supervise(task, model):
+def supervise(task, model, cancel=None):
     """Supervise and split task into manageable sub-tasks."""
     prompt = supervisor_prompt(task)
-    return call_gemini(prompt, SYSTEM, model)
+    return call_gemini(prompt, SYSTEM, model, cancel=cancel, agent="supervisor")
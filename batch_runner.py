@@ -0,0 +1,250 @@
+"""
+Batch Runner - Runs many tasks from a JSONL file through the orchestrator concurrently.
+"""
+
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed, wait
+from renderer import get_renderer
+from cancellation import CancelToken
+from project_runner import run_summary
+
+def load_tasks(input_path):
+    """Read tasks from a JSONL file.
+
+    Each line is a JSON object with a "task" field, or "title"/"body" fields
+    (as in requests.jsonl), and an optional "id" or "request_id". Plain JSON
+    strings are accepted as tasks too.
+    """
+    tasks = []
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"task": record}
+
+            task = record.get("task") or "\n\n".join(
+                part for part in (record.get("title"), record.get("body")) if part
+            )
+            if not task:
+                raise ValueError(f"{input_path}:{line_no}: no task text found")
+
+            task_id = record.get("id") or record.get("request_id") or f"line-{line_no}"
+            tasks.append({"id": str(task_id), "task": task})
+    return tasks
+
+def load_checkpoint(output_path, retry_failed=False):
+    """Return the ids already recorded in an output file."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Partially written line from a crash
+            if record.get("status") == "cancelled":
+                continue  # Interrupted - always run again
+            if retry_failed and record.get("status") != "success":
+                continue
+            done.add(record["id"])
+    return done
+
+def _truncate_partial_line(output_path):
+    """Drop a half-written last line left by a crash so appended results stay valid JSONL."""
+    if not os.path.exists(output_path):
+        return
+    with open(output_path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+def _percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+class BatchRunner:
+    def __init__(self, workers=4, requests_per_minute=0, timeout=None):
+        self.workers = workers
+        self.requests_per_minute = requests_per_minute
+        # Per-task deadline in seconds
+        self.timeout = timeout
+        # Cancels every running task when the batch is interrupted
+        self.cancel = CancelToken()
+        # Reuse stage checkpoints of tasks interrupted in an earlier run
+        self.resume = True
+        self.input_path = None
+        self.write_lock = threading.Lock()
+
+    def run_id_for(self, item):
+        """The item's run id: stable across re-runs of this file, distinct for duplicate tasks and other files."""
+        from memory.checkpoints import run_id_for
+
+        return run_id_for(f"{os.path.abspath(self.input_path)}\0{item['id']}")
+
+    def _run_one(self, item):
+        from orchestrator import get_orchestrator
+
+        # Tasks running side by side each get a pane
+        renderer = get_renderer()
+        sink = renderer.pane(item["id"]) if self.workers > 1 else renderer
+        start = time.perf_counter()
+        try:
+            result = get_orchestrator().run_task(item["task"], sink=sink, cancel=self.cancel, timeout=self.timeout,
+                                                 run_id=self.run_id_for(item), resume=self.resume)
+        except Exception as e:
+            result = {"status": "error", "message": str(e)}
+        project_run = result.get("project_run")
+        if project_run is None:
+            sink.close()
+        else:
+            # The run keeps writing to the pane until it ends
+            project_run.add_done_callback(lambda _: sink.close())
+
+        return {
+            "id": item["id"],
+            "task": item["task"],
+            "status": result.get("status"),
+            "run_id": result.get("run_id"),
+            "latency_s": round(time.perf_counter() - start, 3),
+            "summary": result.get("summary"),
+            "final_output": result.get("final_output"),
+            "project_path": result.get("project_path"),
+            "saved_files": result.get("saved_files", []),
+            "steps_executed": result.get("steps_executed"),
+            "message": result.get("message"),
+            "metrics": result.get("metrics"),
+            "usage": result.get("usage"),
+            "profile": result.get("profile"),
+            "project_run": result.get("project_run"),
+            "finished_at": time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+    def _write(self, out, record):
+        """Append one result and make it durable - the output file is the checkpoint."""
+        with self.write_lock:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            os.fsync(out.fileno())
+
+    def run(self, input_path, output_path, resume=True, retry_failed=False):
+        """Run every task in input_path and stream results to output_path.
+
+        Returns an aggregate report dict.
+        """
+        import gemini_client
+        from memory.memory import flush
+
+        if self.requests_per_minute:
+            gemini_client.set_rate_limit(self.requests_per_minute)
+
+        self.resume = resume
+        self.input_path = input_path
+        tasks = load_tasks(input_path)
+        done = load_checkpoint(output_path, retry_failed) if resume else set()
+        pending = [item for item in tasks if item["id"] not in done]
+        if resume:
+            _truncate_partial_line(output_path)
+
+        progress = get_renderer()
+        progress.notice(f"📦 {len(tasks)} task(s), {len(tasks) - len(pending)} already done, "
+                        f"{len(pending)} to run with {self.workers} worker(s)\n")
+        latencies = []
+        statuses = {}
+        stats_lock = threading.Lock()
+        project_runs = []
+        start = time.perf_counter()
+
+        with open(output_path, 'a' if resume else 'w', encoding='utf-8') as out:
+            def record_result(record):
+                self._write(out, record)
+                with stats_lock:
+                    latencies.append(record["latency_s"])
+                    statuses[record["status"]] = statuses.get(record["status"], 0) + 1
+                    progress.notice(f"[{len(latencies)}/{len(pending)}] {record['id']}: {record['status']} "
+                                    f"({record['latency_s']:.1f}s)\n")
+            
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = [pool.submit(self._run_one, item) for item in pending]
+                collected = set()
+                
+                def collect(future):
+                    collected.add(future)
+                    record = future.result()
+                    project_run = record["project_run"]
+                    if project_run is None:
+                        record_result(record)
+                        return
+                    # The worker moves on; the record is written with the run summary once the run ends
+                    written = Future()
+                    def write_run(run, record=record, written=written):
+                        try:
+                            record_result({**record, "project_run": run_summary(run, record["project_path"])})
+                        finally:
+                            written.set_result(None)
+                    # Wait for the write, not the run: done callbacks may still be running after wait() returns
+                    project_runs.append(written)
+                    project_run.add_done_callback(write_run)
+                
+                try:
+                    for future in as_completed(futures):
+                        collect(future)
+                except KeyboardInterrupt:
+                    # Stop queued tasks, cancel running ones and record their partial results
+                    progress.notice("\n⏹️  Interrupted - cancelling running tasks\n")
+                    self.cancel.cancel("Batch interrupted")
+                    for future in futures:
+                        future.cancel()
+                    for future in futures:
+                        if future not in collected and not future.cancelled():
+                            collect(future)
+            
+            # Project runs still going; cancelling the batch kills them
+            try:
+                wait(project_runs)
+            except KeyboardInterrupt:
+                self.cancel.cancel("Batch interrupted")
+                wait(project_runs)
+
+        flush()
+
+        elapsed = time.perf_counter() - start
+        report = {
+            "tasks": len(latencies),
+            "skipped": len(tasks) - len(pending),
+            "statuses": statuses,
+            "wall_time_s": round(elapsed, 3),
+            "throughput_per_min": round(len(latencies) / elapsed * 60, 2) if elapsed > 0 else 0.0,
+            "latency_p50_s": _percentile(latencies, 50),
+            "latency_p95_s": _percentile(latencies, 95),
+            "latency_max_s": max(latencies) if latencies else 0.0,
+            "prefix_cache": gemini_client.prefix_cache_stats()
+        }
+        return report
+
+def _say(text=""):
+    get_renderer().notice(f"{text}\n")
+
+def print_report(report):
+    _say("\n" + "="*60)
+    _say("📊 BATCH REPORT")
+    _say("="*60)
+    _say(f"Tasks run:   {report['tasks']} ({report['skipped']} skipped from checkpoint)")
+    _say(f"Statuses:    {', '.join(f'{k}={v}' for k, v in report['statuses'].items()) or 'none'}")
+    _say(f"Wall time:   {report['wall_time_s']:.1f}s")
+    _say(f"Throughput:  {report['throughput_per_min']:.2f} tasks/min")
+    _say(f"Latency:     p50 {report['latency_p50_s']:.1f}s, p95 {report['latency_p95_s']:.1f}s, "
+         f"max {report['latency_max_s']:.1f}s")
+    cache = report.get("prefix_cache")
+    if cache:
+        _say(f"Prefix cache: {cache['hit_rate']:.0%} hit rate ({cache['hits']} hits, {cache['misses']} misses, "
+             f"{cache['server_entries']} server-side)")
+    _say("="*60 + "\n")
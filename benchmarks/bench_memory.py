@@ -0,0 +1,101 @@
+"""
+Memory Benchmark - Measures memory store operations against a large task history.
+
+Usage:
+    python benchmarks/bench_memory.py --tasks 100000 --result-size 2000
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TOPICS = ["snake game", "todo list", "rest api", "calculator", "weather dashboard",
+          "chat server", "markdown parser", "image resizer", "expense tracker", "quiz app"]
+
+def _timed(fn, repeat):
+    """Run fn `repeat` times and return latencies in milliseconds."""
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+def _report(name, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{name:<28} p50 {statistics.median(latencies):9.3f} ms   p95 {p95:9.3f} ms")
+
+def run(num_tasks=100000, result_size=2000, repeat=50):
+    workdir = tempfile.mkdtemp(prefix="bench_memory_")
+    os.environ["AGENT_MEMORY_DB"] = os.path.join(workdir, "bench.db")
+    os.environ["AGENT_MEMORY_MAX_TASKS"] = "0"  # Keep everything while seeding
+
+    from memory import memory
+    from memory.embeddings import DIM, to_blob
+
+    print(f"Seeding {num_tasks:,} tasks ({result_size} chars each) in {workdir}")
+    result_text = ("x" * (result_size - 1)) + "\n"
+    # Every seeded task shares one generated file, as similar tasks do in practice
+    with memory.get_db().conn:
+        result_chunks, index_text = memory._store_result(
+            f"Here is the project.\n```python:app.py\n{result_text}```\nRun it with python.")
+    start = time.perf_counter()
+    batch = []
+    now = time.time()
+    rng = np.random.default_rng(0)
+    for i in range(num_tasks):
+        # Random unit vectors stand in for embeddings so seeding stays fast
+        vecs = rng.standard_normal((2, DIM)).astype(np.float32)
+        vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+        batch.append({"task": f"build a {TOPICS[i % len(TOPICS)]} variant {i}", "result_chunks": result_chunks, "created_at": now - (num_tasks - i),
+                      "task_embedding": to_blob(vecs[0]), "result_embedding": to_blob(vecs[1])})
+        if len(batch) == 5000:
+            memory.get_db()["tasks"].insert_all(batch)
+            batch = []
+    if batch:
+        memory.get_db()["tasks"].insert_all(batch)
+    with memory.get_db().conn:
+        memory.get_db().execute("INSERT INTO tasks_fts(rowid, task, result, project_path) "
+                          "SELECT id, task, ?, project_path FROM tasks", [index_text])
+    print(f"Seeded in {time.perf_counter() - start:.1f}s "
+          f"({os.path.getsize(memory.db_path) / 1e6:.1f} MB)")
+    stats = memory.memory_stats()
+    print(f"Results: {stats['raw_bytes'] / 1e6:.1f} MB raw, {stats['blobs']} blobs, "
+          f"{stats['stored_bytes'] / 1e6:.3f} MB stored\n")
+
+    _report("fetch_recent(3)", _timed(lambda: memory.fetch_recent(3), repeat))
+    _report("fetch_memory page (50)", _timed(lambda: memory.fetch_memory(50, before_id=num_tasks // 2), repeat))
+    _report("fetch_memory no results", _timed(lambda: memory.fetch_memory(50, include_result=False), repeat))
+    _report("count_tasks()", _timed(memory.count_tasks, repeat))
+    _report("save_task() (queued)", _timed(lambda: memory.save_task("bench task", result_text), repeat))
+    _report("flush()", _timed(memory.flush, 1))
+    _report("save_task() + flush()", _timed(lambda: (memory.save_task("bench task", result_text),
+                                                      memory.flush()), repeat))
+    start = time.perf_counter()
+    memory.search_similar("warm up the index")
+    print(f"{'index load':<28} {(time.perf_counter() - start) * 1000:9.1f} ms")
+    _report("search_similar(k=5)", _timed(lambda: memory.search_similar("build a snake game", 5), repeat))
+    _report("relevant_context()", _timed(lambda: memory.relevant_context("build a snake game"), repeat))
+    _report("search_tasks('snake game')", _timed(lambda: memory.search_tasks("snake game", 10), repeat))
+    _report("search_tasks('variant 4242')", _timed(lambda: memory.search_tasks("variant 4242", 10), repeat))
+    _report("full table load (old)", _timed(lambda: list(memory.get_db()["tasks"].rows), 3))
+
+    start = time.perf_counter()
+    deleted = memory.compact_memory(max_tasks=num_tasks // 2)
+    print(f"\ncompact_memory(max_tasks={num_tasks // 2:,}) deleted {deleted:,} rows "
+          f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the agent memory store")
+    parser.add_argument("--tasks", type=int, default=100000, help="Number of stored tasks")
+    parser.add_argument("--result-size", type=int, default=2000, help="Characters per stored result")
+    parser.add_argument("--repeat", type=int, default=50, help="Repetitions per measurement")
+    args = parser.parse_args()
+    run(args.tasks, args.result_size, args.repeat)
@@ -0,0 +1,469 @@
+"""
+Pipeline Benchmark - Measures what the agent pipeline adds on top of model latency.
+
+No network is needed: the Gemini client is replaced by a scripted model that
+streams canned responses of realistic size, optionally with simulated latency.
+Covers TaskOrchestrator.run_task per stage, extract_code_blocks, terminal rendering,
+ProjectAnalyzer.analyze on synthetic trees and memory I/O against a growing
+database. Reports p50/p95/p99, throughput and peak RSS, and can save the
+results as JSON and compare them with an earlier run.
+
+Usage:
+    python benchmarks/bench_pipeline.py --output bench.json
+    python benchmarks/bench_pipeline.py --trees 1000 --memory-sizes 1000 --runs 5
+    python benchmarks/bench_pipeline.py --baseline bench.json --tolerance 0.2
+"""
+
+import os
+import sys
+import json
+import time
+import types
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TOPICS = ["snake game", "todo list", "rest api", "calculator", "weather dashboard",
+          "chat server", "markdown parser", "image resizer", "expense tracker", "quiz app"]
+# Extensions of the synthetic project trees, weighted roughly like a web/Python repo
+TREE_EXTENSIONS = [".py"] * 4 + [".js"] * 3 + [".html", ".css", ".md", ".json", ".txt"]
+
+def _percentiles(latencies):
+    """Nearest-rank p50/p95/p99 of millisecond latencies."""
+    ordered = sorted(latencies)
+    def rank(p):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+    return {"samples": len(ordered), "p50_ms": round(statistics.median(ordered), 3),
+            "p95_ms": round(rank(0.95), 3), "p99_ms": round(rank(0.99), 3)}
+
+def _timed(fn, repeat):
+    """Run fn `repeat` times and return latencies in milliseconds."""
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+def _report(results, name, latencies, **extra):
+    stats = _percentiles(latencies)
+    stats.update(extra)
+    results[name] = stats
+    rate = "".join(f"   {key} {value:,.1f}" for key, value in extra.items() if isinstance(value, float))
+    print(f"{name:<36} p50 {stats['p50_ms']:9.3f} ms   p95 {stats['p95_ms']:9.3f} ms   "
+          f"p99 {stats['p99_ms']:9.3f} ms{rate}")
+
+def _peak_rss_mb():
+    """Peak resident set size of this process so far, or None where unsupported."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+# --- Scripted model ---------------------------------------------------------
+
+def _python_module(name, functions=12):
+    """Valid Python source of realistic length for a generated module."""
+    lines = [f'"""{name} - generated module."""', "", "import math", ""]
+    for i in range(functions):
+        lines += [f"def {name}_step_{i}(values, scale={i + 1}):",
+                  f'    """Scale and clamp values for stage {i}."""',
+                  "    result = []",
+                  "    for value in values:",
+                  "        scaled = value * scale",
+                  "        result.append(max(0, min(scaled, math.inf)))",
+                  "    return result", ""]
+    return "\n".join(lines)
+
+def scripted_responses(steps=5, functions=12):
+    """Canned responses per agent, sized like real Gemini output."""
+    modules = [f"module_{i}" for i in range(1, steps + 1)]
+    step_outputs = [
+        f"Step {i} implements {name}.\n\n```python:{name}.py\n{_python_module(name, functions)}\n```\n\n"
+        f"This module exposes {functions} helpers used by main.py."
+        for i, name in enumerate(modules, 1)
+    ]
+    main = "\n".join([f"import {name}" for name in modules] + ["", "if __name__ == '__main__':"] +
+                     [f"    print({name}.{name}_step_0([1, 2, 3]))" for name in modules])
+    test = "\n".join([f"import {modules[0]}", "", "def test_step_0():",
+                      f"    assert {modules[0]}.{modules[0]}_step_0([1]) == [1]", "",
+                      "if __name__ == '__main__':", "    test_step_0()"])
+    review = ("The implementation is complete. Corrected files:\n\n" +
+              "".join(f"```python:{name}.py\n{_python_module(name, functions)}\n```\n\n" for name in modules) +
+              f"```python:main.py\n{main}\n```\n\n```python:test_{modules[0]}.py\n{test}\n```\n")
+    return {
+        "supervise": "TASK ANALYSIS:\n" + "The task needs a small Python package with tests.\n" * 20 +
+                     "EXECUTION PLAN:\n" + "".join(f"{i}. Implement {name}\n" for i, name in enumerate(modules, 1)),
+        "plan": json.dumps({"steps": [
+            {"id": i, "title": f"Implement {name}", "depends_on": list(range(1, i)), "complexity": "simple",
+             "description": f"Write {name}.py with {functions} helper functions and docstrings, covered by a test.",
+             "expected_files": [f"{name}.py"]}
+            for i, name in enumerate(modules, 1)
+        ]}, indent=2),
+        "execute": step_outputs,
+        "review": review,
+        "code_review": review,
+        "final_review": "===VERDICT===\nThe output solves the task.\n\n===CODE===\n" + review +
+                        "\n===SUMMARY===\nBuilt a Python package with " + ", ".join(modules) + ".\n",
+        "summary": "Summary: built a Python package with " + ", ".join(modules) + ".\n" +
+                   "Each module provides scaling helpers; main.py wires them together.\n" * 8,
+    }
+
+class ScriptedModel:
+    """Stands in for gemini_client: returns canned responses chosen by the agent's system prompt.
+
+    `latency` is the simulated time to first token and `chunk_interval` the gap
+    between streamed chunks. Simulated time is tracked per thread, so run_task
+    overhead can be separated from model time.
+    """
+
+    def __init__(self, responses, latency=0.0, chunk_interval=0.0, chunk_size=256):
+        self.responses = responses
+        self.latency = latency
+        self.chunk_interval = chunk_interval
+        self.chunk_size = chunk_size
+        self.agents = {}
+        self.step_index = threading.local()
+        self.clock = threading.local()
+
+    def bind_agents(self):
+        """Map each agent's system prompt to its response key (agents must import this module first)."""
+        from agents import supervisor, planner, executor, reviewer, code_reviewer, summarizer, final_reviewer
+        self.agents = {supervisor.SYSTEM: "supervise", planner.SYSTEM: "plan", executor.SYSTEM: "execute",
+                       reviewer.SYSTEM: "review", code_reviewer.SYSTEM: "code_review", summarizer.SYSTEM: "summary",
+                       final_reviewer.SYSTEM: "final_review"}
+
+    def model_seconds(self):
+        return getattr(self.clock, "seconds", 0.0)
+
+    def reset(self):
+        self.clock.seconds = 0.0
+        self.step_index.value = 0
+
+    def _wait(self, seconds, cancel):
+        if seconds <= 0:
+            return
+        self.clock.seconds = self.model_seconds() + seconds
+        if cancel:
+            cancel.sleep(seconds)
+        else:
+            time.sleep(seconds)
+
+    def _text(self, system):
+        key = self.agents.get(system, "summary")
+        response = self.responses[key]
+        if isinstance(response, list):  # Executor: one response per plan step
+            index = getattr(self.step_index, "value", 0)
+            self.step_index.value = index + 1
+            response = response[index % len(response)]
+        return response
+
+    def stream_gemini(self, prompt, system, model, *args, cancel=None, **kwargs):
+        text = self._text(system)
+        self._wait(self.latency, cancel)
+        for start in range(0, len(text), self.chunk_size):
+            if cancel:
+                cancel.check()
+            yield text[start:start + self.chunk_size]
+            self._wait(self.chunk_interval, cancel)
+
+    def call_gemini(self, prompt, system, model, *args, cancel=None, **kwargs):
+        return "".join(self.stream_gemini(prompt, system, model, cancel=cancel))
+
+    def install(self):
+        """Register as the gemini_client module, before anything imports the real one."""
+        module = types.ModuleType("gemini_client")
+        module.stream_gemini = self.stream_gemini
+        module.call_gemini = self.call_gemini
+        module.set_rate_limit = lambda requests_per_minute: None
+        module.register_prefix = lambda model, system, context="", ttl=None: None
+        module.TruncatedResponse = type("TruncatedResponse", (Exception,), {})  # Scripted responses are never cut off
+        sys.modules["gemini_client"] = module
+
+# --- Benchmarks -------------------------------------------------------------
+
+def bench_pipeline(model, runs, workers):
+    """Per-stage latency of run_task, its overhead over model time, and concurrent throughput.
+
+    Stage and overhead figures run with plan pipelining off, since model time
+    is only additive when nothing overlaps; the pipelined total is reported
+    separately.
+    """
+    import orchestrator as orchestrator_module
+    from orchestrator import TaskOrchestrator
+    from sinks import NullSink
+
+    orchestrator = TaskOrchestrator(sink=NullSink())
+    results = {}
+    stages, totals, overheads = {}, [], []
+
+    def one_run(i):
+        model.reset()
+        start = time.perf_counter()
+        result = orchestrator.run_task(f"build a {TOPICS[i % len(TOPICS)]} #{i} {time.time_ns()}")
+        elapsed = time.perf_counter() - start
+        if result["status"] != "success":
+            raise RuntimeError(f"run_task returned {result['status']}: {result.get('message')}")
+        return result["metrics"]["stages"], elapsed, model.model_seconds()
+
+    pipelined = orchestrator_module.PIPELINED_PLAN
+    one_run(0)  # Warm up imports, the memory index and the project runner pool
+    orchestrator_module.PIPELINED_PLAN = False
+    try:
+        for i in range(runs):
+            run_stages, elapsed, model_seconds = one_run(i + 1)
+            for name, seconds in run_stages.items():
+                stages.setdefault(name, []).append(seconds * 1000)
+            totals.append(elapsed * 1000)
+            overheads.append((elapsed - model_seconds) * 1000)
+    finally:
+        orchestrator_module.PIPELINED_PLAN = pipelined
+
+    for name, latencies in stages.items():
+        _report(results, f"stage {name}", latencies)
+    _report(results, "run_task total", totals)
+    _report(results, "run_task overhead (excl. model)", overheads)
+    if pipelined:
+        _report(results, "run_task total (pipelined plan)", [one_run(runs + i + 1)[1] * 1000 for i in range(runs)])
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(one_run, range(2 * runs + 1, 3 * runs + 1)))
+    elapsed = time.perf_counter() - start
+    results["throughput"] = {"workers": workers, "tasks": runs, "tasks_per_s": round(runs / elapsed, 2)}
+    print(f"{'throughput':<36} {runs / elapsed:9.2f} tasks/s with {workers} worker(s)")
+    return results
+
+def bench_extract(responses, repeat):
+    """extract_code_blocks on reviewed outputs of 1x, 10x and 100x the scripted size, as text and
+    from an OutputBuffer spilled to disk (scanned through mmap)."""
+    from file_manager import extract_code_blocks
+    from output_buffer import OutputBuffer
+
+    results = {}
+    base = responses["review"]
+    for factor in (1, 10, 100):
+        text = base * factor
+        latencies = _timed(lambda: extract_code_blocks(text), max(1, repeat // factor))
+        megabytes = len(text) / 1e6
+        _report(results, f"extract_code_blocks {len(text) // 1024} KB", latencies,
+                mb_per_s=round(megabytes / (statistics.median(latencies) / 1000), 1))
+        spilled = OutputBuffer(spill_chars=1)
+        spilled.write(text)
+        latencies = _timed(lambda: extract_code_blocks(spilled), max(1, repeat // factor))
+        _report(results, f"extract_code_blocks {len(text) // 1024} KB spilled", latencies,
+                mb_per_s=round(megabytes / (statistics.median(latencies) / 1000), 1))
+        spilled.close()
+    return results
+
+def bench_render(responses, repeat):
+    """Streaming a review response in small chunks: StdoutSink (flush per chunk) vs. Renderer (frames)."""
+    from sinks import StdoutSink
+    from renderer import Renderer
+
+    results = {}
+    text = responses["review"] * 10
+    chunks = [text[i:i + 8] for i in range(0, len(text), 8)]
+    with open(os.devnull, "w") as devnull:
+        def stdout_sink():
+            sink = StdoutSink(stream=devnull)
+            for chunk in chunks:
+                sink.write(chunk)
+
+        def renderer():
+            sink = Renderer(stream=devnull, fps=20)
+            for chunk in chunks:
+                sink.write(chunk)
+            sink.shutdown()
+
+        for name, fn in (("StdoutSink", stdout_sink), ("Renderer 20 fps", renderer)):
+            latencies = _timed(fn, max(1, repeat // 4))
+            _report(results, f"render {len(chunks)} chunks {name}", latencies)
+    return results
+
+def make_tree(root, num_files, files_per_dir=100, seed=0):
+    """Create a synthetic project of num_files small source files under root."""
+    rng = random.Random(seed)
+    body = "\n".join(f"line {i} = {i} * 2" for i in range(30)) + "\n"
+    for i in range(num_files):
+        directory = os.path.join(root, f"pkg_{i // (files_per_dir * 10)}", f"mod_{i // files_per_dir}")
+        if i % files_per_dir == 0:
+            os.makedirs(directory, exist_ok=True)
+        ext = rng.choice(TREE_EXTENSIONS)
+        with open(os.path.join(directory, f"file_{i}{ext}"), "w") as f:
+            f.write(body)
+    with open(os.path.join(root, "requirements.txt"), "w") as f:
+        f.write("numpy\nrequests\n")
+    with open(os.path.join(root, "main.py"), "w") as f:
+        f.write("print('hello')\n")
+
+def bench_trees(workdir, sizes, repeat):
+    """ProjectAnalyzer.analyze on synthetic trees."""
+    from project_analyzer import ProjectAnalyzer
+
+    results = {}
+    for size in sizes:
+        root = os.path.join(workdir, f"tree_{size}")
+        start = time.perf_counter()
+        make_tree(root, size)
+        print(f"Created {size:,}-file tree in {time.perf_counter() - start:.1f}s")
+        latencies = _timed(lambda: ProjectAnalyzer(root).analyze(), repeat)
+        _report(results, f"analyze {size:,} files", latencies,
+                files_per_s=round(size / (statistics.median(latencies) / 1000), 1))
+        shutil.rmtree(root, ignore_errors=True)
+    return results
+
+def _seed(memory, start_id, count, result_chunks, index_text):
+    """Insert `count` tasks directly, as bench_memory does, with random unit embeddings."""
+    import numpy as np
+    from memory.embeddings import DIM, to_blob
+
+    rng = np.random.default_rng(start_id)
+    now = time.time()
+    batch = []
+    for i in range(start_id, start_id + count):
+        vecs = rng.standard_normal((2, DIM)).astype(np.float32)
+        vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+        batch.append({"task": f"build a {TOPICS[i % len(TOPICS)]} variant {i}", "result_chunks": result_chunks,
+                      "created_at": now - i, "task_embedding": to_blob(vecs[0]),
+                      "result_embedding": to_blob(vecs[1])})
+        if len(batch) == 5000:
+            memory.get_db()["tasks"].insert_all(batch)
+            batch = []
+    if batch:
+        memory.get_db()["tasks"].insert_all(batch)
+    with memory.get_db().conn:
+        memory.get_db().execute("INSERT INTO tasks_fts(rowid, task, result, project_path) "
+                                "SELECT id, task, ?, project_path FROM tasks WHERE id > ?",
+                                [index_text, memory.get_db().execute("SELECT COUNT(*) FROM tasks_fts").fetchone()[0]])
+
+def bench_memory(sizes, responses, repeat):
+    """Memory reads and writes as the database grows through `sizes` tasks."""
+    from memory import memory
+
+    results = {}
+    with memory.get_db().conn:
+        result_chunks, index_text = memory._store_result(responses["review"])
+    result_text = responses["review"]
+    seeded = memory.count_tasks()
+    for size in sorted(sizes):
+        if size > seeded:
+            start = time.perf_counter()
+            _seed(memory, seeded, size - seeded, result_chunks, index_text)
+            seeded = size
+            memory._reset_index()
+            print(f"Seeded to {size:,} tasks in {time.perf_counter() - start:.1f}s "
+                  f"({os.path.getsize(memory.db_path) / 1e6:.1f} MB)")
+        label = f"{size:,} tasks"
+        start = time.perf_counter()
+        memory.search_similar("warm up the index")
+        results[f"index load @ {label}"] = {"ms": round((time.perf_counter() - start) * 1000, 3)}
+        _report(results, f"relevant_context @ {label}", _timed(lambda: memory.relevant_context("build a snake game"), repeat))
+        _report(results, f"search_tasks @ {label}", _timed(lambda: memory.search_tasks("snake game", 10), repeat))
+        _report(results, f"fetch_recent(3) @ {label}", _timed(lambda: memory.fetch_recent(3), repeat))
+        latencies = _timed(lambda: (memory.save_task("bench task", result_text), memory.flush()), repeat)
+        _report(results, f"save_task + flush @ {label}", latencies,
+                saves_per_s=round(1000 / statistics.median(latencies), 1))
+        seeded = memory.count_tasks()
+    return results
+
+def compare(results, baseline, tolerance):
+    """Return the measurements whose p95 grew by more than `tolerance` over the baseline."""
+    regressions = []
+    for section, entries in results["sections"].items():
+        for name, stats in entries.items():
+            old = baseline.get("sections", {}).get(section, {}).get(name, {})
+            if "p95_ms" in stats and old.get("p95_ms") and stats["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+                regressions.append((f"{section}: {name}", old["p95_ms"], stats["p95_ms"]))
+    return regressions
+
+def run(runs=20, workers=4, trees=(1000, 10000, 100000), memory_sizes=(1000, 10000, 100000), repeat=20,
+        latency=0.0, chunk_interval=0.0, output=None, baseline=None, tolerance=0.2):
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    os.environ["AGENT_MEMORY_DB"] = os.path.join(workdir, "bench.db")
+    os.environ["AGENT_MEMORY_MAX_TASKS"] = "0"  # Keep everything while seeding
+    os.chdir(workdir)  # Generated projects land in workdir/projects
+
+    responses = scripted_responses()
+    model = ScriptedModel(responses, latency, chunk_interval)
+    model.install()
+    model.bind_agents()
+    print(f"Working in {workdir} (simulated latency {latency}s, chunk interval {chunk_interval}s)\n")
+
+    results = {
+        "meta": {"timestamp": time.strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(),
+                 "platform": platform.platform(), "cpus": os.cpu_count(),
+                 "args": {"runs": runs, "workers": workers, "trees": list(trees), "memory_sizes": list(memory_sizes),
+                          "repeat": repeat, "latency": latency, "chunk_interval": chunk_interval}},
+        "sections": {},
+        "peak_rss_mb": {}
+    }
+    sections = [
+        ("memory", lambda: bench_memory(memory_sizes, responses, repeat)),
+        ("pipeline", lambda: bench_pipeline(model, runs, workers)),
+        ("extract", lambda: bench_extract(responses, repeat)),
+        ("render", lambda: bench_render(responses, repeat)),
+        ("analyze", lambda: bench_trees(workdir, trees, max(1, repeat // 10))),
+    ]
+    try:
+        for name, bench in sections:
+            print(f"== {name} ==")
+            results["sections"][name] = bench()
+            # ru_maxrss never decreases, so this is the peak up to and including the section
+            results["peak_rss_mb"][name] = _peak_rss_mb()
+            print(f"peak RSS {results['peak_rss_mb'][name]} MB\n")
+    finally:
+        from memory import memory
+        memory.shutdown()
+        os.chdir(os.path.dirname(workdir))
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {output}")
+
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(results, json.load(f), tolerance)
+        for name, old, new in regressions:
+            print(f"REGRESSION {name}: p95 {old:.3f} ms -> {new:.3f} ms")
+        if not regressions:
+            print(f"No p95 regressions over {tolerance:.0%} against {baseline}")
+        return not regressions
+    return True
+
+def _sizes(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the agent pipeline without network access")
+    parser.add_argument("--runs", type=int, default=20, help="run_task calls per measurement")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent run_task calls for the throughput test")
+    parser.add_argument("--trees", type=_sizes, default=[1000, 10000, 100000], help="Synthetic project sizes (files)")
+    parser.add_argument("--memory-sizes", type=_sizes, default=[1000, 10000, 100000],
+                        help="Stored task counts to measure memory I/O at")
+    parser.add_argument("--repeat", type=int, default=20, help="Repetitions per micro-benchmark")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated model time to first token (s)")
+    parser.add_argument("--chunk-interval", type=float, default=0.0, help="Simulated delay between streamed chunks (s)")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare p95 latencies with an earlier JSON result")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 growth before a regression (0.2 = 20%%)")
+    args = parser.parse_args()
+    ok = run(args.runs, args.workers, args.trees, args.memory_sizes, args.repeat, args.latency,
+             args.chunk_interval, os.path.abspath(args.output) if args.output else None,
+             os.path.abspath(args.baseline) if args.baseline else None, args.tolerance)
+    sys.exit(0 if ok else 1)
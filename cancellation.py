@@ -0,0 +1,69 @@
+"""
+Cancellation - Tokens that let a running task be stopped or given a deadline.
+
+A token is passed down from the orchestrator to the agents and the Gemini
+client, which check it between chunks and before each request.
+"""
+
+import time
+import threading
+
+# How often sleep() re-checks a parent token
+POLL_INTERVAL = 0.25
+
+class Cancelled(BaseException):
+    """Raised when a task is cancelled or runs past its deadline.
+
+    Derives from BaseException (like KeyboardInterrupt) so the pipeline's
+    broad `except Exception` fallbacks don't swallow it.
+    """
+
+class CancelToken:
+    def __init__(self, timeout=None, parent=None):
+        """
+        Args:
+            timeout: Seconds from now until the token cancels itself (None = no deadline)
+            parent: Optional token whose cancellation also cancels this one,
+                e.g. a whole batch run over its per-task tokens
+        """
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.parent = parent
+        self.reason = None
+        self.event = threading.Event()
+
+    def cancel(self, reason="Cancelled"):
+        if not self.event.is_set():
+            self.reason = reason
+            self.event.set()
+
+    @property
+    def cancelled(self):
+        if not self.event.is_set():
+            if self.parent is not None and self.parent.cancelled:
+                self.cancel(self.parent.reason)
+            elif self.deadline is not None and time.monotonic() >= self.deadline:
+                self.cancel("Deadline exceeded")
+        return self.event.is_set()
+
+    def remaining(self):
+        """Seconds until the nearest deadline, or None without one."""
+        deadlines = [r for r in (
+            None if self.deadline is None else max(0.0, self.deadline - time.monotonic()),
+            self.parent.remaining() if self.parent is not None else None
+        ) if r is not None]
+        return min(deadlines) if deadlines else None
+
+    def check(self):
+        """Raise Cancelled if the token has been cancelled or its deadline has passed."""
+        if self.cancelled:
+            raise Cancelled(self.reason)
+
+    def sleep(self, seconds):
+        """Sleep, waking early and raising Cancelled if the token is cancelled."""
+        end = time.monotonic() + seconds
+        while True:
+            self.check()
+            left = end - time.monotonic()
+            if left <= 0:
+                return
+            self.event.wait(min(left, POLL_INTERVAL))
@@ -0,0 +1,202 @@
+"""
+Code Validator - Fast local checks on generated files before any model review.
+
+Python is compiled with the built-in compiler (plus pyflakes when installed),
+JavaScript is checked with `node --check` when Node is available, HTML is
+checked for unbalanced tags and JSON is parsed. Files are checked in parallel.
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import subprocess
+from html.parser import HTMLParser
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from pyflakes.api import check as pyflakes_check
+    from pyflakes.reporter import Reporter as PyflakesReporter
+except ImportError:
+    pyflakes_check = None
+
+NODE_CHECK_TIMEOUT = 10
+MAX_WORKERS = 8
+
+# Elements that never have a closing tag
+VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta",
+                 "param", "source", "track", "wbr"}
+# Elements whose closing tag HTML lets authors leave out
+OPTIONAL_CLOSE = {"html", "head", "body", "p", "li", "dt", "dd", "option", "optgroup", "tr", "td",
+                  "th", "thead", "tbody", "tfoot", "colgroup", "rp", "rt"}
+
+# Extensions that are not code and need no checking (shell blocks are usually setup commands)
+NON_CODE = {".md", ".txt", ".text", ".css", ".csv", ".yaml", ".yml", ".xml", ".svg", ".env", ".ini", ".toml",
+            ".sh", ".bash", ".shell", ".console"}
+# extract_code_blocks names unnamed blocks after their fence language, e.g. "code.python"
+LANGUAGE_EXTENSIONS = {".python": ".py", ".py3": ".py", ".javascript": ".js", ".node": ".js"}
+
+def _diagnostic(filename, line, column, message, tool, severity="error"):
+    return {"file": filename, "line": line, "column": column, "severity": severity,
+            "message": message, "tool": tool}
+
+def check_python(filename, content):
+    try:
+        compile(content, filename, "exec", dont_inherit=True)
+    except SyntaxError as e:
+        return [_diagnostic(filename, e.lineno, e.offset, f"{type(e).__name__}: {e.msg}", "python")]
+    except ValueError as e:  # e.g. null bytes in source
+        return [_diagnostic(filename, None, None, str(e), "python")]
+
+    if pyflakes_check is None:
+        return []
+
+    class _Collector:
+        def __init__(self):
+            self.lines = []
+
+        def write(self, text):
+            self.lines.append(text)
+
+    warnings = _Collector()
+    pyflakes_check(content, filename, PyflakesReporter(warnings, _Collector()))
+    diagnostics = []
+    for line in "".join(warnings.lines).splitlines():
+        # "file:line:col: message"
+        parts = line.split(":", 3)
+        if len(parts) == 4 and parts[1].isdigit():
+            column = int(parts[2]) if parts[2].isdigit() else None
+            diagnostics.append(_diagnostic(filename, int(parts[1]), column, parts[3].strip(), "pyflakes", "warning"))
+    return diagnostics
+
+def _node_check(node, content, suffix):
+    with tempfile.NamedTemporaryFile("w", suffix=suffix, delete=False, encoding="utf-8") as f:
+        f.write(content)
+        path = f.name
+    try:
+        result = subprocess.run([node, "--check", path], capture_output=True, text=True,
+                                timeout=NODE_CHECK_TIMEOUT)
+        return result.returncode, result.stderr
+    finally:
+        os.remove(path)
+
+def check_javascript(filename, content, node):
+    suffix = os.path.splitext(filename)[1].lower()
+    if suffix not in (".mjs", ".cjs"):
+        suffix = ".js"
+    returncode, stderr = _node_check(node, content, suffix)
+    if returncode and ("outside a module" in stderr or "Unexpected token 'export'" in stderr):
+        returncode, stderr = _node_check(node, content, ".mjs")  # ES module syntax
+    if not returncode:
+        return []
+
+    # stderr starts with "<path>:<line>", then the source line, a caret and "SyntaxError: ..."
+    lines = stderr.splitlines()
+    line_no = None
+    if lines and ":" in lines[0]:
+        tail = lines[0].rsplit(":", 1)[1]
+        line_no = int(tail) if tail.isdigit() else None
+    message = next((l for l in lines if "Error" in l), lines[-1] if lines else "node --check failed")
+    return [_diagnostic(filename, line_no, None, message.strip(), "node")]
+
+class _TagBalanceParser(HTMLParser):
+    """Tracks open elements and reports stray or unclosed tags."""
+
+    def __init__(self, filename):
+        super().__init__(convert_charrefs=True)
+        self.filename = filename
+        self.stack = []
+        self.diagnostics = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in VOID_ELEMENTS:
+            self.stack.append((tag, self.getpos()[0]))
+
+    def handle_endtag(self, tag):
+        if tag in VOID_ELEMENTS:
+            return
+        if not any(open_tag == tag for open_tag, _ in self.stack):
+            self.diagnostics.append(_diagnostic(self.filename, self.getpos()[0], None,
+                                                f"</{tag}> has no matching <{tag}>", "html"))
+            return
+        while self.stack:
+            open_tag, line = self.stack.pop()
+            if open_tag == tag:
+                break
+            self._unclosed(open_tag, line)
+
+    def _unclosed(self, tag, line):
+        if tag not in OPTIONAL_CLOSE:
+            self.diagnostics.append(_diagnostic(self.filename, line, None, f"<{tag}> is never closed", "html"))
+
+    def finish(self):
+        self.close()
+        while self.stack:
+            self._unclosed(*self.stack.pop())
+        return self.diagnostics
+
+def check_html(filename, content):
+    parser = _TagBalanceParser(filename)
+    parser.feed(content)
+    return parser.finish()
+
+def check_json(filename, content):
+    try:
+        json.loads(content)
+        return []
+    except ValueError as e:
+        return [_diagnostic(filename, getattr(e, "lineno", None), getattr(e, "colno", None), str(e), "json")]
+
+def validate_file(filename, content, node=None):
+    """Check one file. Returns (diagnostics, checked) - checked is False for languages with no local checker."""
+    ext = os.path.splitext(filename)[1].lower()
+    ext = LANGUAGE_EXTENSIONS.get(ext, ext)
+    if ext == ".py":
+        return check_python(filename, content), True
+    if ext in (".js", ".mjs", ".cjs"):
+        if node:
+            try:
+                return check_javascript(filename, content, node), True
+            except (OSError, subprocess.TimeoutExpired):
+                pass  # Node unusable for this file - leave it to the model review
+        return [], False
+    if ext in (".html", ".htm"):
+        return check_html(filename, content), True
+    if ext == ".json":
+        return check_json(filename, content), True
+    return [], ext in NON_CODE
+
+def validate_files(files, max_workers=MAX_WORKERS):
+    """Check every {filename: content} in parallel.
+
+    Returns {"files", "errors", "warnings", "unchecked"} where errors and
+    warnings are diagnostic dicts and unchecked lists code files no local
+    checker covers.
+    """
+    node = shutil.which("node")
+    report = {"files": len(files), "errors": [], "warnings": [], "unchecked": []}
+    if not files:
+        return report
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(files))) as pool:
+        results = pool.map(lambda item: validate_file(item[0], item[1], node), files.items())
+        for filename, (diagnostics, checked) in zip(files, results):
+            if not checked:
+                report["unchecked"].append(filename)
+            for diagnostic in diagnostics:
+                key = "errors" if diagnostic["severity"] == "error" else "warnings"
+                report[key].append(diagnostic)
+    return report
+
+def format_diagnostics(report, limit=20):
+    """Render a report as compact "file:line:col severity message" lines for a prompt."""
+    lines = []
+    for d in (report["errors"] + report["warnings"])[:limit]:
+        location = ":".join(str(part) for part in (d["file"], d["line"], d["column"]) if part is not None)
+        lines.append(f"{location} {d['severity']} [{d['tool']}] {d['message']}")
+    hidden = len(report["errors"]) + len(report["warnings"]) - len(lines)
+    if hidden > 0:
+        lines.append(f"... and {hidden} more")
+    if report["unchecked"]:
+        lines.append(f"Not checked locally: {', '.join(report['unchecked'])}")
+    return "\n".join(lines)
@@ -3,37 +3,16 @@ Documentation Generator - Creates comprehensive documentation for projects.
 """
 
 import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from project_analyzer import ProjectAnalyzer
-from gemini_client import call_gemini
+from gemini_client import call_gemini, stream_gemini, register_prefix
 from model_router import choose_model
+from token_usage import bind
 
-def generate_project_documentation(project_path: str, output_file: str = "PROJECT_DOCUMENTATION.md"):
-    """Generate comprehensive documentation for a project."""
-    
-    # Analyze the project
-    analyzer = ProjectAnalyzer(project_path)
-    analysis = analyzer.analyze()
-    summary = analyzer.generate_summary()
-    
-    # Read key files for context
-    key_files_content = _read_key_files(project_path, analysis)
-    
-    # Generate documentation using AI
-    model = choose_model("complex")
-    
-    prompt = f"""
-Analyze this project and create comprehensive documentation.
-
-PROJECT ANALYSIS:
-{summary}
-
-KEY FILES CONTENT:
-{key_files_content}
-
-Create a detailed PROJECT_DOCUMENTATION.md file that includes:
-
-1. **Project Overview**
+DOCUMENTATION_OUTLINE = """1. **Project Overview**
    - What the project does
    - Main features and functionality
    - Technology stack
@@ -68,19 +47,75 @@ Create a detailed PROJECT_DOCUMENTATION.md file that includes:
 
 8. **Troubleshooting**
    - Common issues
-   - Solutions
+   - Solutions"""
 
-Format the output as a complete markdown document ready to save.
-"""
-    
-    system = """You are a Technical Documentation Expert. Create clear, comprehensive, and professional documentation.
+SYSTEM = """You are a Technical Documentation Expert. Create clear, comprehensive, and professional documentation.
 Focus on making it useful for developers who need to understand, use, or contribute to the project."""
+
+# Projects with more files than this are documented directory by directory
+HIERARCHICAL_FILE_THRESHOLD = 30
+DOC_CACHE_DIR = ".doc_cache"
+MAX_DIRECTORY_CHARS = 40000
+
+def generate_project_documentation(project_path: str, output_file: str = "PROJECT_DOCUMENTATION.md",
+                                   hierarchical: bool = None, max_workers: int = 4,
+                                   stream: bool = False, on_chunk=None, cancel=None):
+    """Generate comprehensive documentation for a project.
+    
+    Args:
+        project_path: Project to document
+        output_file: File name written inside the project folder
+        hierarchical: Document each directory separately and merge the results.
+            Defaults to True for projects above HIERARCHICAL_FILE_THRESHOLD files.
+        max_workers: Parallel model calls for the per-directory step
+        stream: Stream the final document to disk as it is generated. A failed
+            run leaves `<output_file>.partial` behind, which the next streamed
+            run continues from instead of starting over, as long as the
+            project's source files and the model are unchanged.
+        on_chunk: Optional callback receiving each streamed chunk
+        cancel: Optional CancelToken passed to every model call
+    """
     
+    # Analyze the project
+    analyzer = ProjectAnalyzer(project_path)
+    analysis = analyzer.analyze()
+    summary = analyzer.generate_summary()
+    
+    # Generate documentation using AI
+    model = choose_model("complex")
+    
+    if hierarchical is None:
+        hierarchical = len(analysis['files']) > HIERARCHICAL_FILE_THRESHOLD
+    
+    # Registered once as a cached prefix (see gemini_client.PrefixCache), shared by every call below
+    context = f"PROJECT ANALYSIS:\n{summary}"
     try:
-        documentation = call_gemini(prompt, system, model)
+        if hierarchical:
+            prefix = register_prefix(model, SYSTEM, context)
+            sections = _document_directories(project_path, analysis, model, max_workers, cancel, prefix)
+            prompt = _merge_prompt(sections)
+        else:
+            # Read key files for context
+            context += f"\n\nKEY FILES CONTENT:\n{_read_key_files(project_path, analysis)}"
+            prefix = register_prefix(model, SYSTEM, context)
+            prompt = f"""
+Analyze this project (described above) and create comprehensive documentation.
+
+Create a detailed PROJECT_DOCUMENTATION.md file that includes:
+
+{DOCUMENTATION_OUTLINE}
+
+Format the output as a complete markdown document ready to save.
+"""
+        output_path = os.path.join(project_path, output_file)
+        if stream:
+            key = _partial_key(project_path, analysis, model, hierarchical)
+            documentation = _stream_documentation(prompt, model, output_path, on_chunk, cancel, prefix, key)
+            return output_path, documentation
+        
+        documentation = call_gemini(prompt, SYSTEM, model, cancel=cancel, agent="documenter", prefix=prefix)
         
         # Save to project folder
-        output_path = os.path.join(project_path, output_file)
         with open(output_path, 'w', encoding='utf-8') as f:
             f.write(documentation)
         
@@ -107,6 +142,85 @@ This documentation was automatically generated. For more details, please review
         
         return output_path, basic_doc
 
+def _partial_key(project_path: str, analysis: dict, model: str, hierarchical: bool) -> str:
+    """Identify what a streamed document is generated from: the model, the mode and the source files.
+    
+    Not the prompt or the analysis summary: a failed run writes the fallback
+    document and the orchestrator SUMMARY.md, which change the summary's
+    counts but not the code being documented.
+    """
+    source_hash = _directory_hash(project_path, "", [f['path'] for f in analysis.get('files', [])])
+    key = "\0".join((model, SYSTEM, "hierarchical" if hierarchical else "single", source_hash))
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+def _stream_documentation(prompt: str, model: str, output_path: str, on_chunk=None, cancel=None,
+                          prefix: str = None, key: str = "") -> str:
+    """Stream the document into `<output_path>.partial` and rename it into place when complete.
+    
+    The partial file is fsynced at every markdown heading so an interrupted run
+    keeps all finished sections. If a partial file already exists and was
+    generated from the same inputs (its key file holds the same key, see
+    _partial_key), generation continues from where it stopped; otherwise it
+    starts over.
+    """
+    partial_path = output_path + ".partial"
+    key_path = partial_path + ".key"
+    
+    existing = ""
+    if os.path.exists(partial_path):
+        try:
+            with open(key_path, 'r', encoding='utf-8') as f:
+                stored_key = f.read().strip()
+        except OSError:
+            stored_key = None
+        if stored_key == key:
+            with open(partial_path, 'r', encoding='utf-8', errors='ignore') as f:
+                existing = f.read()
+        else:
+            os.remove(partial_path)  # Written for other source files or another model
+    with open(key_path, 'w', encoding='utf-8') as f:
+        f.write(key)
+    if existing.strip():
+        prompt = f"""{prompt}
+
+The document below was interrupted part-way through. Continue writing it from exactly
+where it stops. Do not repeat any text that is already there and do not restart the document.
+
+DOCUMENT SO FAR (last part):
+{existing[-8000:]}
+"""
+    
+    with open(partial_path, 'a', encoding='utf-8') as f:
+        attempt_start = f.tell()
+        
+        def restart(attempt, error):
+            # The client restarted the response - drop the failed attempt's output
+            f.truncate(attempt_start)
+            f.seek(attempt_start)
+        
+        for chunk in stream_gemini(prompt, SYSTEM, model, cancel=cancel, agent="documenter", prefix=prefix,
+                                   on_retry=restart):
+            f.write(chunk)
+            if on_chunk:
+                on_chunk(chunk)
+            
+            # Section boundary - make everything written so far durable
+            if "\n#" in chunk or chunk.startswith("#"):
+                f.flush()
+                os.fsync(f.fileno())
+        
+        f.flush()
+        os.fsync(f.fileno())
+    
+    os.replace(partial_path, output_path)
+    try:
+        os.remove(key_path)
+    except OSError:
+        pass
+    
+    with open(output_path, 'r', encoding='utf-8') as f:
+        return f.read()
+
 def _read_key_files(project_path: str, analysis: dict, max_files: int = 10) -> str:
     """Read content from key files for context."""
     key_files = []
@@ -142,6 +256,132 @@ def _read_key_files(project_path: str, analysis: dict, max_files: int = 10) -> s
     
     return content
 
+def _group_files_by_directory(analysis: dict, depth: int = 1) -> dict:
+    """Group analyzed files by their directory, truncated to `depth` path components."""
+    groups = {}
+    for file_info in analysis.get('files', []):
+        parts = Path(file_info['path']).parent.parts[:depth]
+        directory = "/".join(parts) if parts else "."
+        groups.setdefault(directory, []).append(file_info['path'])
+    return groups
+
+def _directory_hash(project_path: str, directory: str, file_paths: list) -> str:
+    """Hash a directory's file names and contents so unchanged directories reuse cached docs."""
+    digest = hashlib.sha256(directory.encode('utf-8'))
+    for file_path in sorted(file_paths):
+        digest.update(file_path.encode('utf-8'))
+        try:
+            with open(os.path.join(project_path, file_path), 'rb') as f:
+                digest.update(f.read())
+        except OSError:
+            digest.update(b"<unreadable>")
+    return digest.hexdigest()
+
+def _read_directory_files(project_path: str, file_paths: list) -> str:
+    """Read the files of one directory, capped per file and per directory."""
+    content = ""
+    for file_path in sorted(file_paths):
+        if len(content) >= MAX_DIRECTORY_CHARS:
+            content += f"\n\n=== {file_path} ===\n(omitted - directory content limit reached)\n"
+            continue
+        try:
+            with open(os.path.join(project_path, file_path), 'r', encoding='utf-8', errors='ignore') as f:
+                file_content = f.read()
+            if len(file_content) > 5000:
+                file_content = file_content[:5000] + "\n... (truncated)"
+            content += f"\n\n=== {file_path} ===\n{file_content}\n"
+        except Exception as e:
+            content += f"\n\n=== {file_path} ===\n[Could not read: {str(e)}]\n"
+    return content
+
+def _document_directory(project_path: str, directory: str, file_paths: list, dir_hash: str, model: str,
+                        cancel=None, prefix: str = None) -> str:
+    """Map step: document a single directory, reusing the cached result when its hash matches."""
+    cache_dir = os.path.join(project_path, DOC_CACHE_DIR)
+    cache_path = os.path.join(cache_dir, f"{dir_hash}.json")
+    
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)["documentation"]
+        except (OSError, ValueError, KeyError):
+            pass  # Corrupt cache entry - regenerate
+    
+    prompt = f"""
+Document the `{directory}` directory of the project described above.
+
+FILES:
+{_read_directory_files(project_path, file_paths)}
+
+Write a concise markdown section (at most 400 words) covering:
+- The purpose of this directory
+- Key files, classes and functions and what they do
+- How it interacts with the rest of the project
+- Any setup, configuration or usage notes specific to it
+
+Do not add a document title - this section will be merged into the full project documentation.
+"""
+    documentation = call_gemini(prompt, SYSTEM, model, cancel=cancel, agent="documenter", prefix=prefix)
+    
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        json.dump({"directory": directory, "hash": dir_hash, "documentation": documentation}, f)
+    
+    return documentation
+
+def _document_directories(project_path: str, analysis: dict, model: str, max_workers: int = 4,
+                          cancel=None, prefix: str = None) -> dict:
+    """Run the map step over every directory in parallel and prune stale cache entries."""
+    groups = _group_files_by_directory(analysis)
+    hashes = {d: _directory_hash(project_path, d, paths) for d, paths in groups.items()}
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            directory: pool.submit(bind(_document_directory), project_path, directory, file_paths,
+                                   hashes[directory], model, cancel, prefix)
+            for directory, file_paths in groups.items()
+        }
+        sections = {}
+        for directory, future in futures.items():
+            try:
+                sections[directory] = future.result()
+            except Exception as e:
+                file_list = "\n".join(f"- `{p}`" for p in sorted(groups[directory]))
+                sections[directory] = f"[Could not document directory: {str(e)}]\n\n{file_list}"
+    
+    # Drop cache entries for directories that no longer exist or have changed
+    cache_dir = os.path.join(project_path, DOC_CACHE_DIR)
+    if os.path.isdir(cache_dir):
+        current = {f"{h}.json" for h in hashes.values()}
+        for name in os.listdir(cache_dir):
+            if name not in current:
+                try:
+                    os.remove(os.path.join(cache_dir, name))
+                except OSError:
+                    pass
+    
+    return dict(sorted(sections.items()))
+
+def _merge_prompt(sections: dict) -> str:
+    """Reduce step prompt: merge per-directory sections into one document.
+    
+    The project analysis is not repeated here; it is the cached context prefix.
+    """
+    sections_text = "\n\n".join(f"### Directory: {d}\n{doc}" for d, doc in sections.items())
+    return f"""
+Merge the following per-directory documentation into one comprehensive project document.
+
+DIRECTORY DOCUMENTATION:
+{sections_text}
+
+Create a detailed PROJECT_DOCUMENTATION.md file that includes:
+
+{DOCUMENTATION_OUTLINE}
+
+Use the directory documentation for the Architecture and File Structure sections.
+Format the output as a complete markdown document ready to save.
+"""
+
 def create_summary_md(project_path: str, task: str = "") -> str:
     """Create a quick summary markdown file."""
     analyzer = ProjectAnalyzer(project_path)
@@ -4,15 +4,23 @@ File Manager - Handles project creation, file extraction, and execution.
 
 import os
 import re
-import subprocess
+import json
 import shutil
+import hashlib
+import tempfile
+import subprocess
 from datetime import datetime
 from pathlib import Path
+from project_runner import start_project_run
+from output_buffer import OutputBuffer
+from renderer import get_renderer
 
 PROJECTS_DIR = "projects"
+# Sizes and hashes of the files written to a project
+MANIFEST_FILE = ".manifest.json"
 
-def create_project_folder(task_name):
-    """Create a project folder with a sanitized name."""
+def _project_paths(task_name):
+    """Yield candidate project paths for a task: <name>_<timestamp>, then with -2, -3, ... appended."""
     # Sanitize task name for folder name
     safe_name = re.sub(r'[^\w\s-]', '', task_name)
     safe_name = re.sub(r'[-\s]+', '-', safe_name)
@@ -20,15 +28,47 @@ def create_project_folder(task_name):
     
     # Add timestamp to avoid conflicts
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    folder_name = f"{safe_name}_{timestamp}"
-    
-    project_path = os.path.join(PROJECTS_DIR, folder_name)
-    os.makedirs(project_path, exist_ok=True)
-    
-    return project_path, folder_name
+    project_path = os.path.join(PROJECTS_DIR, f"{safe_name}_{timestamp}")
+    yield project_path
+    suffix = 1
+    while True:
+        suffix += 1
+        yield f"{project_path}-{suffix}"
+
+def create_project_folder(task_name):
+    """Create a project folder with a sanitized name."""
+    os.makedirs(PROJECTS_DIR, exist_ok=True)
+    for project_path in _project_paths(task_name):
+        try:
+            os.mkdir(project_path)  # Fails if another run took the name first
+        except FileExistsError:
+            continue
+        return project_path, os.path.basename(project_path)
 
 def extract_code_blocks(text):
-    """Extract code blocks from markdown or plain text."""
+    """Extract code blocks from markdown or plain text.
+    
+    text may also be an OutputBuffer; one spilled to disk is scanned through
+    its mmap instead of being loaded into memory.
+    """
+    if isinstance(text, OutputBuffer):
+        if not text.spilled:
+            return _extract_code_blocks(text.getvalue())
+        with text.view() as view:
+            return _extract_code_blocks(view)
+    return _extract_code_blocks(text)
+
+def _extract_code_blocks(text):
+    # text is a str, or UTF-8 bytes (mmap / memoryview) scanned with bytes patterns
+    binary = not isinstance(text, str)
+    
+    def finditer(pattern, flags=0):
+        return re.finditer(pattern.encode() if binary else pattern, text, flags)
+    
+    def group(match, index):
+        value = match.group(index)
+        return value.decode("utf-8", "replace") if binary and value is not None else value
+    
     files = {}
     
     # Pattern 1: Markdown code blocks with language and filename
@@ -36,21 +76,21 @@ def extract_code_blocks(text):
     # code
     # ```
     pattern1 = r'```(\w+)?:?([^\n]+)?\n(.*?)```'
-    matches1 = re.finditer(pattern1, text, re.DOTALL)
+    matches1 = finditer(pattern1, re.DOTALL)
     for match in matches1:
-        lang = match.group(1) or 'text'
-        filename = match.group(2) or f'code.{lang}'
-        code = match.group(3).strip()
+        lang = group(match, 1) or 'text'
+        filename = group(match, 2) or f'code.{lang}'
+        code = group(match, 3).strip()
         filename = filename.strip().strip('`').strip()
         if filename and code:
             files[filename] = code
     
     # Pattern 2: Standard markdown code blocks
     pattern2 = r'```(\w+)?\n(.*?)```'
-    matches2 = re.finditer(pattern2, text, re.DOTALL)
+    matches2 = finditer(pattern2, re.DOTALL)
     for match in matches2:
-        lang = match.group(1) or 'text'
-        code = match.group(2).strip()
+        lang = group(match, 1) or 'text'
+        code = group(match, 2).strip()
         if code and not any(code in f for f in files.values()):
             # Try to infer filename from language
             ext_map = {
@@ -75,40 +115,121 @@ def extract_code_blocks(text):
     # Pattern 3: Look for file creation patterns in text
     # "Create file X with content:"
     file_pattern = r'(?:create|save|write|file|filename|path)[\s:]+([^\s\n]+\.\w+)[\s\n]+(?:with|content|code|below)[\s:]*\n(.*?)(?=\n\n|\n[A-Z]|\Z)'
-    matches3 = re.finditer(file_pattern, text, re.IGNORECASE | re.DOTALL)
+    matches3 = finditer(file_pattern, re.IGNORECASE | re.DOTALL)
     for match in matches3:
-        filename = match.group(1).strip()
-        content = match.group(2).strip()
+        filename = group(match, 1).strip()
+        content = group(match, 2).strip()
         if filename and content and filename not in files:
             files[filename] = content
     
     # Pattern 4: HTML files (often standalone)
-    if '<!DOCTYPE html>' in text or '<html' in text:
-        html_match = re.search(r'(<!DOCTYPE html>.*?</html>)', text, re.DOTALL | re.IGNORECASE)
+    if next(finditer(r'<!DOCTYPE html>|<html'), None):
+        html_match = next(finditer(r'(<!DOCTYPE html>.*?</html>)', re.DOTALL | re.IGNORECASE), None)
         if html_match:
             if 'index.html' not in files:
-                files['index.html'] = html_match.group(1).strip()
+                files['index.html'] = group(html_match, 1).strip()
     
     return files
 
-def save_files_to_project(project_path, code_output):
-    """Extract code from output and save to project folder."""
-    files = extract_code_blocks(code_output)
+def safe_relative_path(filename):
+    """Turn a generated filename into a relative POSIX path inside the project.
+    
+    Leading slashes, drive letters and "." segments are dropped; a path that
+    tries to climb out with ".." falls back to its base name.
+    """
+    path = filename.strip().replace("\\", "/")
+    if re.match(r'^[A-Za-z]:', path):
+        path = path[2:]
+    parts = [p for p in path.split("/") if p not in ("", ".")]
+    if ".." in parts:
+        parts = parts[-1:]
+    if not parts or parts[-1] == "..":
+        return None
+    return "/".join(parts)
+
+def _file_entry(data):
+    return {"size": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+
+def _fsync_dir(path):
+    """Make renames and new entries in a directory durable (not supported on Windows)."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def load_manifest(project_path):
+    """Return {relative path: {"size", "sha256"}} from a project's manifest, or {}."""
+    try:
+        with open(os.path.join(project_path, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f).get("files", {})
+    except (OSError, ValueError):
+        return {}
+
+def _write_manifest(project_path, entries):
+    manifest = {"generated": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "files": dict(sorted(entries.items()))}
+    tmp_path = os.path.join(project_path, MANIFEST_FILE + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(project_path, MANIFEST_FILE))
+
+def write_project_files(project_path, files):
+    """Write {relative path: content} into a project and update its manifest.
+    
+    Files whose size and hash match the manifest (and are still on disk) are
+    skipped. Changed files are written to a temporary name, fsynced together
+    and then renamed into place, so a failure never leaves a half-written file.
+    Returns (written, skipped) lists of relative paths.
+    """
+    manifest = load_manifest(project_path)
+    written, skipped, pending = [], [], []
     
-    saved_files = []
     for filename, content in files.items():
-        # Clean filename
-        filename = os.path.basename(filename)  # Remove any path
-        file_path = os.path.join(project_path, filename)
+        rel_path = safe_relative_path(filename)
+        if not rel_path:
+            continue
+        data = content.encode('utf-8')
+        entry = _file_entry(data)
+        file_path = os.path.join(project_path, *rel_path.split("/"))
+        
+        if manifest.get(rel_path) == entry and os.path.isfile(file_path) and os.path.getsize(file_path) == entry["size"]:
+            skipped.append(rel_path)
+            continue
         
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(content)
-            saved_files.append(filename)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            tmp_path = file_path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            pending.append((tmp_path, file_path))
+            manifest[rel_path] = entry
+            written.append(rel_path)
         except Exception as e:
-            print(f"Error saving {filename}: {e}")
+            get_renderer().write(f"Error saving {rel_path}: {e}\n")
+    
+    # One durability pass for the whole batch, then the renames
+    for tmp_path, _ in pending:
+        with open(tmp_path, 'rb+') as f:
+            os.fsync(f.fileno())
+    for tmp_path, file_path in pending:
+        os.replace(tmp_path, file_path)
+    for directory in {os.path.dirname(file_path) for _, file_path in pending}:
+        _fsync_dir(directory)
     
-    return saved_files
+    _write_manifest(project_path, manifest)
+    return written, skipped
+
+def save_files_to_project(project_path, code_output):
+    """Extract code from output and save to project folder."""
+    written, skipped = write_project_files(project_path, extract_code_blocks(code_output))
+    return written + skipped
 
 def create_readme(project_path, task, summary=""):
     """Create a README.md for the project."""
@@ -132,88 +253,91 @@ This project was automatically generated by the Gemini Multi-Agent CLI System.
         f.write(readme_content)
     return readme_path
 
-def run_project(project_path):
-    """Attempt to run the project based on file types."""
-    files = os.listdir(project_path)
+def open_in_browser(project_path, sink=None):
+    """Open the project's first HTML file in the default browser; returns True if there was one.
     
-    # Check for HTML file
+    Messages go to sink (e.g. the task's), or the process-wide renderer.
+    """
+    sink = sink or get_renderer()
+    files = sorted(os.listdir(project_path))
     html_files = [f for f in files if f.endswith('.html')]
-    if html_files:
-        html_file = html_files[0]
-        html_path = os.path.join(project_path, html_file)
-        # Silent execution
-        try:
-            # Try to open in default browser
-            if shutil.which('xdg-open'):
-                subprocess.Popen(['xdg-open', html_path])
-            elif shutil.which('open'):
-                subprocess.Popen(['open', html_path])
-            elif shutil.which('start'):
-                subprocess.Popen(['start', html_path], shell=True)
-            else:
-                print(f"Please open {html_path} in your browser")
-            return True
-        except Exception as e:
-            print(f"Could not open browser: {e}")
-            print(f"Please open {html_path} manually in your browser")
-            return True
-    
-    # Check for Python file
-    py_files = [f for f in files if f.endswith('.py')]
-    if py_files:
-        py_file = py_files[0]
-        py_path = os.path.join(project_path, py_file)
-        try:
-            result = subprocess.run(['python3', py_path], 
-                                  cwd=project_path, 
-                                  capture_output=True, 
-                                  text=True, 
-                                  timeout=30)
-            if result.stdout:
-                print(result.stdout)
-            if result.stderr:
-                print(result.stderr)
-            return result.returncode == 0
-        except Exception as e:
-            print(f"Error running Python: {e}")
-            return False
-    
-    # Check for Node.js/JavaScript
-    js_files = [f for f in files if f.endswith('.js') and not f.endswith('.min.js')]
-    if js_files:
-        js_file = js_files[0]
-        js_path = os.path.join(project_path, js_file)
-        try:
-            result = subprocess.run(['node', js_path], 
-                                  cwd=project_path, 
-                                  capture_output=True, 
-                                  text=True, 
-                                  timeout=30)
-            if result.stdout:
-                print(result.stdout)
-            if result.stderr:
-                print(result.stderr)
-            return result.returncode == 0
-        except Exception as e:
-            print(f"Error running Node.js: {e}")
-            return False
+    if not html_files:
+        return False
     
-    return False
+    html_path = os.path.join(project_path, html_files[0])
+    # Silent execution
+    try:
+        # Try to open in default browser
+        if shutil.which('xdg-open'):
+            subprocess.Popen(['xdg-open', html_path])
+        elif shutil.which('open'):
+            subprocess.Popen(['open', html_path])
+        elif shutil.which('start'):
+            subprocess.Popen(['start', html_path], shell=True)
+        else:
+            sink.write(f"Please open {html_path} in your browser\n")
+    except Exception as e:
+        sink.write(f"Could not open browser: {e}\nPlease open {html_path} manually in your browser\n")
+    return True
 
-def setup_project(task, code_output, summary=""):
-    """Complete project setup: create folder, save files, create README."""
-    project_path, folder_name = create_project_folder(task)
+def run_project(project_path):
+    """Attempt to run the project based on file types.
+    
+    HTML projects open in the browser; Python/Node entry points and tests run
+    in parallel in the sandboxed runner (see project_runner).
+    """
+    opened = open_in_browser(project_path)
+    renderer = get_renderer()
+    summary = start_project_run(project_path, on_output=lambda target, text: renderer.write(text)).result()
+    renderer.flush()
+    if opened and not summary["targets"]:
+        return True
+    return summary["success"]
+
+def _stage_project(task, files, summary):
+    """Write a new project into a staging folder and rename it into projects/ when complete.
     
-    # Silent project creation - no verbose output
-    saved_files = save_files_to_project(project_path, code_output)
+    The rename is atomic, so projects/ never contains a half-written project;
+    an interrupted run leaves only a hidden .staging-* folder behind.
+    """
+    os.makedirs(PROJECTS_DIR, exist_ok=True)
+    staging_path = tempfile.mkdtemp(prefix=".staging-", dir=PROJECTS_DIR)
+    try:
+        saved_files, _ = write_project_files(staging_path, files)
+        create_readme(staging_path, task, summary)
+        _fsync_dir(staging_path)
+        
+        for project_path in _project_paths(task):
+            if os.path.exists(project_path):
+                continue
+            try:
+                os.rename(staging_path, project_path)
+                break
+            except OSError:
+                if not os.path.exists(project_path):
+                    raise
+                # A concurrent run of the same task took this name since the check
+        _fsync_dir(PROJECTS_DIR)
+        return project_path, saved_files
+    except Exception:
+        shutil.rmtree(staging_path, ignore_errors=True)
+        raise
+
+def setup_project(task, code_output, summary="", project_path=None):
+    """Complete project setup: create folder, save files, create README.
     
-    if not saved_files:
+    With an existing project_path (e.g. when resuming a run) the project is
+    updated in place and files identical to its manifest are not rewritten.
+    """
+    files = {name: content for name, content in extract_code_blocks(code_output).items()
+             if safe_relative_path(name)}
+    if not files:
         # Save full output if no files detected
-        output_path = os.path.join(project_path, "output.txt")
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(code_output)
-        saved_files = ["output.txt"]
+        files = {"output.txt": code_output}
     
-    create_readme(project_path, task, summary)
+    if project_path and os.path.isdir(project_path):
+        written, skipped = write_project_files(project_path, files)
+        create_readme(project_path, task, summary)
+        return project_path, written + skipped
     
-    return project_path, saved_files
+    return _stage_project(task, files, summary)
@@ -1,6 +1,13 @@
 import os
+import time
+import hashlib
+import datetime
+import threading
 import warnings
+from collections import OrderedDict
 from dotenv import load_dotenv
+from token_usage import record_call, estimate_tokens
+from generation_profiles import generation_config_for
 
 # Suppress deprecation warning - google.generativeai still works
 # Use simplefilter to catch all FutureWarnings from this module
@@ -28,7 +35,254 @@ if not api_key:
 
 genai.configure(api_key=api_key)
 
-def stream_gemini(prompt, system, model, max_retries=3, fallback_on_quota=True):
+class RateLimiter:
+    """Token bucket shared by all threads, limiting model requests per minute."""
+    
+    def __init__(self, requests_per_minute=0):
+        self.lock = threading.Lock()
+        self.set_rate(requests_per_minute)
+    
+    def set_rate(self, requests_per_minute):
+        with self.lock:
+            self.rate = requests_per_minute / 60.0
+            self.capacity = max(1.0, requests_per_minute / 60.0)
+            self.tokens = self.capacity
+            self.updated = time.monotonic()
+    
+    def acquire(self, cancel=None):
+        """Wait until a request may be sent (no-op when the rate is 0)."""
+        while True:
+            with self.lock:
+                if self.rate <= 0:
+                    return
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            if cancel:
+                cancel.sleep(wait)
+            else:
+                time.sleep(wait)
+
+# Global request limit, e.g. GEMINI_MAX_RPM=60 (0 = unlimited)
+rate_limiter = RateLimiter(int(os.getenv("GEMINI_MAX_RPM", "0")))
+
+def set_rate_limit(requests_per_minute):
+    """Limit model requests per minute across all threads (0 disables the limit)."""
+    rate_limiter.set_rate(requests_per_minute)
+
+def _request_options(cancel):
+    """Bound the request by the token's deadline so a stalled call can't outlive it."""
+    remaining = cancel.remaining() if cancel else None
+    if remaining is None:
+        return None
+    return {"timeout": max(1.0, remaining)}
+
+# Prefix caching: "auto" uses server-side context caching for prefixes registered with
+# register_prefix that are large enough to qualify and the local cache otherwise,
+# "local" never creates server caches, "off" disables it
+PREFIX_CACHE = os.getenv("GEMINI_PREFIX_CACHE", "auto")
+PREFIX_CACHE_TTL = int(os.getenv("GEMINI_PREFIX_CACHE_TTL", "600"))
+# Smallest prefix (in tokens) the API accepts for a context cache
+SERVER_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CACHE_MIN_TOKENS", "4096"))
+PREFIX_CACHE_MAX_ENTRIES = 128
+
+class PrefixCache:
+    """Registers stable prompt prefixes (system instruction plus optional context) once.
+    
+    Each prefix gets a handle. Large prefixes registered for reuse (register_prefix)
+    are stored server-side with the API's context caching, so later calls send
+    only the new part of the prompt; the rest keep a ready model object locally.
+    Entries expire after their TTL (server caches are deleted when evicted) and
+    hit rates are tracked.
+    """
+    
+    def __init__(self, mode=PREFIX_CACHE, ttl=PREFIX_CACHE_TTL, max_entries=PREFIX_CACHE_MAX_ENTRIES):
+        self.mode = mode
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # Models the API refused to create a context cache for
+        self.server_unsupported = set()
+        self.counts = {"hits": 0, "misses": 0, "server_hits": 0, "expired": 0, "evicted": 0}
+    
+    @staticmethod
+    def handle_for(model_name, system, context=""):
+        key = "\0".join((model_name, system or "", context or ""))
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+    
+    def register(self, model_name, system, context="", ttl=None, shared=False):
+        """Make a prefix available and return its handle (creating the cache only if needed).
+        
+        Only shared prefixes (explicitly registered for reuse) may get a server cache;
+        creating one for a prefix sent once costs storage and latency for nothing.
+        """
+        handle = self.handle_for(model_name, system, context)
+        with self.lock:
+            entry = self.entries.get(handle)
+            if entry and entry["expires_at"] > time.monotonic() and (entry["shared"] or not shared):
+                return handle
+        entry = self._create(model_name, system, context, ttl or self.ttl, shared)
+        with self.lock:
+            if handle in self.entries:
+                self.counts["expired"] += 1
+                self._release(self.entries.pop(handle))
+            self.entries[handle] = entry
+            while len(self.entries) > self.max_entries:
+                self.counts["evicted"] += 1
+                self._release(self.entries.popitem(last=False)[1])
+        return handle
+    
+    def prepare(self, model_name, system, context, prompt):
+        """Return (model, contents) for a request, reusing the cached prefix when there is one."""
+        if self.mode == "off":
+            model = genai.GenerativeModel(model_name=model_name, system_instruction=system)
+            return model, _join_context(context, prompt)
+        handle = self.handle_for(model_name, system, context)
+        with self.lock:
+            entry = self.entries.get(handle)
+            live = entry is not None and entry["expires_at"] > time.monotonic()
+            if live:
+                self.counts["hits"] += 1
+                self.counts["server_hits"] += entry["server"] is not None
+                entry["uses"] += 1
+                if entry["server"] is None:
+                    entry["expires_at"] = time.monotonic() + entry["ttl"]  # Local entries slide
+                self.entries.move_to_end(handle)
+            else:
+                self.counts["misses"] += 1
+                shared = entry is not None and entry["shared"]  # An expired registration is renewed
+        if not live:
+            self.register(model_name, system, context, shared=shared)
+            with self.lock:
+                entry = self.entries.get(handle)
+                if entry is None:  # Evicted by a concurrent registration
+                    entry = self._create(model_name, system, context, self.ttl, shared)
+                entry["uses"] += 1
+        if entry["server"] is not None:
+            return entry["model"], prompt  # The context is already part of the cached content
+        return entry["model"], _join_context(context, prompt)
+    
+    def lookup(self, handle):
+        """Return (model_name, system, context) for a registered handle, or None."""
+        with self.lock:
+            entry = self.entries.get(handle)
+            return (entry["model_name"], entry["system"], entry["context"]) if entry else None
+    
+    def _create(self, model_name, system, context, ttl, shared=False):
+        server = None
+        model = None
+        if (shared and self.mode == "auto" and model_name not in self.server_unsupported
+                and hasattr(genai, "caching") and estimate_tokens((system or "") + (context or "")) >= SERVER_CACHE_MIN_TOKENS):
+            try:
+                server = genai.caching.CachedContent.create(
+                    model=model_name,
+                    system_instruction=system,
+                    contents=[context] if context else None,
+                    ttl=datetime.timedelta(seconds=ttl)
+                )
+                model = genai.GenerativeModel.from_cached_content(cached_content=server)
+            except Exception as e:
+                # Keep this prefix local; only a definite refusal disables the model,
+                # transient and quota errors leave the next registration free to try again
+                if _cache_unsupported(e):
+                    self.server_unsupported.add(model_name)
+                server = None
+        if model is None:
+            model = genai.GenerativeModel(model_name=model_name, system_instruction=system)
+        return {"model_name": model_name, "system": system, "context": context, "model": model,
+                "server": server, "shared": shared, "ttl": ttl, "expires_at": time.monotonic() + ttl,
+                "created_at": time.time(), "uses": 0}
+    
+    @staticmethod
+    def _release(entry):
+        if entry["server"] is not None:
+            try:
+                entry["server"].delete()
+            except Exception:
+                pass  # The server drops it when its TTL runs out anyway
+    
+    def stats(self):
+        """Entry counts, hits and misses since start, and the hit rate."""
+        with self.lock:
+            now = time.monotonic()
+            live = [e for e in self.entries.values() if e["expires_at"] > now]
+            counts = dict(self.counts)
+        lookups = counts["hits"] + counts["misses"]
+        return {
+            "mode": self.mode,
+            "entries": len(live),
+            "server_entries": sum(e["server"] is not None for e in live),
+            **counts,
+            "hit_rate": round(counts["hits"] / lookups, 3) if lookups else 0.0
+        }
+    
+    def clear(self):
+        with self.lock:
+            entries = list(self.entries.values())
+            self.entries.clear()
+        for entry in entries:
+            self._release(entry)
+
+def _cache_unsupported(error):
+    """True if a context cache error says the model or API can't cache at all."""
+    if isinstance(error, (AttributeError, NotImplementedError)):
+        return True  # Old SDK or API version without caching
+    message = str(error).lower()
+    return any(phrase in message for phrase in ("not supported", "unsupported", "does not support"))
+
+def _join_context(context, prompt):
+    return f"{context}\n\n{prompt}" if context else prompt
+
+prefix_cache = PrefixCache()
+
+def register_prefix(model, system, context="", ttl=None):
+    """Register a stable prefix (system instruction plus context) and return its handle.
+    
+    Pass the handle as `prefix=` to stream_gemini/call_gemini instead of
+    resending system and context.
+    """
+    return prefix_cache.register(_model_name(model), system, context, ttl, shared=True)
+
+def prefix_cache_stats():
+    return prefix_cache.stats()
+
+def _model_name(model):
+    # Keep 'models/' prefix if present (newer API versions require it)
+    # If not present, add it for compatibility
+    return model if model.startswith('models/') else f"models/{model}"
+
+class TruncatedResponse(Exception):
+    """The response stopped at max_output_tokens, so its text is incomplete.
+    
+    Raised after the call is recorded (and, when streaming, after every chunk
+    was yielded); text holds what was generated. Not retried by the client,
+    since the same request would hit the same cap.
+    """
+    
+    def __init__(self, agent, model, text):
+        super().__init__(f"Response from {model} for {agent or 'the call'} was cut off at max_output_tokens")
+        self.text = text
+
+def _truncated(response):
+    """True if the first candidate finished because it reached max_output_tokens."""
+    candidates = getattr(response, "candidates", None) or []
+    reason = getattr(candidates[0], "finish_reason", None) if candidates else None
+    return getattr(reason, "name", None) == "MAX_TOKENS" or reason == 2  # FinishReason.MAX_TOKENS
+
+def _response_text(response):
+    """Text of the first candidate (response.text refuses responses with several candidates)."""
+    candidates = getattr(response, "candidates", None) or []
+    if len(candidates) > 1:
+        return "".join(getattr(part, "text", "") for part in candidates[0].content.parts)
+    return response.text
+
+def stream_gemini(prompt, system, model, max_retries=3, fallback_on_quota=True, cancel=None, agent=None,
+                  context="", prefix=None, generation_config=None, on_retry=None):
     """Stream Gemini response with retry logic and automatic fallback to free tier models.
     
     Args:
@@ -37,34 +291,66 @@ def stream_gemini(prompt, system, model, max_retries=3, fallback_on_quota=True):
         model: Initial model to use
         max_retries: Maximum retry attempts
         fallback_on_quota: If True, automatically fallback to free tier models on quota errors
+        cancel: Optional CancelToken; raises Cancelled between chunks once it fires
+        agent: Name the call's token usage is recorded under (see token_usage)
+        context: Stable text sent before the prompt and cached with the system instruction
+        prefix: Handle from register_prefix, replacing system and context
+        generation_config: Optional generation settings, e.g. a response_schema for JSON output,
+            merged over the agent's profile (see generation_profiles)
+        on_retry: Optional callback(attempt, error), called whenever the response restarts from
+            the beginning (a retry or a fallback model), so the chunks yielded so far are void.
+            Without it, retries and the final failure are announced in the stream as
+            "\n[Retry n/N...]" and "\n[Error: ...]" chunks for display.
     """
     from model_router import is_quota_error, get_fallback_model
     
+    if prefix:
+        registered = prefix_cache.lookup(prefix)
+        if registered is None:
+            raise ValueError(f"Unknown or evicted prefix handle: {prefix}")
+        model, system, context = registered
+    
+    generation_config = generation_config_for(agent, generation_config)
     current_model = model
     models_tried = []
+    error = None
+    prepared = {}  # Prefix set up once per model, not on every retry
     
     for attempt in range(max_retries * 2):  # Allow more attempts for fallback
+        if cancel:
+            cancel.check()
+        if attempt and on_retry is not None:
+            on_retry(attempt, error)
         try:
-            # Keep 'models/' prefix if present (newer API versions require it)
-            # If not present, add it for compatibility
-            if not current_model.startswith('models/'):
-                model_name = f"models/{current_model}"
-            else:
-                model_name = current_model
-            
-            # Silent model switch - no output needed
-            pass
-            
-            genai_model = genai.GenerativeModel(
-                model_name=model_name,
-                system_instruction=system
-            )
-            response = genai_model.generate_content(prompt, stream=True)
+            if current_model not in prepared:
+                prepared[current_model] = prefix_cache.prepare(_model_name(current_model), system, context, prompt)
+            genai_model, contents = prepared[current_model]
+            rate_limiter.acquire(cancel)
+            start = time.perf_counter()
+            response = genai_model.generate_content(contents, stream=True, generation_config=generation_config,
+                                                    request_options=_request_options(cancel))
+            parts = []
+            metadata = None
+            truncated = False
             for chunk in response:
-                if chunk.text:
-                    yield chunk.text
+                if cancel:
+                    cancel.check()  # Abandons the stream
+                # The final chunk carries the totals and the finish reason for the whole response
+                metadata = getattr(chunk, "usage_metadata", None) or metadata
+                truncated = truncated or _truncated(chunk)
+                text = _response_text(chunk)
+                if text:
+                    parts.append(text)
+                    yield text
+            record_call(agent, current_model, (system or "") + _join_context(context, prompt), "".join(parts),
+                        metadata, time.perf_counter() - start)
+            if truncated:
+                raise TruncatedResponse(agent, current_model, "".join(parts))
             return  # Success, exit retry loop
+        except TruncatedResponse:
+            raise
         except Exception as e:
+            error = e
             error_msg = str(e)
             models_tried.append(current_model)
             
@@ -87,17 +373,21 @@ def stream_gemini(prompt, system, model, max_retries=3, fallback_on_quota=True):
             # If model not found and no fallback available
             if "404" in error_msg or "not found" in error_msg.lower():
                 if attempt >= max_retries - 1:
-                    yield f"\n[Error: Model '{current_model}' not found. Please check available models.]"
+                    if on_retry is None:
+                        yield f"\n[Error: Model '{current_model}' not found. Please check available models.]"
                     raise Exception(f"Model '{current_model}' not found: {error_msg}")
             
             # If we've exhausted all retries and fallbacks
             if attempt >= max_retries - 1:
-                yield f"\n[Error: {error_msg} - Max retries reached]"
+                if on_retry is None:
+                    yield f"\n[Error: {error_msg} - Max retries reached]"
                 raise
             
-            yield f"\n[Retry {attempt + 1}/{max_retries}...]"
+            if on_retry is None:
+                yield f"\n[Retry {attempt + 1}/{max_retries}...]"
 
-def call_gemini(prompt, system, model, max_retries=3, fallback_on_quota=True):
+def call_gemini(prompt, system, model, max_retries=3, fallback_on_quota=True, cancel=None, agent=None,
+                context="", prefix=None, generation_config=None):
     """Non-streaming Gemini call with automatic fallback to free tier models.
     
     Args:
@@ -106,27 +396,47 @@ def call_gemini(prompt, system, model, max_retries=3, fallback_on_quota=True):
         model: Initial model to use
         max_retries: Maximum retry attempts
         fallback_on_quota: If True, automatically fallback to free tier models on quota errors
+        cancel: Optional CancelToken; raises Cancelled before each attempt once it fires
+        agent: Name the call's token usage is recorded under (see token_usage)
+        context: Stable text sent before the prompt and cached with the system instruction
+        prefix: Handle from register_prefix, replacing system and context
+        generation_config: Optional generation settings, e.g. a response_schema for JSON output,
+            merged over the agent's profile (see generation_profiles)
     """
     from model_router import is_quota_error, get_fallback_model
     
+    if prefix:
+        registered = prefix_cache.lookup(prefix)
+        if registered is None:
+            raise ValueError(f"Unknown or evicted prefix handle: {prefix}")
+        model, system, context = registered
+    
+    generation_config = generation_config_for(agent, generation_config)
     current_model = model
     models_tried = []
+    prepared = {}  # Prefix set up once per model, not on every retry
     
     for attempt in range(max_retries * 2):  # Allow more attempts for fallback
+        if cancel:
+            cancel.check()
         try:
-            # Keep 'models/' prefix if present (newer API versions require it)
-            # If not present, add it for compatibility
-            if not current_model.startswith('models/'):
-                model_name = f"models/{current_model}"
-            else:
-                model_name = current_model
-            
-            genai_model = genai.GenerativeModel(
-                model_name=model_name,
-                system_instruction=system
-            )
-            response = genai_model.generate_content(prompt)
-            return response.text
+            if current_model not in prepared:
+                prepared[current_model] = prefix_cache.prepare(_model_name(current_model), system, context, prompt)
+            genai_model, contents = prepared[current_model]
+            rate_limiter.acquire(cancel)
+            start = time.perf_counter()
+            response = genai_model.generate_content(contents, generation_config=generation_config,
+                                                    request_options=_request_options(cancel))
+            if cancel:
+                cancel.check()
+            text = _response_text(response)
+            record_call(agent, current_model, (system or "") + _join_context(context, prompt), text,
+                        getattr(response, "usage_metadata", None), time.perf_counter() - start)
+            if _truncated(response):
+                raise TruncatedResponse(agent, current_model, text)
+            return text
+        except TruncatedResponse:
+            raise
         except Exception as e:
             error_msg = str(e)
             models_tried.append(current_model)
@@ -0,0 +1,116 @@
+"""
+Generation Profiles - Per-agent generation settings for model calls.
+
+Every call made with an agent name is sent with that agent's profile: an
+output token cap, and optionally a temperature, stop sequences and a
+candidate count. The cap bounds how long one stage can keep the model
+generating, so a stage's worst-case latency is roughly time to first token
+plus max_output_tokens / decode rate. Settings passed to call_gemini or
+stream_gemini explicitly (e.g. the planner's response schema) are merged
+over the profile.
+
+Override profiles with GEMINI_GENERATION_PROFILES: a JSON object, or the
+path of a JSON file, mapping agent names to settings, e.g.
+{"summarizer": {"max_output_tokens": 1024}, "executor": {"temperature": 0.4}}.
+GEMINI_GENERATION_PROFILES=off sends no profiles at all.
+`python main.py usage --profiles` shows the response sizes and speeds
+recorded per agent against these caps.
+"""
+
+import os
+import json
+
+SETTINGS = ("max_output_tokens", "temperature", "stop_sequences", "candidate_count")
+
+# Placeholder caps, not measured: no usage data was available when they were
+# set. Each is a power of two sized by the kind of response the agent's
+# prompt asks for: code-producing agents return whole files, the supervisor
+# and summarizer a page or less. Caps count thinking tokens too, so they
+# leave room above that response. Tune them from `python main.py usage
+# --profiles` once real runs are recorded. Temperature is left at the model
+# default (Gemini 3 models are tuned for 1.0).
+DEFAULT_PROFILES = {
+    "supervisor": {"max_output_tokens": 4096},
+    "planner": {"max_output_tokens": 8192},
+    "executor": {"max_output_tokens": 32768},
+    "reviewer": {"max_output_tokens": 32768},
+    "code_reviewer": {"max_output_tokens": 32768},
+    "final_reviewer": {"max_output_tokens": 32768},
+    "summarizer": {"max_output_tokens": 2048},
+    "documenter": {"max_output_tokens": 16384},
+}
+
+def validate(settings):
+    """Check one agent's settings; raises ValueError on unknown keys or bad values."""
+    if not isinstance(settings, dict):
+        raise ValueError(f"A generation profile must be an object, got {type(settings).__name__}")
+    unknown = set(settings) - set(SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown generation settings: {', '.join(sorted(unknown))} "
+                         f"(expected {', '.join(SETTINGS)})")
+    for key in ("max_output_tokens", "candidate_count"):
+        value = settings.get(key)
+        if value is not None and (not isinstance(value, int) or value < 1):
+            raise ValueError(f"{key} must be a positive integer, got {value!r}")
+    temperature = settings.get("temperature")
+    if temperature is not None and not (isinstance(temperature, (int, float)) and 0 <= temperature <= 2):
+        raise ValueError(f"temperature must be between 0 and 2, got {temperature!r}")
+    stops = settings.get("stop_sequences")
+    if stops is not None and (not isinstance(stops, list) or len(stops) > 5
+                              or not all(isinstance(s, str) and s for s in stops)):
+        raise ValueError(f"stop_sequences must be a list of up to 5 non-empty strings, got {stops!r}")
+    return settings
+
+def _load_overrides(value):
+    if not value:
+        return {}
+    text = value
+    if os.path.isfile(value):
+        with open(value) as f:
+            text = f.read()
+    try:
+        overrides = json.loads(text)
+    except ValueError as e:
+        raise ValueError(f"GEMINI_GENERATION_PROFILES is neither a JSON object nor a JSON file: {e}")
+    if not isinstance(overrides, dict):
+        raise ValueError("GEMINI_GENERATION_PROFILES must map agent names to settings")
+    for settings in overrides.values():
+        validate(settings)
+    return overrides
+
+def _initial_profiles():
+    value = os.getenv("GEMINI_GENERATION_PROFILES", "")
+    if value.lower() == "off":
+        return {}
+    profiles = {agent: dict(settings) for agent, settings in DEFAULT_PROFILES.items()}
+    for agent, settings in _load_overrides(value).items():
+        profiles.setdefault(agent, {}).update(settings)
+    return profiles
+
+profiles = _initial_profiles()
+
+def profile_for(agent):
+    """A copy of an agent's settings ({} for unknown agents)."""
+    return dict(profiles.get(agent) or {})
+
+def set_profile(agent, **settings):
+    """Change settings of an agent's profile at runtime; a value of None removes that setting."""
+    validate({key: value for key, value in settings.items() if value is not None})
+    profile = profiles.setdefault(agent, {})
+    for key, value in settings.items():
+        if value is None:
+            profile.pop(key, None)
+        else:
+            profile[key] = value
+
+def generation_config_for(agent, generation_config=None):
+    """The generation_config for a call: the agent's profile with generation_config merged over it.
+
+    Returns None when there is nothing to send. A non-dict generation_config
+    (e.g. a genai.GenerationConfig) is passed through unchanged.
+    """
+    if generation_config is not None and not isinstance(generation_config, dict):
+        return generation_config
+    config = profile_for(agent)
+    config.update(generation_config or {})
+    return config or None
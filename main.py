@@ -1,56 +1,333 @@
-from orchestrator import run_task
+import argparse
+import os
+import time
+import threading
+from renderer import get_renderer, configure as configure_renderer
+
+def say(text=""):
+    """Print a CLI message through the renderer, so it stays in order with buffered task output."""
+    get_renderer().notice(f"{text}\n")
 
 def print_result(result):
     """Simple, clean result display."""
     if result["status"] == "success":
-        print("\n" + "="*60)
-        print("✅ COMPLETE")
-        print("="*60)
+        say("\n" + "="*60)
+        say("✅ COMPLETE")
+        say("="*60)
         
         # Show project info if created
         if result.get("project_path"):
-            print(f"\n📁 Project: {result['project_path']}")
+            say(f"\n📁 Project: {result['project_path']}")
             if result.get("saved_files"):
-                print(f"📄 Files: {', '.join(result['saved_files'])}")
+                say(f"📄 Files: {', '.join(result['saved_files'])}")
         
-        print("\n" + "="*60 + "\n")
+        say("\n" + "="*60 + "\n")
         
     elif result["status"] == "error":
-        print("\n" + "="*60)
-        print("❌ ERROR")
-        print("="*60)
-        print(result.get("message", "Unknown error"))
-        print("="*60 + "\n")
+        say("\n" + "="*60)
+        say("❌ ERROR")
+        say("="*60)
+        say(result.get("message", "Unknown error"))
+        if result.get("run_id"):
+            say(f"Resume with: python main.py resume {result['run_id']}")
+        say("="*60 + "\n")
+        
+    elif result["status"] == "cancelled":
+        say("\n" + "="*60)
+        say("⏹️  CANCELLED")
+        say("="*60)
+        say(result.get("message", "Cancelled"))
+        if result.get("outputs"):
+            say(f"Partial output from: {', '.join(result['outputs'])}")
+        if result.get("run_id"):
+            say(f"Resume with: python main.py resume {result['run_id']}")
+        say("="*60 + "\n")
+    
+    profile = result.get("profile")
+    if profile:
+        say(f"📈 Profile: {profile['summary']}" + (f" (CPU: {profile['cpu']})" if profile["cpu"] else ""))
+        for entry in profile["hot"]:
+            say(f"   {entry['self_s']:>8.3f}s self  {entry['function']}")
+        say()
 
-def main():
-    print("="*60)
-    print("🤖 AI Agent System")
-    print("="*60)
-    print("Enter your task. Type 'exit' to quit.\n")
+def run_cancellable(task, timeout=None, **options):
+    """Run a task in a worker thread so Ctrl-C cancels the task instead of the CLI.
+    
+    A second Ctrl-C stops waiting for the task to wind down. Extra options
+    (run_id, resume) are passed to run_task. The CLI also waits for the
+    generated project's run, whose output the user is watching, and puts
+    its summary under "project_run".
+    """
+    from cancellation import CancelToken
+    from orchestrator import run_task
+    from project_runner import run_summary
+    
+    cancel = CancelToken(timeout)
+    outcome = {}
+    finished = threading.Event()
+    
+    def target():
+        try:
+            result = outcome["result"] = run_task(task, cancel=cancel, **options)
+            if result.get("project_run") is not None:
+                result["project_run"] = run_summary(result["project_run"], result.get("project_path"))
+        except Exception as e:
+            outcome["result"] = {"status": "error", "message": str(e)}
+        finally:
+            finished.set()
+    
+    # Wait on an event rather than Thread.join, which an interrupt can leave in a bad state
+    threading.Thread(target=target, daemon=True).start()
+    try:
+        while not finished.wait(0.2):
+            pass
+    except KeyboardInterrupt:
+        cancel.cancel("Cancelled by user")
+        say("\n⏹️  Cancelling... (Ctrl-C again to stop waiting)")
+        try:
+            while not finished.wait(0.2):
+                pass
+        except KeyboardInterrupt:
+            return {"status": "cancelled", "message": "Cancelled by user"}
+    return outcome["result"]
+
+def interactive(timeout=None):
+    say("="*60)
+    say("🤖 AI Agent System")
+    say("="*60)
+    say("Enter your task. Type 'exit' to quit.\n")
     
     while True:
         try:
+            get_renderer().flush()  # Show everything before prompting
             task = input("📝 Task: ").strip()
             
             if not task:
                 continue
                 
             if task.lower() in ["exit", "quit", "q"]:
-                print("\n👋 Goodbye!\n")
+                say("\n👋 Goodbye!\n")
                 break
 
-            print()  # Empty line before processing
+            say()  # Empty line before processing
             
-            result = run_task(task)
+            result = run_cancellable(task, timeout)
             print_result(result)
             
         except KeyboardInterrupt:
-            print("\n\n👋 Interrupted\n")
+            say("\n\n👋 Interrupted\n")
             break
         except Exception as e:
-            print(f"\n❌ Error: {str(e)}\n")
+            say(f"\n❌ Error: {str(e)}\n")
+            get_renderer().flush()
             if input("Continue? (y/n): ").lower() != 'y':
                 break
 
+def resume(run_id=None, timeout=None):
+    """Resume an interrupted run from its checkpoints, or list resumable runs."""
+    from memory.checkpoints import list_runs, load_checkpoints
+    
+    if not run_id:
+        runs = list_runs()
+        if not runs:
+            say("No interrupted runs to resume")
+            return
+        for run in runs:
+            updated = time.strftime("%Y-%m-%d %H:%M", time.localtime(run["updated_at"]))
+            say(f"{run['run_id']}  {updated}  {run['stages']} stage(s) done  {run['task'] or ''}")
+        return
+    
+    task = load_checkpoints(run_id).get("task")
+    if not task:
+        say(f"No checkpoints found for run {run_id}")
+        return
+    say(f"↩️  Resuming: {task}\n")
+    print_result(run_cancellable(task, timeout, run_id=run_id, resume=True))
+
+def search(query, limit=10, raw=False):
+    """Search past tasks and print ranked matches."""
+    import sqlite3
+    from memory.memory import search_tasks
+
+    start = time.perf_counter()
+    try:
+        results = search_tasks(query, limit=limit, raw=raw)
+    except sqlite3.OperationalError as e:
+        say(f"❌ Invalid query syntax: {query!r} ({e})")
+        if raw:
+            say("   --raw queries use FTS5 syntax, e.g. 'snake* AND canvas', '\"exact phrase\"', 'NEAR(a b)'")
+        return
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    if not results:
+        say(f"No tasks match '{query}'")
+        return
+
+    for row in results:
+        created = time.strftime("%Y-%m-%d %H:%M", time.localtime(row["created_at"])) if row["created_at"] else "unknown"
+        say(f"#{row['id']}  {created}  {row['task']}")
+        if row["project_path"]:
+            say(f"    📁 {row['project_path']}")
+        say(f"    {' '.join(row['snippet'].split())}\n")
+    say(f"{len(results)} result(s) in {elapsed_ms:.2f} ms")
+
+def manage_memory(compact=False, max_tasks=None, max_age_days=None, vacuum=False):
+    """Print the size of the task memory, compacting it first if asked.
+    
+    Compaction applies the retention limits (AGENT_MEMORY_MAX_TASKS and
+    AGENT_MEMORY_MAX_AGE_DAYS unless given) and drops unused result chunks.
+    """
+    from memory.memory import compact_memory, memory_stats
+    
+    if compact or vacuum:
+        deleted = compact_memory(max_tasks, max_age_days, vacuum)
+        say(f"🧹 Deleted {deleted} task(s)")
+    stats = memory_stats()
+    say(f"Tasks:          {stats['tasks']:,}")
+    say(f"Result chunks:  {stats['blobs']:,}")
+    say(f"Result text:    {_size(stats['raw_bytes'])}, {_size(stats['unique_bytes'])} after deduplication, "
+        f"{_size(stats['stored_bytes'])} stored")
+
+def _size(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:,.0f} {unit}" if unit == "B" else f"{size:,.1f} {unit}"
+        size /= 1024
+    return f"{size:,.1f} GB"
+
+def usage(group_by="agent", days=None, limit=20):
+    """Print stored token usage, largest consumers first."""
+    from memory.usage import usage_report
+    
+    rows = usage_report(group_by, days, limit)
+    if not rows:
+        say("No token usage recorded yet")
+        return
+    
+    total = sum(row["total_tokens"] for row in rows)
+    label = "task" if group_by == "task" else group_by
+    say(f"{label:<40} {'calls':>6} {'prompt':>10} {'response':>10} {'total':>10} {'share':>6} {'time':>8}")
+    for row in rows:
+        name = f"{row['run_id']} {row['task'] or ''}" if group_by == "task" else row[group_by]
+        name = name if len(name) <= 40 else name[:37] + "..."
+        share = row["total_tokens"] / total if total else 0
+        say(f"{name:<40} {row['calls']:>6} {row['prompt_tokens']:>10,} {row['response_tokens']:>10,} "
+            f"{row['total_tokens']:>10,} {share:>6.0%} {row['duration_s']:>7.1f}s")
+    estimated = sum(row["estimated_calls"] for row in rows)
+    if estimated:
+        say(f"\n{estimated} call(s) had no usage metadata; their counts are estimated")
+
+def profiles(days=None):
+    """Print each agent's recorded response sizes and speed against its generation profile."""
+    from memory.usage import response_profile
+    from generation_profiles import profiles as configured
+    
+    observed = response_profile(days)
+    agents = sorted(set(observed) | set(configured))
+    say(f"{'agent':<16} {'calls':>6} {'p95 tok':>8} {'max tok':>8} {'tok/s':>7} {'cap':>7} {'worst case':>10}")
+    for agent in agents:
+        stats = observed.get(agent, {})
+        cap = configured.get(agent, {}).get("max_output_tokens")
+        rate = stats.get("tokens_per_s")
+        # Time to generate a full cap at the observed speed
+        worst = f"{cap / rate:.0f}s" if cap and rate else "-"
+        say(f"{agent:<16} {stats.get('calls', 0):>6} {stats.get('p95_tokens', '-'):>8} "
+            f"{stats.get('max_tokens', '-'):>8} {rate or '-':>7} {cap or 'none':>7} {worst:>10}")
+        # The cap counts thinking tokens too, which the response sizes leave out
+        if cap and stats.get("max_generated_tokens", 0) >= cap:
+            say(f"{'':<16} responses reached the cap; consider raising {agent}'s max_output_tokens")
+
+def batch(input_path, output_path=None, workers=4, rpm=0, resume=True, retry_failed=False, timeout=None):
+    """Run tasks from a JSONL file and print the aggregate report."""
+    from batch_runner import BatchRunner, print_report
+    
+    if not output_path:
+        output_path = os.path.splitext(input_path)[0] + ".results.jsonl"
+    
+    report = BatchRunner(workers=workers, requests_per_minute=rpm, timeout=timeout).run(
+        input_path, output_path, resume=resume, retry_failed=retry_failed
+    )
+    print_report(report)
+    say(f"📄 Results: {output_path}")
+
+def main():
+    parser = argparse.ArgumentParser(description="AI Agent System")
+    parser.add_argument("--timeout", type=float, help="Cancel each task after this many seconds")
+    parser.add_argument("--quiet", action="store_true", help="Write task output only to the log file")
+    parser.add_argument("--log-file", help="Also write all output to this file (quiet default: agent_output.log)")
+    parser.add_argument("--fps", type=float, help="Terminal redraws per second (0 = write every chunk)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile each task (CPU, memory, stage timers) into --profile-dir")
+    parser.add_argument("--profile-dir", help="Where profile files go (default: profiles)")
+    subparsers = parser.add_subparsers(dest="command")
+
+    search_parser = subparsers.add_parser("search", help="Search past tasks and results")
+    search_parser.add_argument("query", help="Search terms")
+    search_parser.add_argument("--limit", type=int, default=10, help="Maximum number of results")
+    search_parser.add_argument("--raw", action="store_true", help="Use FTS5 query syntax (AND/OR/NEAR, prefix*)")
+
+    resume_parser = subparsers.add_parser("resume", help="Resume an interrupted task from its checkpoints")
+    resume_parser.add_argument("run_id", nargs="?", help="Run to resume (omit to list resumable runs)")
+
+    batch_parser = subparsers.add_parser("batch", help="Run tasks from a JSONL file concurrently")
+    batch_parser.add_argument("input", help="JSONL file with one task per line")
+    batch_parser.add_argument("--output", help="Results JSONL file (default: <input>.results.jsonl)")
+    batch_parser.add_argument("--workers", type=int, default=4, help="Tasks run in parallel")
+    batch_parser.add_argument("--rpm", type=int, default=0, help="Max model requests per minute across workers (0 = unlimited)")
+    batch_parser.add_argument("--no-resume", action="store_true", help="Ignore existing results and start over")
+    batch_parser.add_argument("--retry-failed", action="store_true", help="Re-run tasks whose recorded status is not success")
+    batch_parser.add_argument("--timeout", type=float, default=argparse.SUPPRESS,
+                              help="Cancel each task after this many seconds")
+    batch_parser.add_argument("--profile", action="store_true", default=argparse.SUPPRESS, help="Profile each task")
+    
+    serve_parser = subparsers.add_parser("serve", help="Run as an HTTP/JSON service")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="Address to bind")
+    serve_parser.add_argument("--port", type=int, default=8080, help="Port to listen on")
+    serve_parser.add_argument("--workers", type=int, default=2, help="Tasks run concurrently")
+    serve_parser.add_argument("--queue-size", type=int, default=16, help="Queued tasks before rejecting with 429")
+    serve_parser.add_argument("--timeout", type=float, default=argparse.SUPPRESS,
+                              help="Cancel each task after this many seconds")
+    serve_parser.add_argument("--profile", action="store_true", default=argparse.SUPPRESS, help="Profile each task")
+    
+    memory_parser = subparsers.add_parser("memory", help="Show the size of the task memory or compact it")
+    memory_parser.add_argument("--stats", action="store_true", help="Show task and storage counts (the default)")
+    memory_parser.add_argument("--compact", action="store_true", help="Apply the retention limits first")
+    memory_parser.add_argument("--max-tasks", type=int, help="With --compact, keep only the newest N tasks")
+    memory_parser.add_argument("--max-age-days", type=float, help="With --compact, delete tasks older than N days")
+    memory_parser.add_argument("--vacuum", action="store_true", help="Compact and rebuild the database file")
+    
+    usage_parser = subparsers.add_parser("usage", help="Report token usage per agent, model or task")
+    usage_parser.add_argument("--by", choices=["agent", "model", "task"], default="agent", help="How to group calls")
+    usage_parser.add_argument("--days", type=float, help="Only include the last N days")
+    usage_parser.add_argument("--limit", type=int, default=20, help="Maximum number of rows")
+    usage_parser.add_argument("--profiles", action="store_true",
+                              help="Compare recorded response sizes with each agent's output token cap")
+    
+    args = parser.parse_args()
+    if args.quiet or args.log_file or args.fps is not None:
+        configure_renderer(quiet=args.quiet or None, log_file=args.log_file, fps=args.fps)
+    if args.profile or args.profile_dir:
+        from profiling import enable_profiling
+        enable_profiling(args.profile_dir)
+
+    if args.command == "resume":
+        resume(args.run_id, args.timeout)
+    elif args.command == "search":
+        search(args.query, args.limit, args.raw)
+    elif args.command == "memory":
+        manage_memory(args.compact, args.max_tasks, args.max_age_days, args.vacuum)
+    elif args.command == "usage":
+        if args.profiles:
+            profiles(args.days)
+        else:
+            usage(args.by, args.days, args.limit)
+    elif args.command == "batch":
+        batch(args.input, args.output, args.workers, args.rpm, not args.no_resume, args.retry_failed, args.timeout)
+    elif args.command == "serve":
+        from service import serve
+        serve(args.host, args.port, args.workers, args.queue_size, args.timeout)
+    else:
+        interactive(args.timeout)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,66 @@
+"""
+Blobs - Content-addressed, compressed chunks for stored task results.
+
+Results are split into code blocks (the generated files) and the prose
+between them. Each chunk is stored once under its SHA-256 hash, so files
+repeated across similar tasks take no extra space.
+"""
+
+import re
+import zlib
+import hashlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # Optional - zlib is used when zstandard is not installed
+
+# Chunks smaller than this are stored uncompressed
+MIN_COMPRESS_SIZE = 256
+
+_fence_re = re.compile(r"```([^\n]*)\n.*?```", re.DOTALL)
+
+def split_result(text):
+    """Split text into chunks of code blocks and prose.
+
+    Returns a list of {"content", "file"} dicts whose contents concatenate back
+    to `text`. Code blocks carry the file name from their fence (```python:app.py)
+    or their language when no name is given; prose chunks have file None.
+    """
+    chunks = []
+    position = 0
+    for match in _fence_re.finditer(text or ""):
+        if match.start() > position:
+            chunks.append({"content": text[position:match.start()], "file": None})
+        info = match.group(1).strip()
+        chunks.append({"content": match.group(0), "file": info.split(":", 1)[-1].strip() or "code"})
+        position = match.end()
+    if position < len(text or ""):
+        chunks.append({"content": text[position:], "file": None})
+    return chunks
+
+def chunk_hash(content):
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def compress(content):
+    """Return (codec, data) for a text chunk."""
+    raw = content.encode("utf-8")
+    if len(raw) < MIN_COMPRESS_SIZE:
+        return "raw", raw
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=10).compress(raw)
+    return "zlib", zlib.compress(raw, 9)
+
+def decompress(codec, data):
+    """Return the text stored in a blob."""
+    if codec == "raw":
+        raw = data
+    elif codec == "zlib":
+        raw = zlib.decompress(data)
+    elif codec == "zstd":
+        if zstandard is None:
+            raise ImportError("This memory database contains zstd blobs. Please install: pip install zstandard")
+        raw = zstandard.ZstdDecompressor().decompress(data)
+    else:
+        raise ValueError(f"Unknown blob codec: {codec}")
+    return raw.decode("utf-8")
@@ -0,0 +1,62 @@
+"""
+Checkpoints - Durable stage outputs of task runs, so an interrupted run can resume.
+
+Rows are keyed by run id and stage. Every run gets its own id, so concurrent
+runs of the same task never share checkpoints. The "task" stage holds the task
+text, so a run can be resumed from its id alone, or found by its task
+(find_run). A "<stage> signature" row, when present, identifies the inputs a
+stage output was built from (see RunContext.checkpoint). A run's checkpoints
+are cleared once it completes; compact_memory drops abandoned ones.
+"""
+
+import time
+import uuid
+import hashlib
+from memory.memory import get_db
+
+def new_run_id():
+    """A fresh, unique run id."""
+    return uuid.uuid4().hex[:12]
+
+def run_id_for(key):
+    """A stable run id derived from a key (e.g. a batch file and item id), for callers that resume by key."""
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:12]
+
+def find_run(task):
+    """Return the id of the most recently updated unfinished run of a task, or None."""
+    db = get_db()
+    rows = list(db.query(
+        "SELECT c.run_id FROM checkpoints c JOIN checkpoints t ON t.run_id = c.run_id AND t.stage = 'task' "
+        "WHERE t.output = ? GROUP BY c.run_id ORDER BY MAX(c.updated_at) DESC LIMIT 1", [task]
+    ))
+    return rows[0]["run_id"] if rows else None
+
+def save_checkpoint(run_id, stage, output):
+    """Store one stage output, replacing any earlier one. Committed before returning."""
+    db = get_db()
+    with db.conn:
+        db.execute(
+            "INSERT OR REPLACE INTO checkpoints (run_id, stage, output, updated_at) VALUES (?, ?, ?, ?)",
+            [run_id, stage, output, time.time()]
+        )
+
+def load_checkpoints(run_id):
+    """Return {stage: output} for a run."""
+    db = get_db()
+    return {row["stage"]: row["output"] for row in db.query(
+        "SELECT stage, output FROM checkpoints WHERE run_id = ?", [run_id]
+    )}
+
+def clear_checkpoints(run_id):
+    db = get_db()
+    with db.conn:
+        db.execute("DELETE FROM checkpoints WHERE run_id = ?", [run_id])
+
+def list_runs(limit=20):
+    """Return unfinished runs, most recently updated first."""
+    db = get_db()
+    return list(db.query(
+        "SELECT run_id, MAX(CASE WHEN stage = 'task' THEN output END) AS task, "
+        "SUM(stage != 'task' AND stage NOT LIKE '% signature') AS stages, MAX(updated_at) AS updated_at "
+        "FROM checkpoints GROUP BY run_id ORDER BY updated_at DESC LIMIT ?", [limit]
+    ))
@@ -0,0 +1,114 @@
+"""
+Embeddings - Local text vectors and nearest-neighbour search for agent memory.
+
+Texts are embedded with signed feature hashing over words and character
+trigrams, so no model download or network access is needed.
+"""
+
+import re
+import zlib
+import threading
+import numpy as np
+
+DIM = 256
+MAX_EMBED_CHARS = 20000
+
+_word_re = re.compile(r"\w+")
+
+def embed(text, dim=DIM):
+    """Embed text as an L2-normalised float32 vector."""
+    words = _word_re.findall((text or "")[:MAX_EMBED_CHARS].lower())
+    features = list(words)
+    for word in words:
+        padded = f"#{word}#"
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+
+    vec = np.zeros(dim, dtype=np.float32)
+    if not features:
+        return vec
+
+    hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in features),
+                         dtype=np.uint32, count=len(features))
+    signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+    np.add.at(vec, hashes % dim, signs)
+
+    # Sublinear term frequency so long results don't drown out short tasks
+    vec = np.sign(vec) * np.log1p(np.abs(vec))
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+def to_blob(vec):
+    return np.asarray(vec, dtype=np.float32).tobytes()
+
+def from_blob(blob):
+    return np.frombuffer(blob, dtype=np.float32)
+
+class VectorIndex:
+    """In-memory cosine-similarity index over unit vectors.
+
+    With quantize=True vectors are stored as int8, using a quarter of the memory
+    at a small cost in precision.
+    """
+
+    # Rows scored per block when dequantizing, to bound temporary memory
+    BLOCK_ROWS = 2048
+
+    def __init__(self, dim=DIM, quantize=False):
+        self.dim = dim
+        self.quantize = quantize
+        self.size = 0
+        self.ids = np.zeros(1024, dtype=np.int64)
+        self.vectors = np.zeros((1024, dim), dtype=np.int8 if quantize else np.float32)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.size
+
+    def _grow(self, needed):
+        capacity = len(self.ids)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        ids = np.zeros(capacity, dtype=np.int64)
+        ids[:self.size] = self.ids[:self.size]
+        vectors = np.zeros((capacity, self.dim), dtype=self.vectors.dtype)
+        vectors[:self.size] = self.vectors[:self.size]
+        self.ids, self.vectors = ids, vectors
+
+    def add(self, item_id, vec):
+        """Add one vector."""
+        with self.lock:
+            self._grow(self.size + 1)
+            self.ids[self.size] = item_id
+            self.vectors[self.size] = np.round(vec * 127) if self.quantize else vec
+            self.size += 1
+
+    def add_many(self, item_ids, vecs):
+        """Add a batch of vectors (one per row of `vecs`)."""
+        with self.lock:
+            count = len(item_ids)
+            self._grow(self.size + count)
+            self.ids[self.size:self.size + count] = item_ids
+            self.vectors[self.size:self.size + count] = np.round(vecs * 127) if self.quantize else vecs
+            self.size += count
+
+    def search(self, vec, k=5):
+        """Return up to k (id, score) pairs, best first."""
+        with self.lock:
+            if self.size == 0:
+                return []
+            query = np.asarray(vec, dtype=np.float32)
+            if self.quantize:
+                scores = np.empty(self.size, dtype=np.float32)
+                for start in range(0, self.size, self.BLOCK_ROWS):
+                    end = min(start + self.BLOCK_ROWS, self.size)
+                    scores[start:end] = self.vectors[start:end].astype(np.float32) @ query
+                scores /= 127
+            else:
+                scores = self.vectors[:self.size] @ query
+
+            k = min(k, self.size)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(int(self.ids[i]), float(scores[i])) for i in top]
@@ -1,23 +1,497 @@
 import os
+import json
+import time
+import queue
+import atexit
+import sqlite3
+import threading
+import numpy as np
 from sqlite_utils import Database
+from memory.embeddings import DIM, VectorIndex, embed, to_blob
+from memory.blobs import split_result, chunk_hash, compress, decompress
 
 # Get the absolute path to the memory directory
 memory_dir = os.path.dirname(os.path.abspath(__file__))
-db_path = os.path.join(memory_dir, "agent_memory.db")
-db = Database(db_path)
-
-if "tasks" not in db.table_names():
-    db["tasks"].create({
-        "id": int,
-        "task": str,
-        "result": str
-    }, pk="id")
-
-def save_task(task, result):
-    db["tasks"].insert({
-        "task": task,
-        "result": result
-    })
-
-def fetch_memory():
-    return list(db["tasks"].rows)
+db_path = os.getenv("AGENT_MEMORY_DB") or os.path.join(memory_dir, "agent_memory.db")
+
+# Retention policy, opt-in: history is kept forever unless a limit is set (0 disables the limit)
+MAX_TASKS = int(os.getenv("AGENT_MEMORY_MAX_TASKS", "0"))
+MAX_AGE_DAYS = int(os.getenv("AGENT_MEMORY_MAX_AGE_DAYS", "0"))
+# Run compaction every N saved tasks
+COMPACT_EVERY = 500
+# Store int8 vectors in the retrieval index
+QUANTIZE_INDEX = os.getenv("AGENT_MEMORY_QUANTIZE", "0") == "1"
+# Weight of the task text vs. its result when ranking past tasks
+TASK_WEIGHT = 0.7
+# Checkpoints of runs untouched for this long are dropped on compaction
+CHECKPOINT_MAX_AGE_DAYS = 7
+# Background writer: max tasks per transaction and how long to wait to fill a batch
+WRITE_BATCH_SIZE = 50
+WRITE_BATCH_WINDOW = 0.05
+
+_local = threading.local()
+
+def get_db():
+    """Return this thread's database connection, opening it on first use.
+
+    SQLite connections must not be shared across threads, so each thread
+    gets its own; WAL mode lets them read while the writer commits.
+    """
+    db = getattr(_local, "db", None)
+    if db is None:
+        db = Database(sqlite3.connect(db_path, timeout=30, check_same_thread=False))
+        db.execute("PRAGMA busy_timeout = 30000")
+        _local.db = db
+    return db
+
+def _init_db():
+    """Create or migrate the schema.
+
+    Runs in one IMMEDIATE transaction so several processes starting at once
+    wait for each other instead of failing with "database is locked".
+    """
+    db = get_db()
+    if db.execute("PRAGMA journal_mode").fetchone()[0] != "wal":
+        db.enable_wal()
+
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            "id INTEGER PRIMARY KEY, task TEXT, result TEXT, result_chunks TEXT, created_at FLOAT, "
+            "project_path TEXT, task_embedding BLOB, result_embedding BLOB)"
+        )
+        columns = {row[1] for row in db.execute("PRAGMA table_info(tasks)").fetchall()}
+        if "created_at" not in columns:
+            # Databases created before timestamps were tracked - date existing rows to the migration
+            db.execute("ALTER TABLE tasks ADD COLUMN created_at FLOAT")
+            db.execute("UPDATE tasks SET created_at = ? WHERE created_at IS NULL", [time.time()])
+        for column, column_type in (("project_path", "TEXT"), ("task_embedding", "BLOB"),
+                                    ("result_embedding", "BLOB"), ("result_chunks", "TEXT")):
+            if column not in columns:
+                db.execute(f"ALTER TABLE tasks ADD COLUMN {column} {column_type}")
+
+        db.execute("CREATE INDEX IF NOT EXISTS idx_tasks_created_at ON tasks (created_at)")
+
+        # Content-addressed result chunks, referenced from tasks.result_chunks
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            "hash TEXT PRIMARY KEY, codec TEXT, size INTEGER, data BLOB)"
+        )
+
+        # Stage outputs of unfinished runs, see memory.checkpoints
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "run_id TEXT, stage TEXT, output TEXT, updated_at FLOAT, PRIMARY KEY (run_id, stage))"
+        )
+
+        # Token usage of every model call, see memory.usage
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS usage ("
+            "id INTEGER PRIMARY KEY, run_id TEXT, task TEXT, agent TEXT, model TEXT, prompt_tokens INTEGER, "
+            "response_tokens INTEGER, estimated INTEGER, duration_s FLOAT, created_at FLOAT, "
+            "thought_tokens INTEGER DEFAULT 0)"
+        )
+        if "thought_tokens" not in {row[1] for row in db.execute("PRAGMA table_info(usage)").fetchall()}:
+            db.execute("ALTER TABLE usage ADD COLUMN thought_tokens INTEGER DEFAULT 0")
+        db.execute("CREATE INDEX IF NOT EXISTS idx_usage_created_at ON usage (created_at)")
+
+        if not db.execute("SELECT 1 FROM sqlite_master WHERE name = 'tasks_fts'").fetchone():
+            # Full-text index over tasks, kept in sync by save_task and compact_memory
+            db.execute(
+                "CREATE VIRTUAL TABLE tasks_fts USING fts5("
+                "task, result, project_path, tokenize='porter unicode61')"
+            )
+            db.execute(
+                "INSERT INTO tasks_fts(rowid, task, result, project_path) "
+                "SELECT id, task, result, project_path FROM tasks"
+            )
+        db.conn.commit()
+    except Exception:
+        db.conn.rollback()
+        raise
+
+_init_db()
+
+_index = None
+_index_lock = threading.Lock()
+
+def _store_result(result):
+    """Store a result as deduplicated, compressed chunks.
+
+    Returns the chunk references for tasks.result_chunks and the text to
+    full-text index (prose plus generated file names).
+    """
+    db = get_db()
+    chunks = split_result(result)
+    hashes = [chunk_hash(chunk["content"]) for chunk in chunks]
+
+    unique = list(dict.fromkeys(hashes))
+    existing = set()
+    for i in range(0, len(unique), 500):
+        batch = unique[i:i + 500]
+        placeholders = ", ".join("?" for _ in batch)
+        existing.update(row[0] for row in db.execute(
+            f"SELECT hash FROM blobs WHERE hash IN ({placeholders})", batch
+        ).fetchall())
+
+    for chunk, digest in zip(chunks, hashes):
+        if digest in existing:
+            continue
+        codec, data = compress(chunk["content"])
+        db.execute(
+            "INSERT OR IGNORE INTO blobs(hash, codec, size, data) VALUES (?, ?, ?, ?)",
+            [digest, codec, len(chunk["content"].encode("utf-8")), data]
+        )
+        existing.add(digest)
+
+    refs = [{"h": digest, "file": chunk["file"]} for chunk, digest in zip(chunks, hashes)]
+    index_text = "".join(chunk["content"] if chunk["file"] is None else f"\nFile: {chunk['file']}\n"
+                         for chunk in chunks)
+    return json.dumps(refs), index_text
+
+def _hydrate(rows):
+    """Rebuild the `result` text of rows stored as chunk references."""
+    db = get_db()
+    hashes = set()
+    for row in rows:
+        if row.get("result_chunks"):
+            hashes.update(ref["h"] for ref in json.loads(row["result_chunks"]))
+
+    blobs = {}
+    hashes = list(hashes)
+    for i in range(0, len(hashes), 500):
+        batch = hashes[i:i + 500]
+        placeholders = ", ".join("?" for _ in batch)
+        for digest, codec, data in db.execute(
+            f"SELECT hash, codec, data FROM blobs WHERE hash IN ({placeholders})", batch
+        ).fetchall():
+            blobs[digest] = decompress(codec, data)
+
+    for row in rows:
+        refs = row.pop("result_chunks", None)
+        if refs:
+            row["result"] = "".join(blobs.get(ref["h"], "") for ref in json.loads(refs))
+    return rows
+
+def _write_batch(items):
+    """Insert a batch of tasks in a single transaction (writer thread only)."""
+    db = get_db()
+    written = []
+    with db.conn:
+        for task, result, project_path, created_at in items:
+            task_vec = embed(task)
+            result_vec = embed(result)
+            result_chunks, index_text = _store_result(result)
+            task_id = db.execute(
+                "INSERT INTO tasks(task, result, result_chunks, created_at, project_path, "
+                "task_embedding, result_embedding) VALUES (?, NULL, ?, ?, ?, ?, ?)",
+                [task, result_chunks, created_at, project_path, to_blob(task_vec), to_blob(result_vec)]
+            ).lastrowid
+            db.execute(
+                "INSERT INTO tasks_fts(rowid, task, result, project_path) VALUES (?, ?, ?, ?)",
+                [task_id, task, index_text, project_path]
+            )
+            written.append((task_id, task_vec, result_vec))
+
+    with _index_lock:
+        if _index is not None:
+            for task_id, task_vec, result_vec in written:
+                _index.add(task_id, _combine(task_vec, result_vec))
+
+    if any(task_id % COMPACT_EVERY == 0 for task_id, _, _ in written):
+        compact_memory()
+
+class _Writer(threading.Thread):
+    """Background thread that drains queued saves into batched transactions."""
+
+    def __init__(self):
+        super().__init__(name="memory-writer", daemon=True)
+        self.queue = queue.Queue()
+        self.errors = 0
+        self.last_error = None
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            batch = [item]
+            deadline = time.monotonic() + WRITE_BATCH_WINDOW
+            stop = False
+            while len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    item = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            try:
+                _write_batch(batch)
+            except Exception as e:
+                # Memory is best-effort - never let a failed write take down a task
+                self.errors += 1
+                self.last_error = str(e)
+            finally:
+                for _ in range(len(batch) + stop):
+                    self.queue.task_done()
+            if stop:
+                return
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def _get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = _Writer()
+            _writer.start()
+        return _writer
+
+def save_task(task, result, project_path=None):
+    """Queue a finished task for the background writer and return immediately.
+
+    Call flush() to wait until queued tasks are stored.
+    """
+    _get_writer().queue.put((task, result, project_path, time.time()))
+
+def flush():
+    """Block until every queued task has been written."""
+    writer = _writer
+    if writer is not None and writer.is_alive():
+        writer.queue.join()
+
+def shutdown():
+    """Flush pending writes and stop the writer thread."""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None and writer.is_alive():
+        writer.queue.put(None)
+        writer.join()
+
+atexit.register(shutdown)
+
+def fetch_recent(limit=3, include_result=True):
+    """Return the `limit` most recent tasks, oldest first."""
+    db = get_db()
+    columns = "id, task, result, result_chunks, created_at, project_path" if include_result else "id, task, created_at, project_path"
+    rows = list(db.query(
+        f"SELECT {columns} FROM tasks ORDER BY id DESC LIMIT ?", [limit]
+    ))
+    rows.reverse()
+    return _hydrate(rows)
+
+def fetch_memory(limit=50, before_id=None, include_result=True):
+    """Return one page of tasks, newest first.
+
+    Pass the smallest id of the previous page as `before_id` to get the next page.
+    """
+    db = get_db()
+    columns = "id, task, result, result_chunks, created_at, project_path" if include_result else "id, task, created_at, project_path"
+    if before_id is None:
+        return _hydrate(list(db.query(f"SELECT {columns} FROM tasks ORDER BY id DESC LIMIT ?", [limit])))
+    return _hydrate(list(db.query(
+        f"SELECT {columns} FROM tasks WHERE id < ? ORDER BY id DESC LIMIT ?", [before_id, limit]
+    )))
+
+def count_tasks():
+    """Return the number of stored tasks."""
+    db = get_db()
+    return db["tasks"].count
+
+def compact_memory(max_tasks=None, max_age_days=None, vacuum=False):
+    """Apply the retention policy and return the number of deleted tasks.
+
+    Args:
+        max_tasks: Keep at most this many of the newest tasks (defaults to MAX_TASKS)
+        max_age_days: Delete tasks older than this (defaults to MAX_AGE_DAYS)
+        vacuum: Rebuild the database file to reclaim free pages
+    """
+    db = get_db()
+    max_tasks = MAX_TASKS if max_tasks is None else max_tasks
+    max_age_days = MAX_AGE_DAYS if max_age_days is None else max_age_days
+
+    deleted = 0
+    with db.conn:
+        if max_tasks:
+            cursor = db.execute(
+                "DELETE FROM tasks WHERE id <= ("
+                "SELECT id FROM tasks ORDER BY id DESC LIMIT 1 OFFSET ?)", [max_tasks]
+            )
+            deleted += cursor.rowcount
+        if max_age_days:
+            cutoff = time.time() - max_age_days * 86400
+            cursor = db.execute("DELETE FROM tasks WHERE created_at < ?", [cutoff])
+            deleted += cursor.rowcount
+        if deleted:
+            db.execute("DELETE FROM tasks_fts WHERE rowid NOT IN (SELECT id FROM tasks)")
+            # Drop chunks no remaining task refers to
+            db.execute(
+                "DELETE FROM blobs WHERE hash NOT IN ("
+                "SELECT json_extract(value, '$.h') FROM tasks, json_each(tasks.result_chunks))"
+            )
+        # Abandoned runs that were never resumed
+        db.execute("DELETE FROM checkpoints WHERE run_id IN ("
+                   "SELECT run_id FROM checkpoints GROUP BY run_id HAVING MAX(updated_at) < ?)",
+                   [time.time() - CHECKPOINT_MAX_AGE_DAYS * 86400])
+
+    if deleted:
+        _reset_index()
+
+    _migrate_results()
+
+    db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    if vacuum:
+        db.vacuum()
+
+    return deleted
+
+def _migrate_results(batch_size=200):
+    """Move results stored as plain text into chunk storage."""
+    db = get_db()
+    while True:
+        rows = list(db.query(
+            "SELECT id, result FROM tasks WHERE result IS NOT NULL AND result_chunks IS NULL LIMIT ?",
+            [batch_size]
+        ))
+        if not rows:
+            return
+        with db.conn:
+            for row in rows:
+                result_chunks, index_text = _store_result(row["result"])
+                db.execute("UPDATE tasks SET result = NULL, result_chunks = ? WHERE id = ?",
+                           [result_chunks, row["id"]])
+                db.execute("UPDATE tasks_fts SET result = ? WHERE rowid = ?", [index_text, row["id"]])
+
+def memory_stats():
+    """Return task and blob counts with raw vs. stored result sizes in bytes."""
+    db = get_db()
+    row = next(db.query(
+        "SELECT COUNT(*) AS blobs, COALESCE(SUM(size), 0) AS unique_bytes, "
+        "COALESCE(SUM(LENGTH(data)), 0) AS stored_bytes FROM blobs"
+    ))
+    raw = next(db.query(
+        "SELECT COALESCE(SUM(b.size), 0) AS raw_bytes "
+        "FROM tasks t, json_each(t.result_chunks) j JOIN blobs b ON b.hash = json_extract(j.value, '$.h')"
+    ))
+    return dict(row, tasks=count_tasks(), raw_bytes=raw["raw_bytes"])
+
+def _combine(task_vec, result_vec):
+    """Blend task and result vectors into the single vector that is indexed."""
+    vec = TASK_WEIGHT * task_vec + (1 - TASK_WEIGHT) * result_vec
+    norm = (vec @ vec) ** 0.5
+    return vec / norm if norm else vec
+
+def _backfill_embeddings(batch_size=500):
+    """Embed tasks stored before embeddings were tracked."""
+    db = get_db()
+    while True:
+        rows = _hydrate(list(db.query(
+            "SELECT id, task, result, result_chunks FROM tasks WHERE task_embedding IS NULL LIMIT ?", [batch_size]
+        )))
+        if not rows:
+            return
+        with db.conn:
+            for row in rows:
+                db.execute(
+                    "UPDATE tasks SET task_embedding = ?, result_embedding = ? WHERE id = ?",
+                    [to_blob(embed(row["task"])), to_blob(embed(row["result"])), row["id"]]
+                )
+
+def _get_index():
+    """Load the retrieval index from the database on first use."""
+    db = get_db()
+    global _index
+    with _index_lock:
+        if _index is None:
+            _backfill_embeddings()
+            index = VectorIndex(DIM, quantize=QUANTIZE_INDEX)
+            cursor = db.execute("SELECT id, task_embedding, result_embedding FROM tasks ORDER BY id")
+            while True:
+                rows = cursor.fetchmany(10000)
+                if not rows:
+                    break
+                ids = [row[0] for row in rows]
+                task_vecs = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.float32).reshape(-1, DIM)
+                result_vecs = np.frombuffer(b"".join(row[2] for row in rows), dtype=np.float32).reshape(-1, DIM)
+                vecs = TASK_WEIGHT * task_vecs + (1 - TASK_WEIGHT) * result_vecs
+                norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+                index.add_many(ids, vecs / np.where(norms == 0, 1, norms))
+            _index = index
+        return _index
+
+def _reset_index():
+    global _index
+    with _index_lock:
+        _index = None
+
+def search_similar(query, k=5, min_score=0.2):
+    """Return up to k past tasks most similar to `query`, best first.
+
+    Each row includes a `score` (cosine similarity) field.
+    """
+    db = get_db()
+    # A task written while the index was loading can appear twice - keep its first hit
+    matches = list(dict((task_id, score) for task_id, score in reversed(_get_index().search(embed(query), k))
+                        if score >= min_score).items())[::-1]
+    if not matches:
+        return []
+
+    ids = [task_id for task_id, _ in matches]
+    placeholders = ", ".join("?" for _ in ids)
+    rows = {row["id"]: row for row in _hydrate(list(db.query(
+        f"SELECT id, task, result, result_chunks, created_at, project_path FROM tasks WHERE id IN ({placeholders})", ids
+    )))}
+    results = []
+    for task_id, score in matches:
+        if task_id in rows:
+            results.append(dict(rows[task_id], score=round(score, 4)))
+    return results
+
+def relevant_context(task, k=3, token_budget=1500):
+    """Build planning context from the past tasks most relevant to `task`.
+
+    Tokens are estimated at ~4 characters each; results are truncated to fit the budget.
+    """
+    char_budget = token_budget * 4
+    parts = []
+    for row in search_similar(task, k):
+        remaining = char_budget - sum(len(p) for p in parts)
+        header = f"- Task: {row['task']}\n  Result: "
+        if remaining <= len(header) + 50:
+            break
+        result = row["result"] or ""
+        room = remaining - len(header)
+        if len(result) > room:
+            result = result[:room - 15] + "... (truncated)"
+        parts.append(header + result)
+
+    return "Relevant previous tasks:\n" + "\n".join(parts) if parts else ""
+
+def search_tasks(query, limit=10, raw=False):
+    """Full-text search over stored tasks, best matches first.
+
+    Each row has id, task, project_path, created_at, a highlighted `snippet`
+    and its bm25 `rank` (lower is better).
+
+    Args:
+        query: Search terms. Terms are quoted unless raw=True, in which case
+            FTS5 query syntax (AND/OR/NEAR, prefix*) is passed through.
+        limit: Maximum number of results
+    """
+    db = get_db()
+    if not raw:
+        query = db.quote_fts(query)
+    return list(db.query(
+        "SELECT t.id, t.task, t.project_path, t.created_at, "
+        "snippet(tasks_fts, -1, '[', ']', '...', 16) AS snippet, "
+        "bm25(tasks_fts, 5.0, 1.0, 2.0) AS rank "
+        "FROM tasks_fts JOIN tasks t ON t.id = tasks_fts.rowid "
+        "WHERE tasks_fts MATCH ? ORDER BY rank LIMIT ?", [query, limit]
+    ))
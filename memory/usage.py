@@ -0,0 +1,83 @@
+"""
+Usage - Persisted token usage of model calls, for finding where tokens (and latency) go.
+
+Each run's calls are saved from its token_usage.UsageTracker when the run
+ends; usage_report aggregates them per agent, model or task.
+"""
+
+import time
+from memory.memory import get_db
+
+# Columns usage_report can group by
+GROUPS = {"agent": "agent", "model": "model", "task": "run_id, task"}
+
+def save_usage(tracker):
+    """Store every call recorded on a tracker. Returns the number of rows written."""
+    with tracker.lock:
+        records = list(tracker.records)
+    if not records:
+        return 0
+    db = get_db()
+    with db.conn:
+        db.conn.executemany(
+            "INSERT INTO usage (run_id, task, agent, model, prompt_tokens, response_tokens, thought_tokens, "
+            "estimated, duration_s, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(tracker.run_id, tracker.task, r["agent"], r["model"], r["prompt_tokens"], r["response_tokens"],
+              r.get("thought_tokens", 0), int(r["estimated"]), r["duration_s"], r["created_at"]) for r in records]
+        )
+    return len(records)
+
+def usage_report(group_by="agent", days=None, limit=20):
+    """Aggregate stored usage, largest token volume first.
+
+    Args:
+        group_by: "agent", "model" or "task"
+        days: Only count calls from the last N days (None = all)
+        limit: Maximum number of groups
+
+    Returns a list of dicts with the group columns plus calls, prompt_tokens,
+    response_tokens, total_tokens, estimated_calls and duration_s.
+    """
+    if group_by not in GROUPS:
+        raise ValueError(f"group_by must be one of: {', '.join(GROUPS)}")
+    columns = GROUPS[group_by]
+    since = time.time() - days * 86400 if days else 0
+    db = get_db()
+    return list(db.query(
+        f"SELECT {columns}, COUNT(*) AS calls, SUM(prompt_tokens) AS prompt_tokens, "
+        "SUM(response_tokens) AS response_tokens, SUM(prompt_tokens + response_tokens) AS total_tokens, "
+        "SUM(estimated) AS estimated_calls, ROUND(SUM(duration_s), 3) AS duration_s, "
+        "MAX(created_at) AS last_used "
+        f"FROM usage WHERE created_at >= ? GROUP BY {columns} ORDER BY total_tokens DESC LIMIT ?",
+        [since, limit]
+    ))
+
+def response_profile(days=None):
+    """Observed response sizes and generation speed per agent, for sizing generation profiles.
+
+    Returns {agent: {"calls", "p95_tokens", "max_tokens", "max_generated_tokens",
+    "tokens_per_s"}}. The token sizes are of the response text; max_generated_tokens
+    adds thinking tokens, which max_output_tokens caps too. tokens_per_s is
+    generated tokens over call duration (time to first token included, so it
+    understates the decode rate).
+    """
+    since = time.time() - days * 86400 if days else 0
+    db = get_db()
+    by_agent = {}
+    for row in db.query("SELECT agent, response_tokens, COALESCE(thought_tokens, 0) AS thought_tokens, duration_s "
+                        "FROM usage WHERE created_at >= ? ORDER BY agent, response_tokens", [since]):
+        by_agent.setdefault(row["agent"], []).append(
+            (row["response_tokens"], row["response_tokens"] + row["thought_tokens"], row["duration_s"]))
+    profile = {}
+    for agent, calls in by_agent.items():
+        tokens = [t for t, _, _ in calls]
+        generated = [g for _, g, _ in calls]
+        seconds = sum(d for _, _, d in calls)
+        profile[agent] = {
+            "calls": len(calls),
+            "p95_tokens": tokens[min(len(tokens) - 1, int(len(tokens) * 0.95))],
+            "max_tokens": tokens[-1],
+            "max_generated_tokens": max(generated),
+            "tokens_per_s": round(sum(generated) / seconds, 1) if seconds else None
+        }
+    return profile
@@ -1,24 +1,109 @@
 import time
 import os
+import re
+import json
+import queue
+import hashlib
+import threading
 from model_router import choose_model
 from agents.supervisor import supervise
-from agents.planner import plan
+from agents.planner import plan, parse_plan, format_step, PlanStream
 from agents.executor import execute
 from agents.reviewer import review
 from agents.code_reviewer import review_code
 from agents.summarizer import summarize
-from memory.memory import save_task, fetch_memory
-from file_manager import setup_project, run_project
+from agents.final_reviewer import final_review, parse_final_review
+from gemini_client import TruncatedResponse
+from memory.memory import save_task, relevant_context
+from memory.checkpoints import new_run_id, find_run, save_checkpoint, load_checkpoints, clear_checkpoints
+from memory.usage import save_usage
+from file_manager import setup_project, open_in_browser, extract_code_blocks
+from code_validator import validate_files, format_diagnostics
+from project_runner import start_project_run
 from project_analyzer import ProjectAnalyzer
 from documentation_generator import generate_project_documentation, create_summary_md
+from sinks import DeferredSink
+from renderer import get_renderer
+from output_buffer import OutputBuffer
+from cancellation import CancelToken, Cancelled
+from token_usage import UsageTracker, bind
+from profiling import TaskProfiler, profiling_enabled, bind_profiler
 
-class TaskOrchestrator:
-    def __init__(self):
+# When to run the model code review: "auto" (only if local validation finds
+# errors or code it cannot check), "always" or "never"
+CODE_REVIEW = os.getenv("AGENT_CODE_REVIEW", "auto")
+# Replace the review, code review and summary calls with one fused call (1 = on)
+FUSED_REVIEW = os.getenv("AGENT_FUSED_REVIEW", "0") == "1"
+# Start executing plan steps while the plan is still streaming (0 = wait for the full plan)
+PIPELINED_PLAN = os.getenv("AGENT_PIPELINED_PLAN", "1") == "1"
+# Words suggesting an output contains code worth validating
+CODE_HINTS = ["def ", "class ", "import ", "function", "code"]
+# Words suggesting a final output is a project worth saving
+PROJECT_HINTS = ["```", "<!doctype", "<html", "def ", "function", "class ", "import ", "const ", "let "]
+
+# Short display text for each log level
+SIMPLE_MESSAGES = {
+    "START": "🚀 Starting...",
+    "SUPERVISE": "🔍 Analyzing task...",
+    "PLAN": "📋 Planning...",
+    "EXECUTE": "⚙️  Executing...",
+    "REVIEW": "🔍 Reviewing...",
+    "VALIDATE": "🧪 Checking code...",
+    "CODE_REVIEW": "💻 Code review...",
+    "SUMMARY": "📝 Summarizing...",
+    "PROJECT": "📁 Creating project...",
+    "RUN": "🚀 Running...",
+    "MEMORY": "💾 Saving...",
+    "SUCCESS": "✅ Complete",
+    "ANALYZE": "📊 Analyzing...",
+    "DOCS": "📝 Generating docs...",
+    "CANCELLED": "⏹️  Cancelled",
+}
+
+def mentions(output, keywords):
+    """Whether text or an OutputBuffer contains any keyword, ignoring case, without a lowercased copy."""
+    pattern = "|".join(re.escape(keyword) for keyword in keywords)
+    if isinstance(output, OutputBuffer):
+        return output.contains(pattern, re.IGNORECASE)
+    return re.search(pattern, output, re.IGNORECASE) is not None
+
+# Ids of the runs in progress in this process, so two runs never share checkpoints
+_active_runs = set()
+_active_runs_lock = threading.Lock()
+
+def _claim_run(run_id):
+    """Mark a run id as in use; False if a running task already holds it."""
+    with _active_runs_lock:
+        if run_id in _active_runs:
+            return False
+        _active_runs.add(run_id)
+        return True
+
+def _release_run(run_id):
+    with _active_runs_lock:
+        _active_runs.discard(run_id)
+
+class RunContext:
+    """State for one task run: execution log, stage metrics, output sink,
+    cancellation token, token usage, the stage outputs produced so far and
+    the checkpoints being resumed from."""
+    
+    def __init__(self, task, sink=None, cancel=None, run_id=None, restored=None):
+        self.task = task
+        self.run_id = run_id
+        self.restored = restored or {}
+        self.sink = sink or get_renderer()
+        self.cancel = cancel or CancelToken()
+        self.usage = UsageTracker(run_id, task)
+        self.outputs = {}
         self.execution_log = []
-        self.max_retries = 3
-        # Always use the best Pro model for all tasks
-        self.complex_model = choose_model("complex")
-        self.simple_model = choose_model("complex")  # Use best model even for "simple" tasks
+        self.started_at = time.time()
+        self.stage_times = {}
+        self.current_stage = None
+    
+    def emit(self, text="", end="\n", sink=None):
+        """Send progress text or a streamed chunk to the sink (or another one, e.g. a DeferredSink)."""
+        (sink or self.sink).write(text + end)
     
     def log(self, message, level="INFO", verbose=False):
         """Log execution events - simplified output."""
@@ -30,33 +115,199 @@ class TaskOrchestrator:
         if verbose:
             return
         
-        # Simplify messages
-        simple_messages = {
-            "START": "🚀 Starting...",
-            "SUPERVISE": "🔍 Analyzing task...",
-            "PLAN": "📋 Planning...",
-            "EXECUTE": "⚙️  Executing...",
-            "REVIEW": "🔍 Reviewing...",
-            "CODE_REVIEW": "💻 Code review...",
-            "SUMMARY": "📝 Summarizing...",
-            "PROJECT": "📁 Creating project...",
-            "RUN": "🚀 Running...",
-            "MEMORY": "💾 Saving...",
-            "SUCCESS": "✅ Complete",
-            "ANALYZE": "📊 Analyzing...",
-            "DOCS": "📝 Generating docs...",
-        }
-        
         # Use simple message or original
-        display_msg = simple_messages.get(level, message)
+        display_msg = SIMPLE_MESSAGES.get(level, message)
         if level in ["INFO", "WARNING", "ERROR"]:
             # Only show important warnings/errors
             if level == "ERROR":
-                print(f"❌ Error: {message}")
+                self.emit(f"❌ Error: {message}")
             elif level == "WARNING" and "quota" not in message.lower():
                 return  # Skip quota warnings
         else:
-            print(display_msg)
+            self.emit(display_msg)
+    
+    def stream(self, name, chunks, sink=None):
+        """Emit streamed chunks and return the full text.
+        
+        Chunks are kept in an OutputBuffer under outputs[name] as they arrive,
+        so a cancelled stream still contributes its partial text to the result.
+        Once complete, the text replaces the buffer, which is closed.
+        """
+        output = self.outputs[name] = OutputBuffer()
+        for chunk in chunks:
+            self.emit(chunk, end="", sink=sink)
+            output.write(chunk)
+        self.emit(sink=sink)  # New line after streaming
+        text = self.outputs[name] = output.getvalue()
+        output.close()
+        return text
+    
+    def record(self, name, text):
+        """Keep a non-streamed stage output for partial results."""
+        self.outputs[name] = text
+    
+    def restore(self, stage, signature=None):
+        """Return the checkpointed output of a stage when resuming, else None.
+        
+        With a signature, a checkpoint saved with a different one (or none) is discarded.
+        """
+        output = self.restored.get(stage)
+        if output is not None and signature is not None and self.restored.get(f"{stage} signature") != signature:
+            self.log(f"Discarded {stage} checkpoint: it belongs to a different plan", "INFO", verbose=True)
+            output = None
+        if output is not None:
+            self.record(stage, output)
+            self.emit(f"↩️  Reusing {stage} from checkpoint")
+            self.log(f"Restored {stage} from checkpoint", "INFO", verbose=True)
+        return output
+    
+    def checkpoint(self, stage, output, signature=None):
+        """Durably store a completed stage output so a failed run can resume after it.
+        
+        A signature (e.g. of the inputs the output was built from) is stored after
+        the output, and restore() then only reuses the output for the same signature.
+        """
+        self.record(stage, output)
+        self.save_checkpoint(stage, output)
+        if signature is not None:
+            self.save_checkpoint(f"{stage} signature", signature)
+    
+    def save_checkpoint(self, stage, output):
+        try:
+            save_checkpoint(self.run_id, stage, output)
+        except Exception as e:
+            self.log(f"Checkpoint error: {str(e)}", "WARNING", verbose=True)
+    
+    def save_usage(self):
+        try:
+            save_usage(self.usage)
+        except Exception as e:
+            self.log(f"Usage error: {str(e)}", "WARNING", verbose=True)
+    
+    def partial_outputs(self):
+        return {name: output if isinstance(output, str) else output.getvalue()
+                for name, output in self.outputs.items()}
+    
+    def begin_stage(self, name):
+        """Start timing a pipeline stage, ending the current one.
+        
+        Raises Cancelled if the task was cancelled, so remaining stages are skipped.
+        """
+        self.end_stage()
+        self.cancel.check()
+        self.current_stage = (name, time.perf_counter())
+    
+    def end_stage(self):
+        if self.current_stage:
+            name, start = self.current_stage
+            elapsed = time.perf_counter() - start
+            # Kept unrounded: local stages take well under a millisecond, round only for display
+            self.stage_times[name] = self.stage_times.get(name, 0.0) + elapsed
+            self.current_stage = None
+    
+    def metrics(self):
+        """Wall time for the whole run and per stage (unrounded perf_counter sums), in seconds."""
+        self.end_stage()
+        return {
+            "total_s": round(time.time() - self.started_at, 3),
+            "stages": dict(self.stage_times)
+        }
+
+class StepPipeline:
+    """Executes plan steps on a worker thread while the plan is still streaming.
+    
+    feed() passes the plan chunks through and dispatches every step the
+    incremental parser finalizes; the worker runs them one at a time in
+    plan order, exactly as the sequential loop would. Step output is held
+    back until the plan has finished streaming so the two never
+    interleave. finish() compares the dispatched steps with the final
+    plan and keeps only the outputs of the matching prefix. Steps are
+    checkpointed before the plan is, so each checkpoint is signed with the
+    steps up to it (see execute_step).
+    """
+    
+    def __init__(self, orchestrator, ctx):
+        self.orchestrator = orchestrator
+        self.ctx = ctx
+        self.parser = PlanStream()
+        self.sink = DeferredSink(ctx.sink)
+        self.pending = queue.Queue()
+        self.dispatched = []
+        self.outputs = {}  # Step number -> output
+        self.limit = None  # Dispatched steps past this number are skipped
+        self.total = None  # Number of steps in the final plan, known once finish() runs
+        self.error = None
+        self.worker = threading.Thread(target=bind_profiler(bind(self._work)), daemon=True)
+        self.worker.start()
+    
+    def feed(self, chunks):
+        """Yield the plan chunks, dispatching steps as they are finalized."""
+        for chunk in chunks:
+            for step in self.parser.feed(chunk):
+                self.dispatched.append(step)
+                self.pending.put((len(self.dispatched), step, list(self.dispatched)))
+            yield chunk
+    
+    def restart(self, attempt, error):
+        """on_retry callback for the plan stream: stop dispatching and show the retry."""
+        self.parser.restart()
+        self.ctx.emit(f"\n[Retry {attempt}...]")
+        self.ctx.log(f"Plan stream restarted: {str(error)[:100]}", "WARNING", verbose=True)
+    
+    def _work(self):
+        step_outputs = {}
+        try:
+            while True:
+                item = self.pending.get()
+                if item is None:
+                    return
+                i, step, steps = item
+                if self.limit is not None and i > self.limit:
+                    continue
+                # Held until finish(), when the total is known
+                self.sink.write(lambda i=i: self._header(i))
+                output = self.orchestrator.execute_step(self.ctx, i, step, steps, step_outputs, sink=self.sink)
+                step_outputs[step["id"]] = self.outputs[i] = output
+        except BaseException as e:
+            self.error = e
+    
+    def _header(self, i):
+        if self.total is None:
+            return f"Step {i}...\n"  # Closed without a final plan
+        return f"Step {i}/{self.total}...\n" if self.total > 1 else ""
+    
+    def finish(self, steps):
+        """Wait for the worker and return {step number: output} for the dispatched steps that match steps."""
+        verified = 0
+        while (verified < min(len(steps), len(self.dispatched))
+               and steps[verified] == self.dispatched[verified]):
+            verified += 1
+        if verified < len(self.dispatched):
+            self.ctx.log(f"Plan changed after step {verified}; re-running later steps", "INFO", verbose=True)
+        self.total = len(steps)
+        self.close(verified)
+        if self.error is not None:
+            raise self.error
+        return {i: output for i, output in self.outputs.items() if i <= verified}
+    
+    def close(self, limit=0):
+        """Stop dispatching, let the worker finish steps up to limit and wait for it."""
+        self.limit = limit
+        self.pending.put(None)
+        self.sink.release()
+        self.worker.join()
+
+class TaskOrchestrator:
+    """Runs the agent pipeline. Holds no per-task state, so one instance can
+    serve many tasks, including concurrently from several threads."""
+    
+    def __init__(self, sink=None):
+        self.max_retries = 3
+        # Default sink for runs that don't pass their own
+        self.sink = sink
+        # Always use the best Pro model for all tasks
+        self.complex_model = choose_model("complex")
+        self.simple_model = choose_model("complex")  # Use best model even for "simple" tasks
     
     def check_clarification_needed(self, response):
         """Check if agent is asking for clarification."""
@@ -101,8 +352,9 @@ class TaskOrchestrator:
         
         return None
     
-    def _handle_project_analysis(self, task):
+    def _handle_project_analysis(self, ctx):
         """Handle project analysis and documentation generation."""
+        task = ctx.task
         try:
             project_path = self.extract_project_path(task)
             
@@ -111,45 +363,48 @@ class TaskOrchestrator:
                 projects_dir = "projects"
                 if os.path.exists(projects_dir):
                     projects = [os.path.join(projects_dir, d) for d in os.listdir(projects_dir) 
-                               if os.path.isdir(os.path.join(projects_dir, d))]
+                               if os.path.isdir(os.path.join(projects_dir, d)) and not d.startswith(".")]
                     if projects:
                         project_path = max(projects, key=os.path.getmtime)
-                        self.log(f"Using most recent project: {project_path}", "INFO")
+                        ctx.log(f"Using most recent project: {project_path}", "INFO")
                     else:
                         return {
                             "status": "error",
                             "message": "No project found to analyze. Please specify a project path.",
-                            "execution_log": self.execution_log
+                            "execution_log": ctx.execution_log
                         }
                 else:
                     return {
                         "status": "error",
                         "message": "No projects directory found. Please specify a project path.",
-                        "execution_log": self.execution_log
+                        "execution_log": ctx.execution_log
                     }
             
             if not os.path.exists(project_path):
                 return {
                     "status": "error",
                     "message": f"Project path does not exist: {project_path}",
-                    "execution_log": self.execution_log
+                    "execution_log": ctx.execution_log
                 }
             
-            self.log(f"Analyzing project", "ANALYZE")
-            print(f"📂 {os.path.basename(project_path)}")
+            ctx.begin_stage("analyze")
+            ctx.log(f"Analyzing project", "ANALYZE")
+            ctx.emit(f"📂 {os.path.basename(project_path)}")
             
             # Analyze project
             analyzer = ProjectAnalyzer(project_path)
             analysis = analyzer.analyze()
             summary = analyzer.generate_summary()
             
-            self.log("Analysis complete", "ANALYZE", verbose=True)
+            ctx.log("Analysis complete", "ANALYZE", verbose=True)
             
             # Generate documentation
-            self.log("Generating documentation", "DOCS")
+            ctx.begin_stage("docs")
+            ctx.log("Generating documentation", "DOCS")
             try:
-                doc_path, documentation = generate_project_documentation(project_path, "PROJECT_DOCUMENTATION.md")
-                print(f"📄 Documentation: {os.path.basename(doc_path)}")
+                doc_path, documentation = generate_project_documentation(project_path, "PROJECT_DOCUMENTATION.md", stream=True,
+                                                                         cancel=ctx.cancel)
+                ctx.emit(f"📄 Documentation: {os.path.basename(doc_path)}")
             except Exception as e:
                 # Create summary instead
                 doc_path = create_summary_md(project_path, task)
@@ -158,54 +413,334 @@ class TaskOrchestrator:
             # Create quick summary
             summary_path = create_summary_md(project_path, task)
             
-            self.log("Analysis complete", "SUCCESS")
+            ctx.log("Analysis complete", "SUCCESS")
             
             return {
                 "status": "success",
                 "final_output": f"Project Analysis Complete\n\n{summary}\n\nDocumentation: {doc_path}\nSummary: {summary_path}",
                 "summary": f"Analyzed project at {project_path}\n- Files: {analysis['complexity']['total_files']}\n- Lines: {analysis['complexity']['total_lines']}\n- Languages: {', '.join(analysis['languages'].keys())}",
-                "execution_log": self.execution_log,
+                "execution_log": ctx.execution_log,
                 "project_path": project_path,
-                "analysis": analysis
+                "analysis": analysis,
+                "metrics": ctx.metrics()
             }
             
         except Exception as e:
-            self.log(f"Project analysis error: {str(e)}", "ERROR")
+            ctx.log(f"Project analysis error: {str(e)}", "ERROR")
             return {
                 "status": "error",
                 "message": str(e),
-                "execution_log": self.execution_log
+                "execution_log": ctx.execution_log,
+                "metrics": ctx.metrics()
             }
     
+    def needs_code_review(self, validation):
+        """Decide from local validation whether the model code review is worth its cost."""
+        if CODE_REVIEW == "always":
+            return True
+        if CODE_REVIEW == "never":
+            return False
+        return bool(validation["errors"] or validation["unchecked"])
+    
     def extract_steps(self, plan_text):
-        """Extract numbered steps from plan text."""
-        steps = []
-        lines = plan_text.split('\n')
-        for line in lines:
-            line = line.strip()
-            # Look for numbered steps (1., 2., Step 1, etc.)
-            if (line and (line[0].isdigit() or line.lower().startswith('step'))):
-                # Remove numbering and clean
-                cleaned = line.split('.', 1)[-1].strip()
-                if cleaned and len(cleaned) > 5:  # Filter out very short lines
-                    steps.append(cleaned)
-        return steps if steps else [plan_text]  # Fallback to full text if no steps found
-    
-    def run_task(self, task):
-        """Main orchestrator function with full workflow."""
+        """Extract the steps of a JSON or free-text plan as executor instructions."""
+        return [format_step(step) for step in parse_plan(plan_text)]
+    
+    def step_context(self, step, steps, outputs):
+        """Outputs of earlier steps that a step needs, formatted as executor context.
+        
+        Steps of a JSON plan get the outputs of their dependencies and of what
+        those depend on in turn; steps of a free-text plan (depends_on None)
+        get every earlier output.
+        """
+        position = {s["id"]: n for n, s in enumerate(steps, 1)}
+        by_id = {s["id"]: s for s in steps}
+        if step["depends_on"] is None:
+            needed = set(outputs)
+        else:
+            needed, pending = set(), list(step["depends_on"])
+            while pending:
+                dep = pending.pop()
+                if dep in needed or dep not in by_id:
+                    continue
+                needed.add(dep)
+                pending.extend(by_id[dep]["depends_on"] or [])
+        return "".join(f"\nStep {position[d]} Output:\n{outputs[d]}\n"
+                       for d in sorted(needed, key=position.get) if d in outputs)
+    
+    def execute_step(self, ctx, i, step, steps, step_outputs, total=None, sink=None):
+        """Run one plan step with retries, or reuse its checkpoint when resuming. Returns its output.
+        
+        steps must contain every step up to this one; step_outputs holds the
+        outputs of the earlier steps by id. total is the number of steps for
+        the "Step i/N" header (None if the caller writes the header). The
+        checkpoint is signed with steps up to this one, so a resumed run whose
+        plan came out different doesn't reuse outputs of another plan's steps.
+        """
+        instructions = format_step(step)
+        previous_results = self.step_context(step, steps, step_outputs)
+        if total is not None and total > 1:
+            ctx.emit(f"Step {i}/{total}...", sink=sink)
+        ctx.log(f"Executing step {i}", "EXECUTE", verbose=True)
+        
+        signature = hashlib.sha256(json.dumps(steps[:i], sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        step_output = ctx.restore(f"step {i}", signature)
+        retry_count = 0
+        success = step_output is not None
+        if not success:
+            step_output = ""
+        
+        while retry_count < self.max_retries and not success:
+            try:
+                step_output += ctx.stream(f"step {i}", execute(instructions, self.simple_model, previous_results,
+                                                                cancel=ctx.cancel), sink=sink)
+                ctx.checkpoint(f"step {i}", step_output, signature)
+                success = True
+            except TruncatedResponse as e:
+                # Resending the same request would hit the same cap, so ask once for the rest instead
+                ctx.log(f"Step {i} output reached its token limit, requesting the rest", "WARNING")
+                step_output = self._continue_step(ctx, i, instructions, previous_results, e.text, signature, sink)
+                success = True
+            except Exception as e:
+                error_msg = str(e)
+                # Check if it's a quota error - the client should handle fallback automatically
+                # but we log it for visibility
+                if "quota" in error_msg.lower() or "429" in error_msg:
+                    ctx.log(f"Quota limit reached, system will auto-switch to free tier models", "INFO")
+                retry_count += 1
+                ctx.log(f"Execution error (attempt {retry_count}/{self.max_retries}): {str(e)[:100]}...", "WARNING")
+                if retry_count >= self.max_retries:
+                    step_output = f"[Error executing step: {str(e)}]"
+                    success = True  # Continue despite error
+        return step_output
+    
+    def _continue_step(self, ctx, i, instructions, previous_results, partial, signature, sink=None):
+        """Ask once for the rest of a step output cut off at the token cap; returns the whole output.
+        
+        A completed output is checkpointed. One that is still incomplete is
+        kept, marked, without a checkpoint, so a resume runs the step again.
+        """
+        try:
+            rest = ctx.stream(f"step {i} continued", execute(instructions, self.simple_model, previous_results,
+                                                             cancel=ctx.cancel, partial=partial), sink=sink)
+        except TruncatedResponse as e:
+            rest = e.text
+        except Exception as e:
+            ctx.log(f"Step {i} continuation error: {str(e)[:100]}...", "WARNING")
+            rest = ""
+        else:
+            ctx.checkpoint(f"step {i}", partial + rest, signature)
+            return partial + rest
+        ctx.log(f"Step {i} output is incomplete", "WARNING")
+        return partial + rest + "\n[Output truncated: the response reached max_output_tokens]"
+    
+    def run_task(self, task, sink=None, cancel=None, timeout=None, run_id=None, resume=False):
+        """Main orchestrator function with full workflow.
+
+        Output goes to sink (or the orchestrator's default sink, or stdout).
+        Each call gets its own RunContext, so calls may overlap.
+        
+        Cancelling the token, or the run passing `timeout` seconds, aborts
+        in-flight model calls, skips the remaining stages and returns status
+        "cancelled" with the outputs produced so far.
+        
+        Every completed stage is checkpointed under `run_id` (default: a new
+        unique id, returned under "run_id"). With resume=True, checkpointed
+        stages are reused instead of calling the model again; without a
+        run_id, the latest interrupted run of the same task is resumed. A
+        run id already in use by a running task is never shared: the second
+        run gets a new id instead.
+        
+        Token usage of every model call is returned under "usage" (per agent
+        and per model) and stored in memory for `main.py usage`.
+        
+        With profiling enabled (see profiling), the run is profiled and the
+        profile files are listed under "profile".
+        
+        When a generated project is run, run_task returns without waiting for
+        it: "project_run" is a concurrent.futures.Future resolving to the run
+        summary (see project_runner.start_project_run). Its output keeps going
+        to the sink until then.
+        """
+        if timeout:
+            cancel = CancelToken(timeout, parent=cancel)
+        if run_id is None and resume:
+            try:
+                run_id = find_run(task)
+            except Exception:
+                pass  # Start a new run
+        if run_id is not None and not _claim_run(run_id):
+            run_id = None  # Its checkpoints belong to the run in progress
+        restored = {}
+        if run_id is None:
+            run_id = new_run_id()
+            _claim_run(run_id)
+        else:
+            try:
+                if resume:
+                    restored = load_checkpoints(run_id)
+                else:
+                    clear_checkpoints(run_id)  # Don't mix stages from an earlier run under this id
+            except Exception:
+                pass  # Run without checkpoints
+        try:
+            result = self._run_profiled(RunContext(task, sink or self.sink, cancel, run_id, restored))
+        finally:
+            _release_run(run_id)
+        return result
+    
+    def _run_profiled(self, ctx):
+        """Run the pipeline with usage tracking (and profiling when enabled); adds "usage" and "profile"."""
+        profiler = TaskProfiler(ctx.run_id, ctx.task) if profiling_enabled() else None
+        # Model calls made on this thread while the run is active are recorded on ctx.usage
+        with ctx.usage:
+            if profiler is None:
+                result = self._run_pipeline(ctx)
+            else:
+                with profiler:
+                    result = self._run_pipeline(ctx)
+        result["usage"] = ctx.usage.summary()
+        ctx.save_usage()
+        if profiler is not None:
+            try:
+                result["profile"] = profiler.save(result.get("metrics"))
+            except OSError as e:
+                ctx.log(f"Profile error: {str(e)}", "WARNING", verbose=True)
+        return result
+    
+    def _review(self, ctx, combined_output):
+        """Review, validate, code review (when needed) and summarize in separate model calls.
+        
+        combined_output is the OutputBuffer of all step outputs. Returns
+        (final_output, summary, validation).
+        """
+        task = ctx.task
+        # Step 4: Review output
+        ctx.begin_stage("review")
+        ctx.log("Reviewing output", "REVIEW")
+        reviewed_output = ctx.restore("review")
+        try:
+            if reviewed_output is None:
+                reviewed_output = ctx.stream("review", review(task, combined_output.getvalue(), self.complex_model,
+                                                              cancel=ctx.cancel))
+                ctx.checkpoint("review", reviewed_output)
+        except Exception as e:
+            error_msg = str(e)
+            if "quota" in error_msg.lower() or "429" in error_msg:
+                ctx.log(f"Quota limit reached during review, system will auto-switch to free tier", "INFO")
+            ctx.log(f"Review error: {str(e)[:100]}...", "WARNING")
+            reviewed_output = combined_output.getvalue()
+        
+        # Step 5: Code Review (if code is detected and local checks call for it)
+        final_output = reviewed_output
+        validation = None
+        if mentions(reviewed_output, CODE_HINTS):
+            ctx.begin_stage("validate")
+            ctx.log("Validating code", "VALIDATE")
+            validation = validate_files(extract_code_blocks(reviewed_output))
+            ctx.log(f"Validated {validation['files']} file(s): {len(validation['errors'])} error(s), "
+                    f"{len(validation['warnings'])} warning(s), {len(validation['unchecked'])} unchecked",
+                    "VALIDATE", verbose=True)
+        
+        if validation is not None and self.needs_code_review(validation):
+            ctx.begin_stage("code_review")
+            ctx.log("Reviewing code", "CODE_REVIEW")
+            try:
+                code_reviewed = ctx.restore("code_review")
+                if code_reviewed is None:
+                    code_reviewed = review_code(task, reviewed_output, self.complex_model, cancel=ctx.cancel,
+                                                diagnostics=format_diagnostics(validation))
+                    ctx.checkpoint("code_review", code_reviewed)
+                final_output = code_reviewed
+                ctx.log("Code review complete", "CODE_REVIEW")
+            except Exception as e:
+                error_msg = str(e)
+                if "quota" in error_msg.lower() or "429" in error_msg:
+                    ctx.log(f"Quota limit reached during code review, system will auto-switch to free tier", "INFO")
+                ctx.log(f"Code review error: {str(e)[:100]}...", "WARNING")
+        
+        # Step 6: Final Summary
+        ctx.begin_stage("summary")
+        ctx.log("Generating summary", "SUMMARY")
+        try:
+            summary = ctx.restore("summary")
+            if summary is None:
+                summary = summarize(task, "\n".join(ctx.execution_log), final_output, self.complex_model,
+                                    cancel=ctx.cancel)
+                ctx.checkpoint("summary", summary)
+            ctx.log("Summary generated", "SUMMARY")
+        except Exception as e:
+            error_msg = str(e)
+            if "quota" in error_msg.lower() or "429" in error_msg:
+                ctx.log(f"Quota limit reached during summary, system will auto-switch to free tier", "INFO")
+            ctx.log(f"Summary error: {str(e)[:100]}...", "WARNING")
+            summary = f"Task completed. Final output: {final_output[:200]}..."
+        
+        return final_output, summary, validation
+    
+    def _fused_review(self, ctx, combined_output):
+        """Review, code review and summary in one streamed call with sectioned output.
+        
+        Local validation runs first so its diagnostics are part of the prompt.
+        Falls back to the separate calls if the fused call fails or its
+        response has no code section. Returns (final_output, summary, validation).
+        """
+        task = ctx.task
+        validation = None
+        diagnostics = ""
+        if mentions(combined_output, CODE_HINTS):
+            ctx.begin_stage("validate")
+            ctx.log("Validating code", "VALIDATE")
+            validation = validate_files(extract_code_blocks(combined_output))
+            if validation["errors"] or validation["warnings"] or validation["unchecked"]:
+                diagnostics = format_diagnostics(validation)
+        
+        ctx.begin_stage("final_review")
+        ctx.log("Reviewing output", "REVIEW")
+        try:
+            response = ctx.restore("final_review")
+            if response is None:
+                response = ctx.stream("final_review", final_review(task, combined_output.getvalue(),
+                                                                   self.complex_model, cancel=ctx.cancel,
+                                                                   diagnostics=diagnostics))
+                ctx.checkpoint("final_review", response)
+        except Exception as e:
+            ctx.log(f"Fused review error: {str(e)[:100]}..., reviewing separately", "WARNING")
+            return self._review(ctx, combined_output)
+        
+        sections = parse_final_review(response)
+        if not sections["code"]:
+            ctx.log("Fused review returned no code section, reviewing separately", "WARNING", verbose=True)
+            return self._review(ctx, combined_output)
+        if sections["verdict"]:
+            ctx.log(f"Review verdict: {sections['verdict']}", "REVIEW", verbose=True)
+        if validation is not None:
+            # Report on the corrected code, not the draft the diagnostics came from
+            ctx.begin_stage("validate")
+            validation = validate_files(extract_code_blocks(sections["code"]))
+        summary = sections["summary"] or f"Task completed. Final output: {sections['code'][:200]}..."
+        return sections["code"], summary, validation
+    
+    def _run_pipeline(self, ctx):
+        task, run_id = ctx.task, ctx.run_id
         try:
-            self.execution_log = []
-            self.log(f"Starting task: {task}", "START")
+            ctx.log(f"Starting task: {task}", "START")
             
             # Check if this is a project analysis task
             if self.is_project_analysis_task(task):
-                return self._handle_project_analysis(task)
+                return self._handle_project_analysis(ctx)
+            
+            ctx.save_checkpoint("task", task)
             
             # Step 1: Supervision - Split and analyze task
-            self.log("Supervising task", "SUPERVISE")
+            ctx.begin_stage("supervise")
+            ctx.log("Supervising task", "SUPERVISE")
             try:
-                supervision_result = supervise(task, self.complex_model)
-                self.log("Supervision complete", "SUPERVISE", verbose=True)
+                supervision_result = ctx.restore("supervise")
+                if supervision_result is None:
+                    supervision_result = supervise(task, self.complex_model, cancel=ctx.cancel)
+                    ctx.checkpoint("supervise", supervision_result)
+                ctx.log("Supervision complete", "SUPERVISE", verbose=True)
                 
                 # Ignore clarification requests - proceed anyway
                 if self.check_clarification_needed(supervision_result):
@@ -214,165 +749,173 @@ class TaskOrchestrator:
                         supervision_result = supervision_result.split("EXECUTION PLAN:")[-1]
                     # Continue execution - don't return early
             except Exception as e:
-                self.log(f"Supervision error: {str(e)}", "ERROR")
+                ctx.log(f"Supervision error: {str(e)}", "ERROR")
                 # Continue with basic planning if supervision fails
             
             # Step 2: Planning - Create detailed plan
-            self.log("Planning execution", "PLAN")
-            plan_output = ""
+            ctx.begin_stage("plan")
+            ctx.log("Planning execution", "PLAN")
+            plan_output = ctx.restore("plan")
+            pipeline = None
+            plan_steps = None  # The complete steps of a plan cut off at its token cap
             try:
-                # Get previous context from memory
-                memory_context = fetch_memory()
-                context = f"Previous tasks: {str(memory_context[-3:]) if len(memory_context) > 0 else 'None'}"
-                
-                for chunk in plan(task, self.complex_model, context):
-                    print(chunk, end="", flush=True)
-                    plan_output += chunk
-                print()  # New line after streaming
+                if plan_output is None:
+                    # Get relevant previous tasks from memory
+                    context = relevant_context(task)
+                    
+                    if PIPELINED_PLAN:
+                        # Start on each step as soon as the plan finalizes it
+                        pipeline = StepPipeline(self, ctx)
+                        chunks = pipeline.feed(plan(task, self.complex_model, context, cancel=ctx.cancel,
+                                                    on_retry=pipeline.restart))
+                    else:
+                        chunks = plan(task, self.complex_model, context, cancel=ctx.cancel)
+                    plan_output = ctx.stream("plan", chunks)
+                    ctx.checkpoint("plan", plan_output)
                 
                 # Ignore clarification requests - proceed anyway
                 if self.check_clarification_needed(plan_output):
-                    self.log("Note: Planning suggested clarification, but proceeding with execution anyway", "INFO")
+                    ctx.log("Note: Planning suggested clarification, but proceeding with execution anyway", "INFO")
                     # Extract execution plan if it exists
                     if "EXECUTION PLAN:" in plan_output:
                         plan_output = plan_output.split("EXECUTION PLAN:")[-1]
                     # Continue execution - don't return early
+            except TruncatedResponse as e:
+                # Keep the steps that were complete before the cap (the pipeline may be running them);
+                # the plan is not checkpointed, so a resume plans again
+                plan_steps = PlanStream().feed(e.text)
+                ctx.log(f"Plan reached its token limit; continuing with {len(plan_steps)} complete step(s)",
+                        "WARNING")
+                plan_output = e.text if plan_steps else f"Execute task: {task}"
             except Exception as e:
-                self.log(f"Planning error: {str(e)}", "ERROR")
+                ctx.log(f"Planning error: {str(e)}", "ERROR")
                 plan_output = f"Execute task: {task}"
+            except BaseException:
+                if pipeline is not None:
+                    pipeline.close()
+                raise
             
             # Step 3: Extract and execute steps
-            steps = self.extract_steps(plan_output)
-            self.log(f"Executing {len(steps)} step(s)", "EXECUTE", verbose=True)
+            ctx.begin_stage("execute")
+            steps = plan_steps or parse_plan(plan_output)
+            # Outputs of steps the pipeline already ran that match the final plan
+            executed = pipeline.finish(steps) if pipeline is not None else {}
+            ctx.log(f"Executing {len(steps)} step(s)", "EXECUTE", verbose=True)
             
-            execution_results = []
-            previous_results = ""
+            step_outputs = {}  # Step id -> output
+            # All step outputs, built as they complete instead of joined at the end
+            combined_output = OutputBuffer()
             
             for i, step in enumerate(steps, 1):
-                if len(steps) > 1:
-                    print(f"Step {i}/{len(steps)}...")
-                self.log(f"Executing step {i}", "EXECUTE", verbose=True)
-                
-                step_output = ""
-                retry_count = 0
-                success = False
-                
-                while retry_count < self.max_retries and not success:
-                    try:
-                        for chunk in execute(step, self.simple_model, previous_results):
-                            print(chunk, end="", flush=True)
-                            step_output += chunk
-                        print()  # New line after streaming
-                        success = True
-                    except Exception as e:
-                        error_msg = str(e)
-                        # Check if it's a quota error - the client should handle fallback automatically
-                        # but we log it for visibility
-                        if "quota" in error_msg.lower() or "429" in error_msg:
-                            self.log(f"Quota limit reached, system will auto-switch to free tier models", "INFO")
-                        retry_count += 1
-                        self.log(f"Execution error (attempt {retry_count}/{self.max_retries}): {str(e)[:100]}...", "WARNING")
-                        if retry_count >= self.max_retries:
-                            step_output = f"[Error executing step: {str(e)}]"
-                            success = True  # Continue despite error
-                
-                execution_results.append({
-                    "step": step,
-                    "output": step_output
-                })
-                previous_results += f"\nStep {i} Output:\n{step_output}\n"
-            
-            # Combine all execution results
-            combined_output = "\n\n".join([f"Step {i+1}: {r['output']}" for i, r in enumerate(execution_results)])
-            
-            # Step 4: Review output
-            self.log("Reviewing output", "REVIEW")
-            reviewed_output = ""
-            try:
-                for chunk in review(task, combined_output, self.complex_model):
-                    print(chunk, end="", flush=True)
-                    reviewed_output += chunk
-                print()  # New line after streaming
-            except Exception as e:
-                error_msg = str(e)
-                if "quota" in error_msg.lower() or "429" in error_msg:
-                    self.log(f"Quota limit reached during review, system will auto-switch to free tier", "INFO")
-                self.log(f"Review error: {str(e)[:100]}...", "WARNING")
-                reviewed_output = combined_output
+                step_output = executed.get(i)
+                if step_output is None:
+                    step_output = self.execute_step(ctx, i, step, steps, step_outputs, total=len(steps))
+                step_outputs[step["id"]] = step_output
+                if i > 1:
+                    combined_output.write("\n\n")
+                combined_output.write(f"Step {i}: ")
+                combined_output.write(step_output)
             
-            # Step 5: Code Review (if code is detected)
-            final_output = reviewed_output
-            if any(keyword in reviewed_output.lower() for keyword in ["def ", "class ", "import ", "function", "code"]):
-                self.log("Reviewing code", "CODE_REVIEW")
-                try:
-                    code_reviewed = review_code(task, reviewed_output, self.complex_model)
-                    final_output = code_reviewed
-                    self.log("Code review complete", "CODE_REVIEW")
-                except Exception as e:
-                    error_msg = str(e)
-                    if "quota" in error_msg.lower() or "429" in error_msg:
-                        self.log(f"Quota limit reached during code review, system will auto-switch to free tier", "INFO")
-                    self.log(f"Code review error: {str(e)[:100]}...", "WARNING")
-            
-            # Step 6: Final Summary
-            self.log("Generating summary", "SUMMARY")
-            try:
-                summary = summarize(task, "\n".join(self.execution_log), final_output, self.complex_model)
-                self.log("Summary generated", "SUMMARY")
-            except Exception as e:
-                error_msg = str(e)
-                if "quota" in error_msg.lower() or "429" in error_msg:
-                    self.log(f"Quota limit reached during summary, system will auto-switch to free tier", "INFO")
-                self.log(f"Summary error: {str(e)[:100]}...", "WARNING")
-                summary = f"Task completed. Final output: {final_output[:200]}..."
+            # Steps 4-6: Review, code review and summary, as separate calls or one fused call
+            if FUSED_REVIEW:
+                final_output, summary, validation = self._fused_review(ctx, combined_output)
+            else:
+                final_output, summary, validation = self._review(ctx, combined_output)
+            combined_output.close()
             
             # Step 7: Create project folder and save files
             project_path = None
             saved_files = []
+            project_run = None
             try:
                 # Check if output contains code (likely a project)
-                if any(keyword in final_output.lower() for keyword in 
-                       ["```", "<!doctype", "<html", "def ", "function", "class ", "import ", "const ", "let "]):
-                    self.log("Creating project", "PROJECT")
-                    project_path, saved_files = setup_project(task, final_output, summary)
+                if mentions(final_output, PROJECT_HINTS):
+                    ctx.begin_stage("project")
+                    ctx.log("Creating project", "PROJECT")
+                    # A resumed run updates the project it already created
+                    project_path, saved_files = setup_project(task, final_output, summary,
+                                                              ctx.restored.get("project"))
+                    ctx.save_checkpoint("project", project_path)
                     if project_path:
-                        print(f"📁 Project: {os.path.basename(project_path)}")
+                        ctx.emit(f"📁 Project: {os.path.basename(project_path)}")
                     
                     # Try to run the project
                     if saved_files:
-                        self.log("Running project", "RUN", verbose=True)
-                        run_success = run_project(project_path)
+                        ctx.log("Running project", "RUN", verbose=True)
+                        open_in_browser(project_path, sink=ctx.sink)
+                        # Runs in the background while the task is saved to memory
+                        project_run = start_project_run(
+                            project_path,
+                            on_output=lambda target, text: ctx.emit(f"[{target}] {text}", end=""),
+                            cancel=ctx.cancel
+                        )
             except Exception as e:
-                self.log(f"Project creation error: {str(e)}", "WARNING", verbose=True)
+                ctx.log(f"Project creation error: {str(e)}", "WARNING", verbose=True)
             
-            # Step 8: Save to memory
+            # Step 8: Save to memory (the project run started in step 7 continues in the background)
+            ctx.begin_stage("memory")
             try:
-                save_task(task, final_output)
-                self.log("Saved to memory", "MEMORY", verbose=True)
+                save_task(task, final_output, project_path)
+                ctx.log("Saved to memory", "MEMORY", verbose=True)
             except Exception as e:
                 pass  # Silent fail for memory
             
-            self.log("Task completed", "SUCCESS")
+            try:
+                clear_checkpoints(run_id)
+            except Exception:
+                pass
+            
+            ctx.log("Task completed", "SUCCESS")
             
             return {
                 "status": "success",
+                "run_id": run_id,
                 "final_output": final_output,
                 "summary": summary,
-                "execution_log": self.execution_log,
+                "execution_log": ctx.execution_log,
                 "steps_executed": len(steps),
+                "plan": steps,
                 "project_path": project_path,
-                "saved_files": saved_files
+                "saved_files": saved_files,
+                "validation": validation,
+                "project_run": project_run,
+                "metrics": ctx.metrics()
             }
             
+        except Cancelled as e:
+            ctx.log(f"Task cancelled: {e}", "CANCELLED")
+            outputs = ctx.partial_outputs()
+            return {
+                "status": "cancelled",
+                "run_id": run_id,
+                "message": str(e),
+                "final_output": next((text for text in reversed(outputs.values()) if text), ""),
+                "outputs": outputs,
+                "execution_log": ctx.execution_log,
+                "metrics": ctx.metrics()
+            }
         except Exception as e:
-            self.log(f"Critical error: {str(e)}", "ERROR")
+            ctx.log(f"Critical error: {str(e)}", "ERROR")
             return {
                 "status": "error",
+                "run_id": run_id,
                 "message": str(e),
-                "execution_log": self.execution_log
+                "execution_log": ctx.execution_log,
+                "metrics": ctx.metrics()
             }
 
-def run_task(task):
+# Shared orchestrator for module-level run_task calls
+_orchestrator = None
+_orchestrator_lock = threading.Lock()
+
+def get_orchestrator():
+    """Return the process-wide orchestrator, creating it on first use."""
+    global _orchestrator
+    with _orchestrator_lock:
+        if _orchestrator is None:
+            _orchestrator = TaskOrchestrator()
+        return _orchestrator
+
+def run_task(task, sink=None, cancel=None, timeout=None, run_id=None, resume=False):
     """Main entry point for running a task."""
-    orchestrator = TaskOrchestrator()
-    return orchestrator.run_task(task)
+    return get_orchestrator().run_task(task, sink, cancel, timeout, run_id, resume)
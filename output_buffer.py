@@ -0,0 +1,101 @@
+"""
+Output Buffer - Append-only text buffer for streamed stage outputs.
+
+Chunks are kept in a list and joined only when the text is read; the
+joined text then replaces the chunks, so it is held once. Past
+SPILL_CHARS the content moves to a temporary file, and view() exposes it
+as an mmap so stages that scan bytes (code block extraction, code hint
+checks) can read it without loading it into memory.
+"""
+
+import os
+import re
+import mmap
+import tempfile
+import threading
+from contextlib import contextmanager
+
+# Keep outputs up to this many characters in memory, spill larger ones to a temp file (0 = never spill)
+SPILL_CHARS = int(os.getenv("AGENT_OUTPUT_SPILL_CHARS", str(8 * 1024 * 1024)))
+
+class OutputBuffer:
+    """Text built from chunks, held in memory or spilled to disk."""
+
+    def __init__(self, spill_chars=None):
+        self.spill_chars = SPILL_CHARS if spill_chars is None else spill_chars
+        self.chunks = []
+        self.length = 0
+        self.file = None
+        self.lock = threading.Lock()
+
+    @property
+    def spilled(self):
+        return self.file is not None
+
+    def write(self, text):
+        if not text:
+            return
+        with self.lock:
+            self.length += len(text)
+            if self.file is not None:
+                self.file.write(text.encode("utf-8"))
+                return
+            self.chunks.append(text)
+            if self.spill_chars and self.length > self.spill_chars:
+                self._spill()
+
+    def _spill(self):
+        self.file = tempfile.TemporaryFile(prefix="agent_output_")
+        for chunk in self.chunks:
+            self.file.write(chunk.encode("utf-8"))
+        self.chunks = []
+
+    def getvalue(self):
+        """The whole text. A spilled buffer is decoded from its file on every call."""
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+                with mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                    return str(view[:], "utf-8")
+            if len(self.chunks) > 1:
+                self.chunks = ["".join(self.chunks)]
+            return self.chunks[0] if self.chunks else ""
+
+    @contextmanager
+    def view(self):
+        """Read-only UTF-8 bytes of the content: an mmap of the spill file, else a memoryview.
+
+        Both support re with bytes patterns. Don't write while the view is open.
+        """
+        if self.file is None:
+            yield memoryview(self.getvalue().encode("utf-8"))
+            return
+        with self.lock:
+            self.file.flush()
+            view = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield view
+        finally:
+            view.close()
+
+    def contains(self, pattern, flags=0):
+        """Whether a regex (given as a str pattern) matches anywhere in the content."""
+        if self.file is None:
+            return re.search(pattern, self.getvalue(), flags) is not None
+        with self.view() as view:
+            return re.search(pattern.encode("utf-8"), view, flags) is not None
+
+    def close(self):
+        """Drop the content and delete the spill file."""
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            self.chunks = []
+            self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def __str__(self):
+        return self.getvalue()
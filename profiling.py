@@ -0,0 +1,268 @@
+"""
+Profiling - Per-task CPU, memory and stage-time profiles.
+
+With profiling on (`--profile` on main.py, including batch and serve, or
+AGENT_PROFILE=1), every run_task call is wrapped in a TaskProfiler:
+
+- CPU: cProfile, or pyinstrument's sampling profiler when it is installed
+  (AGENT_PROFILER=auto|cprofile|sampling). Both cover the thread running the
+  task plus workers started through bind_profiler (the pipelined step
+  executor); other threads are not profiled.
+- Memory: tracemalloc snapshots before and after the task, and the peak
+  traced memory while it ran. tracemalloc is process-wide, so with
+  concurrent tasks both include allocations made by other tasks in the same
+  window. A task starting resets the peak only after passing it on to the
+  tasks still running, so each one's peak covers its whole run.
+- Stages: the run's stage timers (RunContext.metrics).
+
+Files go to AGENT_PROFILE_DIR (default "profiles"), named after the run id
+and time (with a -2, -3, ... suffix if a profile by that name exists):
+<name>.pstats (cProfile; python -m pstats, snakeviz) or <name>.speedscope.json
+(sampling; https://www.speedscope.app), and <name>.txt with the stage times,
+self time per area (model API, regex, filesystem, SQLite, waiting), the
+top-N hot functions and the top allocation sites.
+"""
+
+import io
+import os
+import re
+import time
+import itertools
+import pstats
+import cProfile
+import threading
+import tracemalloc
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+    from pyinstrument.renderers import SpeedscopeRenderer
+except ImportError:
+    SamplingProfiler = None
+    SpeedscopeRenderer = None
+
+# Profile every task (1 = on); main.py --profile turns this on too
+PROFILE = os.getenv("AGENT_PROFILE", "0") == "1"
+PROFILE_DIR = os.getenv("AGENT_PROFILE_DIR", "profiles")
+# "auto" (sampling when pyinstrument is installed, else cProfile), "cprofile" or "sampling"
+PROFILER = os.getenv("AGENT_PROFILER", "auto")
+# Hot functions and allocation sites listed per task
+TOP_N = int(os.getenv("AGENT_PROFILE_TOP", "20"))
+# Frames kept per tracemalloc allocation
+TRACEMALLOC_FRAMES = 1
+
+# Where self time goes, matched against "file:line(function)" of each profiled function, first match wins
+AREAS = [
+    ("model API", re.compile(r"gemini_client|google[/\\.]|grpc|urllib3|requests[/\\]|http[/\\.]|_ssl|ssl\.py|socket",
+                             re.IGNORECASE)),
+    ("sqlite", re.compile(r"sqlite", re.IGNORECASE)),
+    ("regex", re.compile(r"[/\\]re[/\\]|_sre|sre_|re\.Pattern")),
+    ("filesystem", re.compile(r"\bposix\.|\bnt\.|scandir|[/\\]os\.py|pathlib|shutil|_io\.|io\.open|fsync|mmap")),
+    ("waiting", re.compile(r"acquire|sleep|wait|select|poll")),
+]
+
+_enabled = PROFILE
+_local = threading.local()
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_owned = False  # Started by us, so stopped by us
+_tracing = set()  # TaskProfilers between __enter__ and __exit__
+
+def enable_profiling(directory=None):
+    """Profile every task from now on, writing files to directory (default PROFILE_DIR)."""
+    global _enabled, PROFILE_DIR
+    _enabled = True
+    if directory:
+        PROFILE_DIR = directory
+
+def profiling_enabled():
+    return _enabled
+
+def _use_sampling():
+    if PROFILER == "sampling" and SamplingProfiler is None:
+        raise ImportError("AGENT_PROFILER=sampling needs pyinstrument: pip install pyinstrument")
+    return SamplingProfiler is not None and PROFILER in ("auto", "sampling")
+
+def _start_tracemalloc(profiler):
+    """Start tracing for a profiler, resetting the peak once the running profilers have taken it."""
+    global _tracemalloc_owned
+    with _tracemalloc_lock:
+        if not _tracing and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            _tracemalloc_owned = True
+        peak = tracemalloc.get_traced_memory()[1]
+        for other in _tracing:
+            other.peak_bytes = max(other.peak_bytes, peak)
+        tracemalloc.reset_peak()
+        _tracing.add(profiler)
+
+def _stop_tracemalloc(profiler):
+    """Stop tracing for a profiler, settling its peak; returns it in bytes."""
+    global _tracemalloc_owned
+    with _tracemalloc_lock:
+        peak = max(profiler.peak_bytes, tracemalloc.get_traced_memory()[1])
+        _tracing.discard(profiler)
+        if not _tracing and _tracemalloc_owned:
+            tracemalloc.stop()
+            _tracemalloc_owned = False
+    return peak
+
+class TaskProfiler:
+    """Profiles one task run. Use as a context manager around the run, then save()."""
+
+    def __init__(self, name, task=None):
+        self.name = re.sub(r"[^\w.-]", "_", name)
+        self.task = task
+        self.sampling = _use_sampling()
+        self.profilers = []  # (thread name, profiler) for the task thread and bound workers
+        self.main = None
+        self.lock = threading.Lock()
+        self.error = None
+        self.before = None
+        self.after = None
+        self.peak_bytes = 0
+        self.started = None
+        self.wall_s = 0.0
+
+    def _new_profiler(self):
+        return SamplingProfiler() if self.sampling else cProfile.Profile()
+
+    def _profile_thread(self):
+        """Start a profiler on the calling thread; returns it, or None when one can't run here."""
+        profiler = self._new_profiler()
+        try:
+            if self.sampling:
+                profiler.start()
+            else:
+                profiler.enable()
+        except (ValueError, RuntimeError) as e:
+            # e.g. Python 3.12+ allows one active cProfile at a time
+            self.error = f"CPU profile incomplete: {e}"
+            return None
+        with self.lock:
+            self.profilers.append((threading.current_thread().name, profiler))
+        return profiler
+
+    def _stop_profiler(self, profiler):
+        if profiler is None:
+            return
+        if self.sampling:
+            profiler.stop()
+        else:
+            profiler.disable()
+
+    def __enter__(self):
+        _local.profiler = self
+        self.peak_bytes = 0
+        _start_tracemalloc(self)
+        self.before = tracemalloc.take_snapshot()
+        self.started = time.perf_counter()
+        self.main = self._profile_thread()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop_profiler(self.main)
+        self.wall_s = time.perf_counter() - self.started
+        self.after = tracemalloc.take_snapshot()
+        self.peak_bytes = _stop_tracemalloc(self)
+        _local.profiler = None
+        return False
+
+    def stats(self):
+        """Merged pstats.Stats of all profiled threads (cProfile only)."""
+        with self.lock:
+            profilers = [p for _, p in self.profilers]
+        if self.sampling or not profilers:
+            return None
+        stats = pstats.Stats(profilers[0], stream=io.StringIO())
+        for profiler in profilers[1:]:
+            stats.add(profiler)
+        return stats
+
+    def areas(self, stats):
+        """Self time per area (AREAS, else "other"), largest first."""
+        totals = {}
+        for (filename, line, function), (_, _, tottime, _, _) in stats.stats.items():
+            label = f"{filename}:{line}({function})"
+            area = next((name for name, pattern in AREAS if pattern.search(label)), "other")
+            totals[area] = totals.get(area, 0.0) + tottime
+        return sorted(totals.items(), key=lambda item: -item[1])
+
+    def allocations(self, top=TOP_N):
+        """Top allocation sites by growth over the task: (location, size_diff bytes, count_diff)."""
+        if self.before is None or self.after is None:
+            return []
+        diff = self.after.compare_to(self.before, "lineno")
+        return [(str(stat.traceback[0]), stat.size_diff, stat.count_diff) for stat in diff[:top]
+                if stat.size_diff > 0]
+
+    @staticmethod
+    def _claim(stem):
+        """Claim a new profile's base path by creating its summary file exclusively."""
+        for n in itertools.count(1):
+            base = stem if n == 1 else f"{stem}-{n}"
+            try:
+                with open(base + ".txt", "x"):
+                    return base
+            except FileExistsError:
+                continue
+
+    def save(self, metrics=None, top=TOP_N):
+        """Write the profile files; returns {"cpu": path, "summary": path, "hot": [...], ...}."""
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = self._claim(os.path.join(PROFILE_DIR, f"{self.name}-{time.strftime('%Y%m%d_%H%M%S')}"))
+        lines = [f"Profile of {self.name}" + (f": {self.task}" if self.task else ""),
+                 f"Wall time: {self.wall_s:.3f}s", f"Peak traced memory: {self.peak_bytes / 1e6:.1f} MB"]
+        if self.error:
+            lines.append(self.error)
+        if metrics:
+            lines += ["", "Stages (s):"] + [f"  {name:<14} {seconds:>9.3f}"
+                                            for name, seconds in metrics.get("stages", {}).items()]
+
+        hot = []
+        cpu_path = None
+        stats = self.stats()
+        if stats is not None:
+            cpu_path = base + ".pstats"
+            stats.dump_stats(cpu_path)
+            lines += ["", "Self time by area (s):"] + [f"  {area:<14} {seconds:>9.3f}"
+                                                       for area, seconds in self.areas(stats)]
+            entries = sorted(stats.stats.items(), key=lambda item: -item[1][2])[:top]
+            for (filename, line, function), (calls, _, tottime, cumtime, _) in entries:
+                hot.append({"function": f"{os.path.basename(filename)}:{line}({function})", "calls": calls,
+                            "self_s": round(tottime, 4), "cumulative_s": round(cumtime, 4)})
+            lines += ["", f"Top {len(hot)} functions by self time:",
+                      f"  {'self s':>9} {'cum s':>9} {'calls':>9}  function"]
+            lines += [f"  {h['self_s']:>9.4f} {h['cumulative_s']:>9.4f} {h['calls']:>9}  {h['function']}"
+                      for h in hot]
+        elif self.sampling and self.profilers:
+            # One speedscope file per profiled thread would split the view; keep the task thread's
+            thread_name, profiler = self.profilers[0]
+            cpu_path = base + ".speedscope.json"
+            with open(cpu_path, "w") as f:
+                f.write(profiler.output(renderer=SpeedscopeRenderer()))
+            lines += ["", f"Sampled call tree ({thread_name}):", profiler.output_text(unicode=False, color=False)]
+
+        allocations = self.allocations(top)
+        if allocations:
+            lines += ["", f"Top {len(allocations)} allocation sites (growth during the task):"]
+            lines += [f"  {size / 1e3:>10.1f} KB {count:>8} blocks  {location}"
+                      for location, size, count in allocations]
+
+        summary_path = base + ".txt"
+        with open(summary_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        return {"cpu": cpu_path, "summary": summary_path, "wall_s": round(self.wall_s, 3),
+                "peak_mb": round(self.peak_bytes / 1e6, 2), "hot": hot[:5]}
+
+def bind_profiler(fn):
+    """Wrap fn so it is profiled into this thread's active TaskProfiler when run on another thread."""
+    profiler = getattr(_local, "profiler", None)
+    if profiler is None:
+        return fn
+
+    def wrapper(*args, **kwargs):
+        thread_profiler = profiler._profile_thread()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler._stop_profiler(thread_profiler)
+    return wrapper
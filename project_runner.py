@@ -0,0 +1,272 @@
+"""
+Project Runner - Runs generated projects in sandboxed, resource-limited subprocesses.
+
+Every entry point and test file found in a project runs in parallel, each in
+its own copy of the project inside a temporary directory, with CPU, memory,
+file-size and wall-clock limits. Output is streamed line by line and capped.
+"""
+
+import os
+import sys
+import time
+import shutil
+import signal
+import tempfile
+import threading
+import subprocess
+import importlib.util
+from concurrent.futures import Future, ThreadPoolExecutor
+
+try:
+    import resource  # POSIX only - elsewhere runs get the wall-clock limit only
+except ImportError:
+    resource = None
+
+# Limits per run
+RUN_TIMEOUT = int(os.getenv("AGENT_RUN_TIMEOUT", "30"))
+CPU_SECONDS = int(os.getenv("AGENT_RUN_CPU_SECONDS", "20"))
+MEMORY_MB = int(os.getenv("AGENT_RUN_MEMORY_MB", "512"))
+MAX_FILE_MB = 50
+MAX_OUTPUT_BYTES = 64 * 1024
+# Longest line read at once, so output without newlines can't grow unbounded
+MAX_LINE_BYTES = 8192
+# Runs executing at the same time across all tasks
+MAX_PARALLEL_RUNS = max(2, min(8, os.cpu_count() or 2))
+
+PYTHON_ENTRY_POINTS = ("main.py", "app.py", "script.py")
+JS_ENTRY_POINTS = ("index.js", "main.js", "app.js", "script.js")
+# Environment variables passed through to runs (DISPLAY lets GUI programs open windows)
+ENV_PASSTHROUGH = ("PATH", "LANG", "LC_ALL", "DISPLAY", "WAYLAND_DISPLAY", "XAUTHORITY", "SYSTEMROOT")
+# Dependency and build folders never searched for entry points or tests
+SKIP_DIRS = {"node_modules", "__pycache__", "venv", "env", "site-packages", "vendor", "build", "dist"}
+# Copied into the sandbox but never needed by a run
+COPY_IGNORE = shutil.ignore_patterns(".doc_cache", "__pycache__", "node_modules", ".git")
+
+# Applies the limits inside the child, then execs the real command. A launcher
+# is used instead of preexec_fn, which is unsafe in a multi-threaded parent.
+_LAUNCHER = """
+import os, sys, resource
+cpu, memory, fsize = (int(v) for v in sys.argv[1:4])
+resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+if memory:
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+resource.setrlimit(resource.RLIMIT_FSIZE, (fsize, fsize))
+resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+os.execvp(sys.argv[4], sys.argv[4:])
+"""
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=MAX_PARALLEL_RUNS, thread_name_prefix="project-run")
+        return _pool
+
+def _is_python_test(name):
+    return name.endswith(".py") and (name.startswith("test_") or name.endswith("_test.py"))
+
+def _is_js_test(name):
+    return name.endswith((".test.js", ".spec.js"))
+
+def _project_files(project_path):
+    """Paths of the project's files relative to its root, skipping hidden and vendored folders."""
+    files = []
+    for root, dirs, names in os.walk(project_path):
+        dirs[:] = [d for d in dirs if not d.startswith(".") and d not in SKIP_DIRS]
+        rel = os.path.relpath(root, project_path)
+        files.extend(n if rel == os.curdir else os.path.join(rel, n) for n in names)
+    return files
+
+def _entry_point(files, names):
+    """The shallowest of files, preferring the conventional entry point names."""
+    def rank(path):
+        name = os.path.basename(path)
+        return (path.count(os.sep), names.index(name) if name in names else len(names), path)
+    return min(files, key=rank)
+
+def discover_targets(project_path):
+    """Return (name, command) pairs for the project's entry points and test files.
+
+    Names are paths relative to the project root, which is where runs start.
+    """
+    files = sorted(_project_files(project_path))
+    targets = []
+
+    py_tests = [f for f in files if _is_python_test(os.path.basename(f))]
+    py_files = [f for f in files if f.endswith(".py") and f not in py_tests]
+    if py_files:
+        entry = _entry_point(py_files, PYTHON_ENTRY_POINTS)
+        targets.append((entry, [sys.executable, entry]))
+    has_pytest = importlib.util.find_spec("pytest") is not None
+    for test in py_tests:
+        targets.append((test, [sys.executable, "-m", "pytest", "-q", test] if has_pytest else [sys.executable, test]))
+
+    node = shutil.which("node")
+    if node:
+        # Node caps its own heap; V8 reserves more address space than RLIMIT_AS would allow
+        node_command = [node, f"--max-old-space-size={MEMORY_MB}"]
+        # Scripts next to an HTML page are browser code, not Node programs
+        page_dirs = {os.path.dirname(f) for f in files if f.endswith(".html")}
+        js_tests = [f for f in files if _is_js_test(os.path.basename(f))]
+        js_files = [f for f in files if f.endswith(".js") and not f.endswith(".min.js") and f not in js_tests
+                    and os.path.dirname(f) not in page_dirs]
+        if js_files:
+            entry = _entry_point(js_files, JS_ENTRY_POINTS)
+            targets.append((entry, node_command + [entry]))
+        for test in js_tests:
+            targets.append((test, node_command + ["--test", test]))
+
+    return targets
+
+def _sandboxed(command):
+    """Wrap a command with the rlimit launcher where the platform supports it."""
+    if resource is None:
+        return command
+    # Node's heap is capped by --max-old-space-size instead
+    memory = 0 if os.path.basename(command[0]).startswith("node") else MEMORY_MB * 1024 * 1024
+    return [sys.executable, "-c", _LAUNCHER, str(CPU_SECONDS), str(memory),
+            str(MAX_FILE_MB * 1024 * 1024)] + command
+
+def _sandbox_env(workdir):
+    env = {name: os.environ[name] for name in ENV_PASSTHROUGH if name in os.environ}
+    tmp = os.path.join(workdir, "tmp")
+    os.makedirs(tmp, exist_ok=True)
+    env.update(HOME=workdir, TMPDIR=tmp, TEMP=tmp, TMP=tmp,
+               PYTHONUNBUFFERED="1", PYTHONDONTWRITEBYTECODE="1")
+    return env
+
+def _kill(proc):
+    """Kill the run and anything it started."""
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def _drain(stream, name, on_output, captured):
+    """Read the run's output, forwarding and keeping it up to MAX_OUTPUT_BYTES."""
+    size = 0
+    for raw in iter(lambda: stream.readline(MAX_LINE_BYTES), b""):
+        if size >= MAX_OUTPUT_BYTES:
+            continue  # Keep draining so the run never blocks on a full pipe
+        line = raw[:MAX_OUTPUT_BYTES - size].decode("utf-8", errors="replace")
+        size += len(raw)
+        captured.append(line)
+        if on_output:
+            on_output(name, line)
+        if size >= MAX_OUTPUT_BYTES:
+            captured.append("\n[output truncated]\n")
+            if on_output:
+                on_output(name, "\n[output truncated]\n")
+    stream.close()
+
+def run_target(project_path, name, command, on_output=None, cancel=None, timeout=RUN_TIMEOUT):
+    """Run one command against a private copy of the project and return a result dict."""
+    start = time.perf_counter()
+    workdir = tempfile.mkdtemp(prefix="agent-run-")
+    captured = []
+    status = "error"
+    returncode = None
+    try:
+        project_copy = os.path.join(workdir, "project")
+        shutil.copytree(project_path, project_copy, ignore=COPY_IGNORE)
+
+        proc = subprocess.Popen(
+            _sandboxed(command),
+            cwd=project_copy,
+            env=_sandbox_env(workdir),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            start_new_session=True
+        )
+        reader = threading.Thread(target=_drain, args=(proc.stdout, name, on_output, captured), daemon=True)
+        reader.start()
+
+        deadline = time.monotonic() + timeout
+        status = None
+        while True:
+            try:
+                returncode = proc.wait(timeout=0.1)
+                break
+            except subprocess.TimeoutExpired:
+                if cancel and cancel.cancelled:
+                    status = "cancelled"
+                elif time.monotonic() >= deadline:
+                    status = "timeout"
+                if status:
+                    _kill(proc)
+                    returncode = proc.wait()
+                    break
+        reader.join(timeout=5)
+        if status is None:
+            status = "passed" if returncode == 0 else "failed"
+    except Exception as e:
+        status = "error"
+        captured.append(f"[Could not run {name}: {e}]\n")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "target": name,
+        "command": " ".join(command),
+        "status": status,
+        "returncode": returncode,
+        "duration_s": round(time.perf_counter() - start, 3),
+        "output": "".join(captured)
+    }
+
+def start_project_run(project_path, on_output=None, cancel=None, timeout=RUN_TIMEOUT):
+    """Run every target of a project in parallel without blocking the caller.
+
+    Args:
+        project_path: Project folder to run
+        on_output: Optional callback(target_name, text) receiving output as it arrives
+        cancel: Optional CancelToken; cancelling kills the runs
+        timeout: Wall-clock seconds allowed per target
+
+    Returns a Future resolving to {"project_path", "success", "targets": [result, ...]}.
+    """
+    summary = Future()
+    targets = discover_targets(project_path)
+    if not targets:
+        summary.set_result({"project_path": project_path, "success": False, "targets": []})
+        return summary
+
+    pool = _get_pool()
+    futures = [pool.submit(run_target, project_path, name, command, on_output, cancel, timeout)
+               for name, command in targets]
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def collect(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        try:
+            results = [f.result() for f in futures]
+        except Exception as e:
+            summary.set_exception(e)
+            return
+        summary.set_result({
+            "project_path": project_path,
+            "success": all(r["status"] == "passed" for r in results),
+            "targets": results
+        })
+
+    for future in futures:
+        future.add_done_callback(collect)
+    return summary
+
+def run_summary(project_run, project_path):
+    """The summary of a finished project run, or a failed summary if the run raised."""
+    error = project_run.exception()
+    if error is None:
+        return project_run.result()
+    return {"project_path": project_path, "success": False, "targets": [], "error": str(error)}
@@ -57,6 +57,25 @@ Create a clear, actionable plan with:
 If the task is unclear, ask specific clarifying questions.
 """
 
+def structured_planner_prompt(task, context=""):
+    return f"""
+You are a Planning Agent. Break the task into the steps an executor should run, one model call per step.
+
+TASK: {task}
+{f'CONTEXT: {context}' if context else ''}
+
+Respond with JSON only, in this shape:
+{{"steps": [{{"id": 1, "title": "...", "description": "...", "depends_on": [], "complexity": "simple", "expected_files": ["main.py"]}}]}}
+
+RULES:
+1. Only list real work steps - no sub-bullets, risks, assumptions or questions as separate steps
+2. Each step must produce concrete output (usually complete files); merge trivial steps
+3. "depends_on" lists the ids of earlier steps whose output this step needs
+4. "complexity" is "simple" or "complex"
+5. "expected_files" lists the files the step creates or changes
+6. Never ask for clarification - make reasonable assumptions
+"""
+
 def executor_prompt(step, previous_results=""):
     previous_section = f'PREVIOUS RESULTS:\n{previous_results}' if previous_results else ''
     return f"""
@@ -92,6 +111,18 @@ Or for HTML files:
 Execute now:
 """
 
+def continuation_prompt(prompt, partial):
+    """The prompt again, asking for the rest of a response that was cut off at the output token limit."""
+    return f"""{prompt}
+
+Your previous response to this was cut off at the output length limit. Continue it from exactly
+where it stops. Do not repeat any text that is already there and do not start over; if it stops
+inside a code block, continue the code without reopening the block.
+
+RESPONSE SO FAR (last part):
+{partial[-8000:]}
+"""
+
 def reviewer_prompt(task, output):
     return f"""
 You are a Review Agent. Review the output against the original task and correct any mistakes.
@@ -112,7 +143,11 @@ INSTRUCTIONS:
 Review and provide the corrected output:
 """
 
-def code_reviewer_prompt(task, code_output):
+def code_reviewer_prompt(task, code_output, diagnostics=""):
+    validation = f"""
+LOCAL VALIDATION (syntax checks already run on the extracted files - fix these first):
+{diagnostics}
+""" if diagnostics else ""
     return f"""
 You are a Code Reviewer Agent. Review the following code output for errors, best practices, and improvements.
 
@@ -121,6 +156,7 @@ ORIGINAL TASK:
 
 CODE TO REVIEW:
 {code_output}
+{validation}
 
 INSTRUCTIONS:
 1. Check for syntax errors, bugs, and logical issues
@@ -157,3 +193,32 @@ Create a summary that includes:
 
 Provide a clear, structured summary:
 """
+
+def final_review_prompt(task, output, diagnostics=""):
+    validation = f"""
+LOCAL VALIDATION (syntax checks already run on the extracted files - fix these first):
+{diagnostics}
+""" if diagnostics else ""
+    return f"""
+Review the output below against the original task, correct its code and summarize the work, all in one response.
+
+ORIGINAL TASK:
+{task}
+
+OUTPUT TO REVIEW:
+{output}
+{validation}
+
+Respond with exactly these three sections, each marker on its own line:
+
+===VERDICT===
+One short paragraph: does the output fully solve the task, and what did you fix?
+
+===CODE===
+The complete corrected output, with every file in a fenced code block named like ```python:main.py
+Include all files, not only the changed ones.
+
+===SUMMARY===
+Task overview, key deliverables, issues and resolutions, final status (Success/Partial/Failed)
+and next steps.
+"""
@@ -0,0 +1,224 @@
+"""
+Renderer - Frame-rate-limited terminal output for task progress and streamed text.
+
+Task output is handed to a Renderer instead of being written to the
+terminal chunk by chunk. Text is buffered and written at most FPS times per
+second, one write and flush per frame, so a fast model streaming hundreds
+of small chunks costs a few syscalls and redraws per second instead of one
+per chunk.
+
+Concurrent tasks each write to a pane. On a terminal every running pane has
+a status line at the bottom, redrawn each frame with the task's latest
+output, while complete lines scroll above it (or go only to the log file
+when there is one). Elsewhere (pipes, files) pane lines are prefixed with
+the pane name.
+
+In quiet mode task output goes only to the log file; notices (results,
+reports, prompts) still reach the terminal.
+"""
+
+import os
+import sys
+import atexit
+import shutil
+import threading
+
+# Terminal frames per second (0 = write every chunk immediately)
+FPS = float(os.getenv("AGENT_RENDER_FPS", "20"))
+# Send task output only to the log file (1 = on)
+QUIET = os.getenv("AGENT_QUIET", "0") == "1"
+# Also append all output to this file
+LOG_FILE = os.getenv("AGENT_LOG_FILE") or None
+# Log file used by quiet mode when none is configured
+DEFAULT_LOG_FILE = "agent_output.log"
+
+# Move the cursor up N lines to column 0, then clear to the end of the screen
+_CLEAR_LINES = "\x1b[{}F\x1b[J"
+
+class Pane:
+    """Output of one of several concurrent tasks. A sink."""
+
+    def __init__(self, renderer, name):
+        self.renderer = renderer
+        self.name = name
+        self.partial = ""  # Current incomplete line
+        self.last = ""  # Latest complete line, shown while the next one streams
+
+    def write(self, text):
+        self.renderer._pane_write(self, text)
+
+    def close(self):
+        """Finish the pane: emit its incomplete line and drop its status line."""
+        self.renderer._pane_close(self)
+
+class Renderer:
+    """Buffered, frame-rate-limited writer for the terminal and an optional log file.
+
+    Used directly it is a sink for a single task's output; pane(name)
+    returns a sink per concurrent task. A background thread draws frames;
+    flush() draws one immediately (e.g. before prompting for input).
+    """
+
+    def __init__(self, stream=None, fps=None, log_file=None, quiet=False):
+        self.stream = stream or sys.stdout
+        self.fps = FPS if fps is None else fps
+        self.quiet = quiet
+        if quiet and not log_file:
+            log_file = DEFAULT_LOG_FILE
+        self.log = open(log_file, "a", encoding="utf-8") if log_file else None
+        isatty = getattr(self.stream, "isatty", None)
+        self.tty = bool(isatty and isatty())
+        self.lock = threading.Lock()
+        # Serializes frames, so the flusher thread and flush() never interleave writes
+        self.frame_lock = threading.Lock()
+        self.pending = []  # Terminal text since the last frame
+        self.logged = []  # Log text since the last frame
+        self.panes = {}
+        self.drawn = []  # Status lines drawn by the last frame
+        self.frames = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    # --- Sink interface (single task) ---
+
+    def write(self, text):
+        """Task output; kept off the terminal in quiet mode."""
+        with self.lock:
+            if not self.quiet:
+                self.pending.append(text)
+            if self.log:
+                self.logged.append(text)
+        self._schedule()
+
+    def close(self):
+        """Sinks are closed when their task ends; the renderer itself lives on, so just draw."""
+        self.flush()
+
+    def notice(self, text):
+        """CLI output (results, reports), shown on the terminal even in quiet mode."""
+        with self.lock:
+            self.pending.append(text)
+            if self.log:
+                self.logged.append(text)
+        self._schedule()
+
+    def pane(self, name):
+        pane = Pane(self, name)
+        with self.lock:
+            self.panes[name] = pane
+        return pane
+
+    # --- Panes ---
+
+    def _pane_write(self, pane, text):
+        with self.lock:
+            pane.partial += text
+            if "\n" not in pane.partial:
+                return
+            complete, pane.partial = pane.partial.rsplit("\n", 1)
+            lines = complete.split("\n")
+            pane.last = next((line for line in reversed(lines) if line.strip()), pane.last)
+            self._pane_lines(pane, lines)
+        self._schedule()
+
+    def _pane_lines(self, pane, lines):
+        text = "".join(f"[{pane.name}] {line}\n" for line in lines)
+        if self.log:
+            self.logged.append(text)
+        # With a log file, a terminal shows only the status lines
+        if not self.quiet and not (self.tty and self.log):
+            self.pending.append(text)
+
+    def _pane_close(self, pane):
+        with self.lock:
+            if pane.partial:
+                self._pane_lines(pane, [pane.partial])
+                pane.partial = ""
+            if self.panes.get(pane.name) is pane:
+                del self.panes[pane.name]
+        self._schedule()
+
+    def _status(self, width):
+        lines = []
+        for pane in self.panes.values():
+            text = " ".join((pane.partial.strip() or pane.last).split())
+            # Stay within one terminal line, or the next redraw would miscount lines
+            lines.append(f"[{pane.name}] {text}"[:max(10, width - 1)])
+        return lines
+
+    # --- Frames ---
+
+    def _schedule(self):
+        if self.fps <= 0 or self.stopped.is_set():
+            self.flush()
+        elif self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, daemon=True)
+                    self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(1.0 / self.fps):
+            self.flush()
+
+    def flush(self):
+        """Draw one frame: buffered text, then the status lines of running panes."""
+        with self.frame_lock:
+            with self.lock:
+                text = "".join(self.pending)
+                log_text = "".join(self.logged)
+                self.pending, self.logged = [], []
+                status = self._status(shutil.get_terminal_size().columns) if self.tty and not self.quiet else []
+                if status:
+                    # Keep an incomplete line back until it ends; status lines go below whole lines only
+                    cut = text.rfind("\n") + 1
+                    if cut < len(text):
+                        self.pending.append(text[cut:])
+                        text = text[:cut]
+                drawn, self.drawn = self.drawn, status
+                log = self.log
+            if log_text and log is not None:
+                log.write(log_text)
+                log.flush()
+            if not text and status == drawn:
+                return
+            frame = _CLEAR_LINES.format(len(drawn)) if drawn else ""
+            frame += text + "".join(line + "\n" for line in status)
+            self.stream.write(frame)
+            self.stream.flush()
+            self.frames += 1
+
+    def shutdown(self):
+        """Stop the frame thread, draw what is left and close the log file."""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+        # Under both locks, so no frame is writing to the log as it closes
+        with self.frame_lock, self.lock:
+            log, self.log = self.log, None
+        if log is not None:
+            log.close()
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+def get_renderer():
+    """Return the process-wide renderer, creating it from the environment on first use."""
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = Renderer(log_file=LOG_FILE, quiet=QUIET)
+            atexit.register(_renderer.shutdown)
+        return _renderer
+
+def configure(quiet=None, log_file=None, fps=None):
+    """Replace the process-wide renderer, e.g. from command line options. None keeps the environment's setting."""
+    global _renderer
+    with _renderer_lock:
+        previous = _renderer
+        _renderer = Renderer(fps=fps, log_file=log_file or LOG_FILE, quiet=QUIET if quiet is None else quiet)
+        atexit.register(_renderer.shutdown)
+    if previous is not None:
+        previous.shutdown()
+    return _renderer
@@ -0,0 +1,309 @@
+"""
+Service - Long-lived HTTP/JSON server that runs tasks from a bounded job queue.
+
+Endpoints:
+    POST /tasks              {"task": "...", "resume": false} -> 202 with the job id (429 when the queue is full)
+    GET  /tasks/<id>         Job status and, once finished, its result
+    GET  /tasks/<id>/stream  Server-sent events: agent and project run output chunks, then a final "done" event
+    DELETE /tasks/<id>       Cancel a queued or running job
+    GET  /health             Queue depth, worker counts and prefix cache hit rate
+"""
+
+import json
+import time
+import uuid
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from sinks import CallbackSink
+from cancellation import CancelToken
+from renderer import get_renderer
+from project_runner import run_summary
+
+# Finished jobs kept in memory for status/stream requests
+MAX_FINISHED_JOBS = 500
+# Most recently finished jobs whose streamed chunks are kept for replay; older ones keep only their result
+MAX_REPLAYABLE_JOBS = 20
+# Seconds clients should wait before retrying when the queue is full
+RETRY_AFTER = 5
+
+class Job:
+    def __init__(self, task, resume=False):
+        self.id = uuid.uuid4().hex[:12]
+        self.task = task
+        # Resume the latest interrupted run of the same task instead of running under the job id
+        self.resume = resume
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.cancel = CancelToken()
+        self.chunks = []
+        self.dropped = 0  # Chunks discarded from the front of chunks
+        # Set once no more chunks will arrive: the task and its project run have ended
+        self.output_done = False
+        self.changed = threading.Condition()
+
+    def append_chunk(self, text):
+        with self.changed:
+            self.chunks.append(text)
+            self.changed.notify_all()
+
+    def drop_chunks(self):
+        """Free the streamed output; streams then go straight to the result."""
+        with self.changed:
+            self.dropped += len(self.chunks)
+            self.chunks = []
+
+    def finish(self, result):
+        """Record the task's result. A project run still in progress is reported as
+        running and filled in when it completes."""
+        project_run = result.get("project_run")
+        if project_run is not None:
+            result["project_run"] = {"status": "running"}
+        with self.changed:
+            self.result = result
+            self.status = result.get("status", "error")
+            self.finished_at = time.time()
+            self.output_done = project_run is None
+            self.changed.notify_all()
+        if project_run is not None:
+            project_path = result.get("project_path")
+            project_run.add_done_callback(lambda future: self._project_run_done(run_summary(future, project_path)))
+
+    def _project_run_done(self, summary):
+        with self.changed:
+            self.result["project_run"] = summary
+            self.output_done = True
+            self.changed.notify_all()
+
+    @property
+    def done(self):
+        return self.finished_at is not None
+
+    def to_dict(self, include_result=True):
+        data = {
+            "id": self.id,
+            "task": self.task,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+        if include_result and self.result is not None:
+            data["result"] = self.result
+        return data
+
+class TaskService:
+    """Bounded job queue served by a fixed pool of worker threads."""
+
+    def __init__(self, workers=2, queue_size=16, task_timeout=None):
+        self.workers = workers
+        # Seconds a job may run before it is cancelled
+        self.task_timeout = task_timeout
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.jobs = {}
+        self.finished = []
+        self.lock = threading.Lock()
+        self.running = 0
+        self.threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"task-worker-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, task, resume=False):
+        """Queue a task; returns the job, or None when the queue is full."""
+        job = Job(task, resume)
+        # Registered first, so a worker picking it up at once can already look it up
+        with self.lock:
+            self.jobs[job.id] = job
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            with self.lock:
+                self.jobs.pop(job.id, None)
+            return None
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Cancel a job; returns it, or None if unknown."""
+        job = self.get(job_id)
+        if job is not None and not job.done:
+            job.cancel.cancel("Cancelled by client")
+        return job
+
+    def stats(self):
+        from gemini_client import prefix_cache_stats
+
+        with self.lock:
+            stats = {
+                "workers": self.workers,
+                "running": self.running,
+                "queued": self.queue.qsize(),
+                "queue_capacity": self.queue.maxsize,
+                "jobs": len(self.jobs)
+            }
+        stats["prefix_cache"] = prefix_cache_stats()
+        return stats
+
+    def _worker(self):
+        from orchestrator import get_orchestrator
+
+        # All workers share one orchestrator; each job streams to its own sink
+        orchestrator = get_orchestrator()
+        while True:
+            job = self.queue.get()
+            if job.cancel.cancelled:
+                # Cancelled while queued - never started
+                job.finish({"status": "cancelled", "message": job.cancel.reason})
+                self._retire(job)
+                self.queue.task_done()
+                continue
+            with self.lock:
+                self.running += 1
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                result = orchestrator.run_task(job.task, sink=CallbackSink(job.append_chunk),
+                                               cancel=job.cancel, timeout=self.task_timeout,
+                                               run_id=None if job.resume else job.id, resume=job.resume)
+            except Exception as e:
+                result = {"status": "error", "message": str(e)}
+            finally:
+                with self.lock:
+                    self.running -= 1
+            job.finish(result)
+            self._retire(job)
+            self.queue.task_done()
+
+    def _retire(self, job):
+        """Drop the streamed chunks of finished jobs beyond MAX_REPLAYABLE_JOBS and
+        forget the oldest finished jobs beyond MAX_FINISHED_JOBS."""
+        with self.lock:
+            self.finished.append(job.id)
+            while len(self.finished) > MAX_FINISHED_JOBS:
+                self.jobs.pop(self.finished.pop(0), None)
+            expired = self.jobs.get(self.finished[-MAX_REPLAYABLE_JOBS - 1]) \
+                if len(self.finished) > MAX_REPLAYABLE_JOBS else None
+        if expired is not None:
+            expired.drop_chunks()
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    service = None  # Set by serve()
+
+    def log_message(self, format, *args):
+        pass  # Keep the console for task output
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/tasks":
+            return self._send_json(404, {"error": "Not found"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            task = payload.get("task", "").strip()
+            resume = bool(payload.get("resume", False))
+        except (ValueError, AttributeError):
+            return self._send_json(400, {"error": "Body must be JSON like {\"task\": \"...\"}"})
+        if not task:
+            return self._send_json(400, {"error": "Missing 'task'"})
+
+        job = self.service.submit(task, resume)
+        if job is None:
+            return self._send_json(429, {"error": "Queue is full, retry later", **self.service.stats()},
+                                   {"Retry-After": str(RETRY_AFTER)})
+        self._send_json(202, {
+            "id": job.id,
+            "status": job.status,
+            "status_url": f"/tasks/{job.id}",
+            "stream_url": f"/tasks/{job.id}/stream"
+        })
+
+    def do_GET(self):
+        parts = [p for p in self.path.split("?")[0].split("/") if p]
+        if parts == ["health"]:
+            return self._send_json(200, {"status": "ok", **self.service.stats()})
+        if len(parts) in (2, 3) and parts[0] == "tasks":
+            job = self.service.get(parts[1])
+            if job is None:
+                return self._send_json(404, {"error": "Unknown job"})
+            if len(parts) == 2:
+                return self._send_json(200, job.to_dict())
+            if parts[2] == "stream":
+                return self._stream(job)
+        self._send_json(404, {"error": "Not found"})
+
+    def do_DELETE(self):
+        parts = [p for p in self.path.split("?")[0].split("/") if p]
+        if len(parts) != 2 or parts[0] != "tasks":
+            return self._send_json(404, {"error": "Not found"})
+        job = self.service.cancel(parts[1])
+        if job is None:
+            return self._send_json(404, {"error": "Unknown job"})
+        self._send_json(202, job.to_dict(include_result=False))
+
+    def _stream(self, job):
+        """Send the job's output as server-sent events until it finishes, including its project run."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        sent = 0  # Chunks sent or dropped, counted from the job's first chunk
+        try:
+            while True:
+                with job.changed:
+                    while sent == job.dropped + len(job.chunks) and not job.output_done:
+                        job.changed.wait(timeout=15)
+                        if sent == job.dropped + len(job.chunks) and not job.output_done:
+                            break  # Idle - send a keep-alive
+                    pending = job.chunks[max(0, sent - job.dropped):]
+                    sent = job.dropped + len(job.chunks)
+                    finished = job.output_done
+
+                if pending:
+                    for chunk in pending:
+                        self.wfile.write(f"event: chunk\ndata: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                else:
+                    self.wfile.write(b": keep-alive\n\n")
+                if finished:
+                    self.wfile.write(f"event: done\ndata: {json.dumps(job.to_dict(), default=str)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                if finished:
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Client went away - the job keeps running
+
+def serve(host="127.0.0.1", port=8080, workers=2, queue_size=16, task_timeout=None):
+    """Start the task service and block until interrupted."""
+    service = TaskService(workers=workers, queue_size=queue_size, task_timeout=task_timeout)
+    service.start()
+    ServiceHandler.service = service
+
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    renderer = get_renderer()
+    renderer.notice(f"🌐 Serving on http://{host}:{port} ({workers} worker(s), queue {queue_size})\n")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        renderer.notice("\n👋 Shutting down\n")
+    finally:
+        server.server_close()
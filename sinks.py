@@ -0,0 +1,126 @@
+"""
+Sinks - Destinations for task progress messages and streamed agent output.
+
+The orchestrator writes everything a task displays to a sink instead of
+printing, so concurrent tasks can each send output somewhere different.
+"""
+
+import sys
+import threading
+
+# Shared by every stdout sink so writes from different tasks never interleave mid-write
+_stdout_lock = threading.Lock()
+
+class StdoutSink:
+    """Write output to stdout.
+
+    With a prefix, output is line-buffered and every line is prefixed
+    (e.g. "[task-3] "), which keeps concurrent tasks readable.
+    """
+
+    def __init__(self, prefix=None, stream=None):
+        self.prefix = prefix
+        self.stream = stream or sys.stdout
+        self.pending = ""
+
+    def write(self, text):
+        if not self.prefix:
+            with _stdout_lock:
+                self.stream.write(text)
+                self.stream.flush()
+            return
+
+        self.pending += text
+        if "\n" not in self.pending:
+            return
+        complete, self.pending = self.pending.rsplit("\n", 1)
+        lines = "".join(f"{self.prefix}{line}\n" for line in complete.split("\n"))
+        with _stdout_lock:
+            self.stream.write(lines)
+            self.stream.flush()
+
+    def close(self):
+        if self.pending:
+            self.write("\n")
+
+class CallbackSink:
+    """Pass output to a callable, e.g. a job's chunk list."""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def write(self, text):
+        self.callback(text)
+
+    def close(self):
+        pass
+
+class BufferSink:
+    """Collect output in memory."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, text):
+        self.chunks.append(text)
+
+    def getvalue(self):
+        return "".join(self.chunks)
+
+    def close(self):
+        pass
+
+class NullSink:
+    """Discard output."""
+
+    def write(self, text):
+        pass
+
+    def close(self):
+        pass
+
+class TeeSink:
+    """Send output to several sinks."""
+
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def write(self, text):
+        for sink in self.sinks:
+            sink.write(text)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+class DeferredSink:
+    """Hold output until release(), then pass it and everything after it to another sink, in order.
+    
+    Used for output produced in the background that must not interleave
+    with what is currently streaming. write() also takes a callable, whose
+    text is produced only when it is passed on (for text that depends on
+    what is known at release).
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.held = []
+        self.released = False
+        self.lock = threading.Lock()
+
+    def write(self, text):
+        with self.lock:
+            if not self.released:
+                self.held.append(text)
+                return
+        self.sink.write(text() if callable(text) else text)
+
+    def release(self):
+        with self.lock:
+            for text in self.held:
+                self.sink.write(text() if callable(text) else text)
+            self.held = []
+            self.released = True
+
+    def close(self):
+        self.release()
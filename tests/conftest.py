@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# gemini_client refuses to import without a key; the parsers under test never call the API
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+# memory.memory opens its database on import; keep it out of the repository
+os.environ.setdefault("AGENT_MEMORY_DB", os.path.join(tempfile.mkdtemp(prefix="agent_memory_"), "agent_memory.db"))
@@ -0,0 +1,82 @@
+import json
+import sys
+import types
+
+import pytest
+
+import batch_runner
+from batch_runner import BatchRunner, load_checkpoint, load_tasks
+from sinks import NullSink
+
+class QuietRenderer(NullSink):
+    def notice(self, text):
+        pass
+
+    def pane(self, name):
+        return NullSink()
+
+class FakeOrchestrator:
+    def __init__(self):
+        self.tasks = []
+
+    def run_task(self, task, **options):
+        self.tasks.append(task)
+        return {"status": "success", "final_output": f"did {task}"}
+
+@pytest.fixture
+def orchestrator(monkeypatch):
+    orchestrator = FakeOrchestrator()
+    monkeypatch.setitem(sys.modules, "orchestrator", types.SimpleNamespace(get_orchestrator=lambda: orchestrator))
+    monkeypatch.setattr(batch_runner, "get_renderer", QuietRenderer)
+    return orchestrator
+
+def write_lines(path, lines):
+    path.write_text("".join(line + "\n" for line in lines))
+
+def test_load_tasks_accepts_every_line_format(tmp_path):
+    path = tmp_path / "tasks.jsonl"
+    write_lines(path, [
+        json.dumps({"id": "a", "task": "build a"}),
+        json.dumps({"request_id": "b", "title": "Build b", "body": "Details"}),
+        "",
+        json.dumps("build c"),
+    ])
+    assert load_tasks(str(path)) == [
+        {"id": "a", "task": "build a"},
+        {"id": "b", "task": "Build b\n\nDetails"},
+        {"id": "line-4", "task": "build c"},
+    ]
+
+def test_checkpoint_skips_recorded_tasks_except_cancelled_ones(tmp_path):
+    path = tmp_path / "results.jsonl"
+    write_lines(path, [
+        json.dumps({"id": "a", "status": "success"}),
+        json.dumps({"id": "b", "status": "error"}),
+        json.dumps({"id": "c", "status": "cancelled"}),
+    ])
+    path.write_text(path.read_text() + '{"id": "d", "sta')  # Cut off by a crash
+    assert load_checkpoint(str(path)) == {"a", "b"}
+    assert load_checkpoint(str(path), retry_failed=True) == {"a"}
+
+def test_resumed_batch_runs_only_unfinished_tasks(tmp_path, orchestrator):
+    tasks = tmp_path / "tasks.jsonl"
+    write_lines(tasks, [json.dumps({"id": name, "task": f"build {name}"}) for name in "abc"])
+    results = tmp_path / "results.jsonl"
+    write_lines(results, [json.dumps({"id": "a", "status": "success", "latency_s": 1.0})])
+    results.write_text(results.read_text() + '{"id": "b", "sta')
+
+    report = BatchRunner(workers=2).run(str(tasks), str(results))
+    assert sorted(orchestrator.tasks) == ["build b", "build c"]
+    assert report["tasks"] == 2 and report["skipped"] == 1
+    records = [json.loads(line) for line in results.read_text().splitlines()]
+    assert sorted(record["id"] for record in records) == ["a", "b", "c"]
+
+def test_fresh_batch_overwrites_earlier_results(tmp_path, orchestrator):
+    tasks = tmp_path / "tasks.jsonl"
+    write_lines(tasks, [json.dumps({"id": "a", "task": "build a"})])
+    results = tmp_path / "results.jsonl"
+    write_lines(results, [json.dumps({"id": "a", "status": "success", "latency_s": 1.0})])
+
+    BatchRunner(workers=1).run(str(tasks), str(results), resume=False)
+    assert orchestrator.tasks == ["build a"]
+    assert len(results.read_text().splitlines()) == 1
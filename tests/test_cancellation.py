@@ -0,0 +1,65 @@
+import threading
+import time
+
+import pytest
+
+import cancellation
+from cancellation import Cancelled, CancelToken
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cancellation, "time", clock)
+    return clock
+
+def test_deadline_cancels_the_token_once_it_passes(clock):
+    token = CancelToken(timeout=10)
+    clock.now += 9.5
+    assert not token.cancelled
+    assert token.remaining() == pytest.approx(0.5)
+    clock.now += 1
+    assert token.cancelled
+    assert token.reason == "Deadline exceeded"
+    assert token.remaining() == 0.0
+    with pytest.raises(Cancelled, match="Deadline exceeded"):
+        token.check()
+
+def test_child_follows_its_parent_and_the_nearest_deadline(clock):
+    parent = CancelToken(timeout=5)
+    child = CancelToken(timeout=60, parent=parent)
+    assert child.remaining() == pytest.approx(5)
+    assert CancelToken(parent=CancelToken()).remaining() is None
+
+    parent.cancel("Batch interrupted")
+    assert child.cancelled
+    assert child.reason == "Batch interrupted"
+
+def test_cancelling_a_child_leaves_the_parent_running():
+    parent = CancelToken()
+    child = CancelToken(parent=parent)
+    child.cancel()
+    assert child.cancelled and not parent.cancelled
+
+def test_sleep_wakes_as_soon_as_the_token_is_cancelled():
+    token = CancelToken()
+    threading.Timer(0.05, token.cancel, ["Cancelled by client"]).start()
+    start = time.monotonic()
+    with pytest.raises(Cancelled, match="Cancelled by client"):
+        token.sleep(10)
+    assert time.monotonic() - start < 1
+
+def test_cancelled_passes_through_broad_exception_handlers():
+    token = CancelToken()
+    token.cancel()
+    with pytest.raises(Cancelled):
+        try:
+            token.check()
+        except Exception:
+            pytest.fail("Cancelled was caught as an Exception")
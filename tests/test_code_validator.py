@@ -0,0 +1,48 @@
+import pytest
+
+import code_validator
+from code_validator import check_html, check_json, check_python, format_diagnostics, validate_file, validate_files
+
+@pytest.fixture
+def no_node(monkeypatch):
+    monkeypatch.setattr(code_validator.shutil, "which", lambda name: None)
+
+def test_python_syntax_errors_are_located():
+    diagnostics = check_python("app.py", "def main():\n    print('hi'\n")
+    assert len(diagnostics) == 1
+    assert diagnostics[0]["file"] == "app.py"
+    assert diagnostics[0]["severity"] == "error"
+    assert diagnostics[0]["message"].startswith("SyntaxError")
+    assert check_python("app.py", "print('hi')\n") == []
+
+def test_html_reports_stray_and_unclosed_tags_but_not_optional_ones():
+    assert check_html("index.html", "<ul><li>one<li>two</ul><p>text<br>") == []
+    messages = [d["message"] for d in check_html("index.html", "<div>\n<span>text</div>\n</section>")]
+    assert messages == ["<span> is never closed", "</section> has no matching <section>"]
+
+def test_json_errors_carry_line_and_column():
+    diagnostic, = check_json("data.json", '{\n  "a": 1,\n}')
+    assert (diagnostic["line"], diagnostic["tool"]) == (3, "json")
+    assert check_json("data.json", '{"a": 1}') == []
+
+def test_fence_language_names_map_to_their_checker():
+    diagnostics, checked = validate_file("code.python", "if True\n")
+    assert checked and diagnostics[0]["tool"] == "python"
+
+def test_files_without_a_checker_are_reported_as_unchecked(no_node):
+    report = validate_files({
+        "main.py": "x = (\n",
+        "app.js": "let x = ;",
+        "README.md": "# Title",
+        "main.go": "package main",
+    })
+    assert report["files"] == 4
+    assert [d["file"] for d in report["errors"]] == ["main.py"]
+    assert report["unchecked"] == ["app.js", "main.go"]
+
+def test_format_diagnostics_caps_the_listing(no_node):
+    report = validate_files({f"broken_{i}.json": "{" for i in range(3)})
+    lines = format_diagnostics(report, limit=2).splitlines()
+    assert len(lines) == 3
+    assert lines[0].startswith("broken_0.json:1:") and "error [json]" in lines[0]
+    assert lines[-1] == "... and 1 more"
@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+import documentation_generator
+from documentation_generator import generate_project_documentation, create_summary_md
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / "app.py").write_text("def main():\n    print('hello')\n")
+    (tmp_path / "util.py").write_text("def add(a, b):\n    return a + b\n")
+    return str(tmp_path)
+
+class FailingStream:
+    """Stands in for stream_gemini: streams the first section, then fails (when fail is set)."""
+
+    def __init__(self, fail):
+        self.fail = fail
+        self.prompts = []
+
+    def __call__(self, prompt, system, model, **kwargs):
+        self.prompts.append(prompt)
+        if self.fail:
+            yield "# Overview\nFirst section.\n"
+            raise RuntimeError("stream dropped")
+        yield "## Usage\nSecond section.\n"
+
+def test_failed_stream_is_resumed_by_the_next_run(project, monkeypatch):
+    output = os.path.join(project, "PROJECT_DOCUMENTATION.md")
+    stream = FailingStream(fail=True)
+    monkeypatch.setattr(documentation_generator, "stream_gemini", stream)
+    generate_project_documentation(project, stream=True)
+    # The fallback document and SUMMARY.md change the project analysis, not the sources
+    create_summary_md(project)
+    assert os.path.exists(output + ".partial")
+
+    stream.fail = False
+    path, documentation = generate_project_documentation(project, stream=True)
+    assert "interrupted part-way through" in stream.prompts[-1]
+    assert documentation == "# Overview\nFirst section.\n## Usage\nSecond section.\n"
+    assert not os.path.exists(output + ".partial")
+    assert not os.path.exists(output + ".partial.key")
+
+def test_partial_is_discarded_when_sources_change(project, monkeypatch):
+    stream = FailingStream(fail=True)
+    monkeypatch.setattr(documentation_generator, "stream_gemini", stream)
+    generate_project_documentation(project, stream=True)
+    with open(os.path.join(project, "app.py"), "a") as f:
+        f.write("\nmain()\n")
+
+    stream.fail = False
+    _, documentation = generate_project_documentation(project, stream=True)
+    assert "interrupted part-way through" not in stream.prompts[-1]
+    assert documentation == "## Usage\nSecond section.\n"
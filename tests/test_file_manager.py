@@ -0,0 +1,60 @@
+import json
+import os
+
+import pytest
+
+import file_manager
+from file_manager import MANIFEST_FILE, safe_relative_path, setup_project, write_project_files
+
+@pytest.fixture
+def projects_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_manager, "PROJECTS_DIR", str(tmp_path))
+    return tmp_path
+
+@pytest.mark.parametrize("filename, expected", [
+    ("src/app.py", "src/app.py"),
+    ("  ./src//app.py ", "src/app.py"),
+    ("/etc/passwd", "etc/passwd"),
+    ("C:\\Users\\me\\app.py", "Users/me/app.py"),
+    ("../../outside.py", "outside.py"),
+    ("src/../../x/app.py", "app.py"),
+    ("..", None),
+    ("./", None),
+])
+def test_safe_relative_path_stays_inside_the_project(filename, expected):
+    assert safe_relative_path(filename) == expected
+
+def test_unchanged_files_are_not_rewritten(tmp_path):
+    written, skipped = write_project_files(str(tmp_path), {"app.py": "print(1)\n", "lib/util.py": "x = 1\n"})
+    assert sorted(written) == ["app.py", "lib/util.py"] and skipped == []
+
+    written, skipped = write_project_files(str(tmp_path), {"app.py": "print(2)\n", "lib/util.py": "x = 1\n"})
+    assert (written, skipped) == (["app.py"], ["lib/util.py"])
+    assert (tmp_path / "app.py").read_text() == "print(2)\n"
+
+    manifest = json.loads((tmp_path / MANIFEST_FILE).read_text())["files"]
+    assert manifest["app.py"]["size"] == len("print(2)\n")
+    assert not [name for _, _, names in os.walk(tmp_path) for name in names if name.endswith(".tmp")]
+
+def test_file_missing_on_disk_is_written_again(tmp_path):
+    write_project_files(str(tmp_path), {"app.py": "print(1)\n"})
+    (tmp_path / "app.py").unlink()
+    assert write_project_files(str(tmp_path), {"app.py": "print(1)\n"}) == (["app.py"], [])
+
+def test_new_projects_appear_complete_under_distinct_names(projects_dir):
+    output = "```python:main.py\nprint('hi')\n```"
+    first, first_files = setup_project("Build a game!", output)
+    second, _ = setup_project("Build a game!", output)
+
+    assert first != second
+    assert os.path.basename(first).startswith("build-a-game_")
+    assert first_files == ["main.py"]
+    assert (projects_dir / os.path.basename(first) / "main.py").read_text() == "print('hi')"
+    assert (projects_dir / os.path.basename(first) / "README.md").exists()
+    assert not [name for name in os.listdir(projects_dir) if name.startswith(".staging-")]
+
+def test_resumed_run_updates_its_project_in_place(projects_dir):
+    project, _ = setup_project("task", "```python:main.py\nprint(1)\n```")
+    same, files = setup_project("task", "```python:main.py\nprint(2)\n```", project_path=project)
+    assert same == project and files == ["main.py"]
+    assert len(os.listdir(projects_dir)) == 1
@@ -0,0 +1,41 @@
+from agents.final_reviewer import parse_final_review
+
+def test_all_sections():
+    text = "=== VERDICT ===\nPASS\n=== CODE ===\n```python\nprint('hi')\n```\n=== SUMMARY ===\nDone.\n"
+    assert parse_final_review(text) == {
+        "verdict": "PASS",
+        "code": "```python\nprint('hi')\n```",
+        "summary": "Done."
+    }
+
+def test_missing_sections_are_empty():
+    sections = parse_final_review("=== VERDICT ===\nNEEDS WORK\n")
+    assert sections == {"verdict": "NEEDS WORK", "code": "", "summary": ""}
+
+def test_no_markers():
+    assert parse_final_review("Looks good to me.") == {"verdict": "", "code": "", "summary": ""}
+
+def test_text_before_first_marker_is_ignored():
+    sections = parse_final_review("Here is my review:\n=== SUMMARY ===\nAll fine.")
+    assert sections["summary"] == "All fine."
+    assert sections["verdict"] == ""
+
+def test_sections_in_any_order_and_case():
+    text = "===summary===\nShort.\n  \n=== Code ===\nx = 1\n=== VERDICT ===  \nPASS"
+    assert parse_final_review(text) == {"verdict": "PASS", "code": "x = 1", "summary": "Short."}
+
+def test_marker_must_be_on_its_own_line():
+    text = "=== CODE ===\nprint('=== SUMMARY ===')\n# === VERDICT === in a comment\n"
+    sections = parse_final_review(text)
+    assert sections["code"] == "print('=== SUMMARY ===')\n# === VERDICT === in a comment"
+    assert sections["summary"] == "" and sections["verdict"] == ""
+
+def test_repeated_marker_keeps_last_section():
+    text = "=== CODE ===\nold\n=== SUMMARY ===\nfirst\n=== CODE ===\nnew\n"
+    sections = parse_final_review(text)
+    assert sections["code"] == "new"
+    assert sections["summary"] == "first"
+
+def test_unknown_marker_is_part_of_the_section():
+    text = "=== CODE ===\na\n=== NOTES ===\nb\n"
+    assert parse_final_review(text)["code"] == "a\n=== NOTES ===\nb"
@@ -0,0 +1,76 @@
+import pytest
+
+from memory import memory
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh memory database for each test."""
+    memory.shutdown()  # The writer thread keeps its connection to the previous database
+    monkeypatch.setattr(memory, "db_path", str(tmp_path / "agent_memory.db"))
+    monkeypatch.setattr(memory._local, "db", None, raising=False)
+    memory._init_db()
+    memory._reset_index()
+    yield memory
+    memory.shutdown()
+    memory._reset_index()
+
+def save(db, *tasks):
+    for task in tasks:
+        db.save_task(task, f"Result of {task}")
+    db.flush()
+
+def test_pages_are_newest_first_and_continue_before_the_last_id(db):
+    save(db, *(f"task {i}" for i in range(5)))
+    first = db.fetch_memory(limit=2)
+    assert [row["task"] for row in first] == ["task 4", "task 3"]
+    second = db.fetch_memory(limit=2, before_id=first[-1]["id"])
+    assert [row["task"] for row in second] == ["task 2", "task 1"]
+    assert second[0]["result"] == "Result of task 2"
+
+def test_compact_keeps_the_newest_tasks_and_their_search_entries(db):
+    save(db, "build a weather app", "build a chess game", "build a todo list")
+    assert db.compact_memory(max_tasks=2) == 1
+    assert [row["task"] for row in db.fetch_recent(10)] == ["build a chess game", "build a todo list"]
+    assert db.search_tasks("weather") == []
+    assert [row["task"] for row in db.search_tasks("chess")] == ["build a chess game"]
+
+def test_compact_without_limits_deletes_nothing(db):
+    save(db, "one", "two")
+    assert db.compact_memory(max_tasks=0, max_age_days=0) == 0
+    assert db.count_tasks() == 2
+
+def test_search_ranks_task_matches_above_result_matches(db):
+    db.save_task("write a poem", "A poem about a calculator")
+    db.save_task("build a calculator", "Done")
+    db.flush()
+    assert [row["task"] for row in db.search_tasks("calculator")] == ["build a calculator", "write a poem"]
+
+def test_search_quotes_terms_unless_raw(db):
+    save(db, "parse C++ AND Rust sources")
+    assert [row["task"] for row in db.search_tasks("C++ AND")] == ["parse C++ AND Rust sources"]
+    assert [row["task"] for row in db.search_tasks("sour*", raw=True)] == ["parse C++ AND Rust sources"]
+
+def test_search_finds_generated_file_names_not_their_code(db):
+    db.save_task("make a site", "Here it is:\n```javascript:widget.js\nconst secretToken = 1;\n```\n")
+    db.flush()
+    assert [row["task"] for row in db.search_tasks("widget.js")] == ["make a site"]
+    assert db.search_tasks("secretToken") == []
+
+def test_repeated_files_are_stored_once(db):
+    code = "```python:app.py\n" + "print('hello')\n" * 100 + "```\n"
+    db.save_task("first", f"Version one\n{code}")
+    db.save_task("second", f"Version two\n{code}")
+    db.flush()
+    stats = db.memory_stats()
+    assert stats["blobs"] == 4  # Two intros, the shared file and the shared trailing newline
+    assert stats["unique_bytes"] < stats["raw_bytes"]
+    assert stats["stored_bytes"] < stats["unique_bytes"]
+    assert db.fetch_recent(1)[0]["result"] == f"Version two\n{code}"
+
+def test_compact_drops_chunks_only_deleted_tasks_used(db):
+    db.save_task("old", "Old prose\n```python:old.py\nold = True\n```\n")
+    db.save_task("new", "New prose\n```python:new.py\nnew = True\n```\n")
+    db.flush()
+    db.compact_memory(max_tasks=1)
+    assert db.memory_stats()["blobs"] == 3  # The new prose, file and trailing newline
+    assert db.fetch_recent(1)[0]["result"] == "New prose\n```python:new.py\nnew = True\n```\n"
@@ -0,0 +1,60 @@
+import re
+
+import pytest
+
+from file_manager import extract_code_blocks
+from output_buffer import OutputBuffer
+
+OUTPUT = "Intro é\n```python:app.py\nprint('ü')\n```\n```javascript:ui.js\nlet x = 1;\n```\n"
+
+def fill(buffer, text=OUTPUT, size=7):
+    for start in range(0, len(text), size):
+        buffer.write(text[start:start + size])
+    return buffer
+
+@pytest.mark.parametrize("spill_chars, spilled", [(0, False), (10, True)])
+def test_content_reads_the_same_in_memory_and_spilled(spill_chars, spilled):
+    buffer = fill(OutputBuffer(spill_chars))
+    assert buffer.spilled is spilled
+    assert len(buffer) == len(OUTPUT)
+    assert buffer.getvalue() == OUTPUT == str(buffer)
+    assert buffer.contains(r"print\('ü'\)")
+    assert not buffer.contains(r"^import", re.MULTILINE)
+    with buffer.view() as view:
+        assert bytes(view) == OUTPUT.encode("utf-8")
+    assert extract_code_blocks(buffer) == extract_code_blocks(OUTPUT)
+    buffer.close()
+
+def test_buffer_spills_once_it_passes_the_limit():
+    buffer = OutputBuffer(spill_chars=20)
+    buffer.write("a" * 20)
+    assert not buffer.spilled
+    buffer.write("b")
+    assert buffer.spilled
+    buffer.write("c")
+    assert buffer.getvalue() == "a" * 20 + "bc"
+
+def test_close_drops_the_content_and_the_spill_file():
+    buffer = fill(OutputBuffer(spill_chars=10))
+    spill_file = buffer.file
+    buffer.close()
+    assert spill_file.closed
+    assert not buffer.spilled
+    assert (len(buffer), buffer.getvalue()) == (0, "")
+
+def test_finished_streams_keep_their_text_and_release_the_buffer():
+    from orchestrator import RunContext
+    from sinks import NullSink
+
+    ctx = RunContext("task", sink=NullSink())
+    assert ctx.stream("plan", iter(["Step 1", " and 2"])) == "Step 1 and 2"
+    assert ctx.outputs["plan"] == "Step 1 and 2"
+
+    def interrupted():
+        yield "partial"
+        raise RuntimeError("stream dropped")
+
+    with pytest.raises(RuntimeError):
+        ctx.stream("step 1", interrupted())
+    assert isinstance(ctx.outputs["step 1"], OutputBuffer)
+    assert ctx.partial_outputs() == {"plan": "Step 1 and 2", "step 1": "partial"}
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+from agents.planner import PlanStream, parse_plan, steps_from_text
+
+def _plan(*steps):
+    return json.dumps({"steps": list(steps)})
+
+def _item(step_id, title, **extra):
+    return {"id": step_id, "title": title, **extra}
+
+def _stream(text, size):
+    """Feed text in chunks of `size` characters; returns the stream and the steps in order."""
+    stream = PlanStream()
+    steps = []
+    for start in range(0, len(text), size):
+        steps.extend(stream.feed(text[start:start + size]))
+    return stream, steps
+
+JSON_PLAN = _plan(
+    _item(1, "Parse {braces} and [brackets]", description='Quotes \\" and \\\\ inside "strings"'),
+    _item(2, "Second step", depends_on=[1], expected_files=["main.py"]),
+    _item(3, "Third } step ]", depends_on=[1, 2])
+)
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, len(JSON_PLAN)])
+def test_stream_json_matches_parse_plan_at_any_chunk_size(size):
+    stream, steps = _stream(JSON_PLAN, size)
+    assert stream.mode == "json"
+    assert steps == parse_plan(JSON_PLAN)
+    assert stream.steps == steps
+
+def test_stream_finalizes_a_step_when_its_object_closes():
+    stream = PlanStream()
+    first_end = JSON_PLAN.index(', {"id": 2')
+    assert stream.feed(JSON_PLAN[:first_end - 1]) == []
+    assert [s["id"] for s in stream.feed(JSON_PLAN[first_end - 1:first_end])] == [1]
+
+@pytest.mark.parametrize("size", [1, 5])
+def test_stream_fenced_json(size):
+    text = "```json\n" + JSON_PLAN + "\n```"
+    stream, steps = _stream(text, size)
+    assert stream.mode == "json"
+    assert steps == parse_plan(text)
+
+def test_stream_nested_objects_are_not_steps():
+    text = _plan(_item(1, "Step one", extra={"id": 9, "title": "nested"}), _item(2, "Step two"))
+    _, steps = _stream(text, 4)
+    assert [s["title"] for s in steps] == ["Step one", "Step two"]
+
+def test_stream_renumbers_dependencies_like_parse_plan():
+    text = _plan(_item(1, "One"), _item(1, "Two"), _item(5, "Three", depends_on=[1]), _item(6, "Four", depends_on=[5]))
+    _, steps = _stream(text, 5)
+    assert steps == parse_plan(text)
+    assert [s["depends_on"] for s in steps] == [[], [], [1], [5]]
+
+@pytest.mark.parametrize("size", [1, 4, 100])
+def test_stream_text_matches_parse_plan(size):
+    text = "Overview\n1. Create the board\n2. Handle input\n## Risks\n1. Lag on slow terminals\n"
+    stream, steps = _stream(text, size)
+    assert stream.mode == "text"
+    assert steps == parse_plan(text)
+
+def test_stream_text_waits_for_the_end_of_line():
+    stream = PlanStream()
+    assert stream.feed("1. Create the bo") == []
+    assert stream.feed("ard\n2. Handle") == [steps_from_text("1. Create the board")[0]]
+    assert stream.feed(" input") == []
+
+def test_stream_steps_are_a_prefix_of_the_full_plan():
+    text = _plan(_item(1, "First step"), _item(2, "Second step"))
+    stream = PlanStream()
+    partial = stream.feed(text[:text.index('{"id": 2')])
+    assert partial == parse_plan(text)[:len(partial)]
+
+def test_stream_prefix_mismatch_when_json_turns_out_invalid():
+    # Streamed steps look final, but the full text is not valid JSON and parse_plan falls back to text
+    text = _plan(_item(1, "First step"), _item(2, "Second step"))[:-2] + "\n1. Other plan entirely"
+    stream, steps = _stream(text, 3)
+    assert [s["title"] for s in steps] == ["First step", "Second step"]
+    assert parse_plan(text)[:len(steps)] != steps
+
+def test_stream_restart_stops_after_text_was_seen():
+    stream = PlanStream()
+    stream.feed('{"steps": [' + json.dumps(_item(1, "First step")))
+    stream.restart(1, Exception("503"))
+    assert stream.stopped
+    assert stream.feed(", " + json.dumps(_item(2, "Second step")) + "]}") == []
+    assert [s["id"] for s in stream.steps] == [1]
+
+def test_stream_restart_before_any_text_keeps_going():
+    stream = PlanStream()
+    stream.restart(1, Exception("503"))
+    assert not stream.stopped
+    _, steps = _stream(JSON_PLAN, 10)
+    assert [s for s in stream.feed(JSON_PLAN)] == steps
@@ -0,0 +1,99 @@
+import json
+
+from agents.planner import parse_plan, steps_from_text
+
+def _plan(*steps):
+    return json.dumps({"steps": list(steps)})
+
+def _item(step_id, title, **extra):
+    return {"id": step_id, "title": title, **extra}
+
+# JSON plans
+
+def test_json_plan_is_normalized():
+    text = _plan(_item(1, "Create models", description="Define the data classes", expected_files=["models.py"]),
+                 _item(2, "Add API", depends_on=[1], complexity="complex"))
+    steps = parse_plan(text)
+    assert steps == [
+        {"id": 1, "title": "Create models", "description": "Define the data classes", "depends_on": [],
+         "complexity": "simple", "expected_files": ["models.py"]},
+        {"id": 2, "title": "Add API", "description": "", "depends_on": [1],
+         "complexity": "complex", "expected_files": []}
+    ]
+
+def test_fenced_json_plan():
+    text = "Here is the plan:\n```json\n" + _plan(_item(1, "Write tests")) + "\n```\nGood luck!"
+    assert [s["title"] for s in parse_plan(text)] == ["Write tests"]
+
+def test_invalid_fields_are_dropped():
+    text = _plan(_item(1, "First", complexity="huge", expected_files=["a.py", "", 3], depends_on="1"),
+                 "not a step",
+                 {"id": 2},
+                 _item(3, "", description="Untitled step"))
+    steps = parse_plan(text)
+    assert [s["id"] for s in steps] == [1, 3]
+    assert steps[0]["complexity"] == "simple"
+    assert steps[0]["expected_files"] == ["a.py"]
+    assert steps[0]["depends_on"] == []
+    assert steps[1]["title"] == "Untitled step"
+
+def test_only_earlier_steps_are_dependencies():
+    steps = parse_plan(_plan(_item(1, "First", depends_on=[1, 2]), _item(2, "Second", depends_on=[1, 5, "1"])))
+    assert steps[0]["depends_on"] == []
+    assert steps[1]["depends_on"] == [1]
+
+def test_duplicate_and_missing_ids_are_renumbered():
+    steps = parse_plan(_plan(_item(1, "One"), _item(1, "Two"), {"title": "Three"}))
+    assert [s["id"] for s in steps] == [1, 2, 3]
+
+def test_dependencies_follow_renumbered_steps():
+    steps = parse_plan(_plan(_item(1, "One"), _item("a", "Two"), _item(2, "Three", depends_on=[1]),
+                             _item(4, "Four", depends_on=[2])))
+    assert [s["id"] for s in steps] == [1, 2, 3, 4]
+    # Plan id 2 is the third step, renumbered to 3 because the second step took 2
+    assert steps[3]["depends_on"] == [3]
+
+def test_dependency_on_a_duplicated_id_means_the_first_step():
+    steps = parse_plan(_plan(_item(1, "One"), _item(2, "Two"), _item(2, "Three", depends_on=[2]),
+                             _item(3, "Four", depends_on=[2, 3])))
+    assert [s["id"] for s in steps] == [1, 2, 3, 4]
+    assert steps[2]["depends_on"] == [2]
+    # Plan id 3 was never used before the fourth step (the renumbered step took 3)
+    assert steps[3]["depends_on"] == [2]
+
+def test_json_without_usable_steps_falls_back_to_text():
+    text = '{"steps": []}\n1. Set up the project\n2. Write the code'
+    assert [s["title"] for s in parse_plan(text)] == ["Set up the project", "Write the code"]
+
+def test_broken_json_falls_back_to_text():
+    text = '{"steps": [{"id": 1, "title": "Set up the project"'
+    steps = parse_plan(text)
+    assert len(steps) == 1 and steps[0]["title"] == text
+
+# Free-text plans
+
+def test_numbered_list():
+    steps = steps_from_text("Plan:\n1. Create the board\n2) Handle input\nStep 3: Draw the snake")
+    assert [s["title"] for s in steps] == ["Create the board", "Handle input", "Draw the snake"]
+    assert [s["id"] for s in steps] == [1, 2, 3]
+    assert all(s["depends_on"] is None for s in steps)
+
+def test_stops_at_a_restarting_list():
+    steps = steps_from_text("1. Create the board\n2. Handle input\n\nChecklist:\n1. Board renders\n2. Keys work")
+    assert [s["title"] for s in steps] == ["Create the board", "Handle input"]
+
+def test_skips_sub_items_and_non_step_sections():
+    text = ("## Risks\n1. Input lag on slow terminals\n"
+            "## Steps\n1. **Create the board**\n   1. Pick a grid size\n2. Handle input\n"
+            "Edge cases:\n3. Snake hits itself\n")
+    assert [s["title"] for s in steps_from_text(text)] == ["Create the board", "Handle input"]
+
+def test_short_items_are_ignored():
+    assert [s["title"] for s in steps_from_text("1. Go\n2. Write the code")] == ["Write the code"]
+
+def test_text_without_list_is_one_step():
+    assert steps_from_text("  Just build it.  ") == [
+        {"id": 1, "title": "Just build it.", "description": "", "depends_on": None,
+         "complexity": "simple", "expected_files": []}
+    ]
+    assert steps_from_text("")[0]["title"] == "Execute the task"
@@ -0,0 +1,30 @@
+import os
+
+from project_runner import discover_targets
+
+def write(root, path, text=""):
+    path = root / path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+def test_tests_in_subfolders_are_found_relative_to_the_root(tmp_path):
+    write(tmp_path, "main.py", "print('hi')\n")
+    write(tmp_path, "src/util.py")
+    write(tmp_path, "tests/test_util.py")
+    names = [name for name, _ in discover_targets(str(tmp_path))]
+    assert names == ["main.py", os.path.join("tests", "test_util.py")]
+
+def test_hidden_and_dependency_folders_are_skipped(tmp_path):
+    write(tmp_path, "app.py")
+    write(tmp_path, ".git/hooks/test_hook.py")
+    write(tmp_path, "venv/lib/test_site.py")
+    write(tmp_path, "node_modules/pkg/test_pkg.py")
+    assert [name for name, _ in discover_targets(str(tmp_path))] == ["app.py"]
+
+def test_shallowest_entry_point_is_run(tmp_path):
+    write(tmp_path, "tools/main.py")
+    write(tmp_path, "helpers.py")
+    write(tmp_path, "app.py")
+    (name, command), = discover_targets(str(tmp_path))
+    assert name == "app.py"
+    assert command[-1] == "app.py"
@@ -0,0 +1,127 @@
+"""
+Token Usage - Per-call prompt/response token accounting for model requests.
+
+The Gemini client reports every completed call here. Calls made while a
+UsageTracker is active on the thread (the orchestrator starts one per task)
+are collected on it, so a run knows what each agent and model consumed.
+When the API returns no usage metadata the counts are estimated locally.
+"""
+
+import threading
+import time
+
+# Rough characters per token for English text and code, used when the API reports no usage
+CHARS_PER_TOKEN = 4
+
+_local = threading.local()
+
+def estimate_tokens(text):
+    """Estimate the token count of text (about CHARS_PER_TOKEN characters per token)."""
+    if not text:
+        return 0
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+def usage_from_metadata(metadata):
+    """Return (prompt_tokens, response_tokens, thought_tokens) from a response's usage_metadata, or None.
+    
+    Thinking tokens are not part of candidates_token_count but do count
+    against max_output_tokens.
+    """
+    if metadata is None:
+        return None
+    prompt_tokens = getattr(metadata, "prompt_token_count", None) or 0
+    response_tokens = getattr(metadata, "candidates_token_count", None) or 0
+    thought_tokens = getattr(metadata, "thoughts_token_count", None) or 0
+    if not prompt_tokens and not response_tokens:
+        return None
+    return prompt_tokens, response_tokens, thought_tokens
+
+class UsageTracker:
+    """Collects the model calls of one task run. Safe to share across threads."""
+
+    def __init__(self, run_id=None, task=None):
+        self.run_id = run_id
+        self.task = task
+        self.records = []
+        self.lock = threading.Lock()
+
+    def add(self, agent, model, prompt_tokens, response_tokens, estimated=False, duration_s=0.0, thought_tokens=0):
+        record = {
+            "agent": agent or "unknown",
+            "model": model,
+            "prompt_tokens": int(prompt_tokens),
+            "response_tokens": int(response_tokens),
+            "thought_tokens": int(thought_tokens),
+            "estimated": bool(estimated),
+            "duration_s": round(duration_s, 3),
+            "created_at": time.time()
+        }
+        with self.lock:
+            self.records.append(record)
+        return record
+
+    def totals(self, key="agent"):
+        """Return {agent or model: {"calls", "prompt_tokens", "response_tokens", "duration_s"}}."""
+        totals = {}
+        with self.lock:
+            records = list(self.records)
+        for record in records:
+            entry = totals.setdefault(record[key], {"calls": 0, "prompt_tokens": 0, "response_tokens": 0,
+                                                    "duration_s": 0.0})
+            entry["calls"] += 1
+            entry["prompt_tokens"] += record["prompt_tokens"]
+            entry["response_tokens"] += record["response_tokens"]
+            entry["duration_s"] = round(entry["duration_s"] + record["duration_s"], 3)
+        return totals
+
+    def summary(self):
+        """Totals for the whole run plus per agent and per model."""
+        by_agent = self.totals("agent")
+        return {
+            "calls": sum(t["calls"] for t in by_agent.values()),
+            "prompt_tokens": sum(t["prompt_tokens"] for t in by_agent.values()),
+            "response_tokens": sum(t["response_tokens"] for t in by_agent.values()),
+            "estimated": any(r["estimated"] for r in self.records),
+            "by_agent": by_agent,
+            "by_model": self.totals("model")
+        }
+
+    def __enter__(self):
+        _stack().append(self)
+        return self
+
+    def __exit__(self, *exc):
+        _stack().pop()
+        return False
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+def current():
+    """The tracker active on this thread, or None."""
+    stack = _stack()
+    return stack[-1] if stack else None
+
+def bind(fn):
+    """Wrap fn so it records into this thread's tracker when run on another thread (e.g. in a pool)."""
+    tracker = current()
+    if tracker is None:
+        return fn
+
+    def wrapper(*args, **kwargs):
+        with tracker:
+            return fn(*args, **kwargs)
+    return wrapper
+
+def record_call(agent, model, prompt_text, response_text, metadata=None, duration_s=0.0):
+    """Record one completed model call on the active tracker, estimating tokens without metadata."""
+    tracker = current()
+    if tracker is None:
+        return None
+    counts = usage_from_metadata(metadata)
+    if counts is None:
+        return tracker.add(agent, model, estimate_tokens(prompt_text), estimate_tokens(response_text),
+                           estimated=True, duration_s=duration_s)
+    return tracker.add(agent, model, counts[0], counts[1], duration_s=duration_s, thought_tokens=counts[2])